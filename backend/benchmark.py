@@ -0,0 +1,405 @@
+"""Offline load-test and latency benchmarks for the congestion API.
+
+Runs entirely in-process and without network access:
+- OpenWeather is replaced by the local weather provider; TomTom ingestion is
+  off unless --ingest replays the recorded fixtures.
+- A synthetic combined.csv-shaped history of the requested size is generated
+  once (as a columnar history, see columnar.py) and reused across runs.
+- Endpoints are driven through an in-process ASGI transport at a fixed
+  concurrency; latency percentiles, throughput and RSS are reported.
+- Micro-benchmarks cover the hot helpers: hourly forecast, store lookups,
+  bottleneck matching and model inference.
+
+Examples:
+
+    python benchmark.py --rows 1k
+    python benchmark.py --rows 1k,100k,10m --requests 2000 --concurrency 32 --output bench.json
+
+With several --rows values, each size runs in its own process so RSS numbers
+are not polluted by the previous run. The JSON output records the git commit so
+runs can be compared across commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+def parse_rows(value):
+    value = value.strip().lower()
+    return SIZES[value] if value in SIZES else int(value)
+
+
+def rss_mb():
+    """Current resident set size, falling back to the peak where /proc is unavailable"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms, dtype=float)
+    if not len(samples):
+        return {}
+    return {
+        "mean": round(float(samples.mean()), 3),
+        "p50": round(float(np.percentile(samples, 50)), 3),
+        "p95": round(float(np.percentile(samples, 95)), 3),
+        "p99": round(float(np.percentile(samples, 99)), 3),
+        "max": round(float(samples.max()), 3),
+    }
+
+
+# --- Synthetic data -------------------------------------------------------------
+
+def synthetic_location_frame(location, rows, start, rng, interval_seconds=180):
+    """`rows` observations for one location, shaped and typed like the real history"""
+    from columnar import SCHEMA
+    from features import calendar_features, flow_features
+
+    timestamps = start + np.arange(rows) * np.timedelta64(interval_seconds, "s")
+    calendar = calendar_features(timestamps)
+
+    # Rush hours are slower, weekends a little faster, plus noise
+    ratio = (0.95 - 0.3 * calendar["is_rush_hour_morning"] - 0.35 * calendar["is_rush_hour_evening"]
+             + 0.05 * calendar["is_weekend"])
+    ratio = np.clip(ratio + rng.normal(0, 0.08, rows), 0.1, 1.0)
+
+    free_flow_speed = int(rng.integers(45, 80))
+    free_flow_travel_time = int(rng.integers(500, 1000))
+    current_speed = np.round(free_flow_speed * ratio)
+    current_travel_time = np.round(free_flow_travel_time / ratio).astype(np.int32)
+
+    frame = pd.DataFrame({
+        "timestamp": timestamps,
+        "collection_location": location,
+        "segment_id": np.nan,
+        "road_name": "Unknown",
+        "current_speed": current_speed,
+        "free_flow_speed": free_flow_speed,
+        "current_travel_time": current_travel_time,
+        "free_flow_travel_time": free_flow_travel_time,
+        "confidence": 1.0,
+        "road_closure": False,
+        **flow_features(current_speed, free_flow_speed, current_travel_time, free_flow_travel_time),
+        "is_lagos_hotspot": False,
+        **calendar,
+        "vehicle_count": np.nan,
+        "predicted_travel_time": np.nan,
+        "avg_speed": np.nan,
+        "avg_timeLoss": np.nan,
+    })
+    return frame.astype({name: dtype for name, dtype in SCHEMA.items() if dtype != "category"})
+
+
+def generate_history(rows, out_dir, locations, seed=0):
+    """Write a synthetic columnar history with `rows` observations spread over `locations`"""
+    from columnar import write_history
+
+    rng = np.random.default_rng(seed)
+    per_location = max(rows // len(locations), 1)
+    # End "now" so the most recent readings look live
+    start = np.datetime64(datetime.now().replace(microsecond=0)) - per_location * np.timedelta64(180, "s")
+
+    groups = (
+        (location, synthetic_location_frame(location, per_location, start, rng))
+        for location in sorted(locations)
+    )
+    categories = {"collection_location": sorted(locations), "road_name": ["Unknown"]}
+    return write_history(groups, out_dir, categories)
+
+
+def ensure_history(rows, data_dir, locations):
+    """Reuse a previously generated history of the same size, else generate one"""
+    path = os.path.join(data_dir, f"synthetic-{rows}")
+    manifest_path = os.path.join(path, "manifest.json")
+    if os.path.exists(manifest_path):
+        return path, 0.0
+    started = time.perf_counter()
+    generate_history(rows, path, locations)
+    return path, round(time.perf_counter() - started, 3)
+
+
+# --- Load test ------------------------------------------------------------------
+
+def random_route(rng, coords):
+    """A short route around a random bottleneck (sometimes nowhere near one)"""
+    if rng.random() < 0.1:
+        lat, lon = 6.60, 3.25
+    else:
+        lat, lon = coords[rng.integers(len(coords))]
+    start = (lat + rng.normal(0, 0.005), lon + rng.normal(0, 0.005))
+    end = (lat + rng.normal(0, 0.005), lon + rng.normal(0, 0.005))
+    return {"start": f"{start[0]:.5f},{start[1]:.5f}", "end": f"{end[0]:.5f},{end[1]:.5f}"}
+
+
+async def drive(client, make_request, total, concurrency):
+    """Send `total` requests with at most `concurrency` in flight"""
+    latencies = []
+    errors = 0
+    sent = 0
+
+    async def worker():
+        nonlocal sent, errors
+        while sent < total:
+            sent += 1
+            method, url, body = make_request()
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1),
+        "latency_ms": percentiles(latencies),
+        "rss_mb": rss_mb(),
+    }
+
+
+def random_alternatives(rng, coords, count):
+    """`count` candidate routes, each a polyline through a few random bottlenecks"""
+    routes = []
+    for index in range(count):
+        stops = np.asarray(coords)[rng.choice(len(coords), size=rng.integers(2, 5), replace=False)]
+        path = stops + rng.normal(0, 0.002, stops.shape)
+        routes.append({"id": f"route_{index}", "path": path.round(5).tolist()})
+    return {"routes": routes}
+
+
+async def run_load_tests(main, requests, concurrency, seed):
+    import httpx
+
+    rng = np.random.default_rng(seed)
+    coords = list(main.BOTTLENECK_COORDS.values())
+    locations = list(main.BOTTLENECK_COORDS)
+    scenarios = {
+        "POST /congestion": lambda: ("POST", "/congestion", random_route(rng, coords)),
+        "POST /congestion/batch (50 routes)": lambda: (
+            "POST", "/congestion/batch", {"routes": [random_route(rng, coords) for _ in range(50)]}
+        ),
+        "POST /routes/rank (30 routes)": lambda: ("POST", "/routes/rank", random_alternatives(rng, coords, 30)),
+        "GET /health": lambda: ("GET", "/health", None),
+        "GET /locations": lambda: ("GET", "/locations", None),
+        "GET /history (hourly)": lambda: (
+            "GET", f"/history/{locations[rng.integers(len(locations))]}?resolution=hourly&heatmap=true", None
+        ),
+    }
+
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, make_request in scenarios.items():
+            # Warm-up so one-off costs (first batch, cache fill) don't skew the numbers
+            await drive(client, make_request, min(concurrency, requests), concurrency)
+            result = await drive(client, make_request, requests, concurrency)
+            results.append({"endpoint": name, **result})
+            print(f"  {name:38s} p50 {result['latency_ms']['p50']:8.2f} ms  "
+                  f"p99 {result['latency_ms']['p99']:8.2f} ms  {result['throughput_rps']:8.1f} req/s  "
+                  f"errors {result['errors']}")
+    return results
+
+
+# --- Micro-benchmarks -------------------------------------------------------------
+
+def time_calls(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+async def time_async_calls(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+async def run_micro_benchmarks(main, iterations):
+    from features import WINDOW_SIZE, feature_matrix
+
+    location = "Falomo_Roundabout"
+    now = datetime.now()
+    routes_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "services", "mockRoutes.json")
+    with open(routes_path) as f:
+        route_path = json.load(f)["routes"][0]["path"]
+
+    window = feature_matrix(main.store.latest_columns(location, WINDOW_SIZE, main.FEATURES))
+    windows_64 = np.stack([window] * 64)
+    weather_forecast = await main.get_weather_forecast()
+
+    benchmarks = {
+        "predict_hourly_congestion": lambda: main.predict_hourly_congestion(location, now),
+        "store.latest(6)": lambda: main.store.latest(location, 6),
+        "bottleneck lookup (midpoint)": lambda: main.match_route_bottlenecks([6.444, 3.427], [6.4445, 3.4273]),
+        f"bottleneck lookup (path, {len(route_path)} points)": lambda: main.match_route_bottlenecks(None, None, route_path),
+        "store.latest_columns + feature_matrix": lambda: feature_matrix(
+            main.store.latest_columns(location, WINDOW_SIZE, main.FEATURES)
+        ),
+        "model inference (batch 1)": lambda: main.inference_engine.predict_batch(window[None]),
+        "model inference (batch 64)": lambda: main.inference_engine.predict_batch(windows_64),
+    }
+
+    results = []
+    for name, fn in benchmarks.items():
+        fn()  # warm-up
+        result = {"name": name, "iterations": iterations, "latency_ms": time_calls(fn, iterations)}
+        results.append(result)
+        print(f"  {name:38s} p50 {result['latency_ms']['p50']:8.3f} ms  p99 {result['latency_ms']['p99']:8.3f} ms")
+
+    # The full per-bottleneck analysis, bypassing the response cache
+    analysis = await time_async_calls(lambda: main.analyze_bottleneck(location, weather_forecast), iterations)
+    results.append({"name": "analyze_bottleneck (uncached)", "iterations": iterations, "latency_ms": analysis})
+    print(f"  {'analyze_bottleneck (uncached)':38s} p50 {analysis['p50']:8.3f} ms  p99 {analysis['p99']:8.3f} ms")
+    return results
+
+
+# --- Runner -----------------------------------------------------------------------
+
+async def run_one(args, rows):
+    # Configure the app for offline use before importing it
+    os.environ["WEATHER_PROVIDER"] = "local"
+    if args.ingest:
+        os.environ["INGEST_SOURCE"] = "fixture"
+        os.environ.setdefault("INGEST_OUTPUT", os.path.join(tempfile.gettempdir(), "bench-ingest.csv"))
+    else:
+        os.environ.pop("INGEST_SOURCE", None)
+    if args.no_response_cache:
+        os.environ["RESPONSE_CACHE_TTL_SECONDS"] = "0"
+    os.environ["MODEL_RUNTIME"] = args.runtime
+    os.environ["RETENTION_DAYS"] = str(args.retention_days)
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    import main
+
+    history_path, generate_seconds = ensure_history(rows, args.data_dir, list(main.BOTTLENECK_COORDS))
+    main.HISTORY_PATH = history_path
+    if args.ingest and os.path.exists(os.environ["INGEST_OUTPUT"]):
+        # Rows from an earlier run would be loaded as history; the sink starts a new file
+        os.remove(os.environ["INGEST_OUTPUT"])
+
+    print(f"📊 {rows:,} rows ({history_path})")
+    rss_before = rss_mb()
+    async with main.lifespan(main.app):
+        started = time.perf_counter()
+        while not main.models_loaded():
+            if main.load_status["state"] == "failed":
+                raise RuntimeError(f"App failed to load: {main.load_status['error']}")
+            await asyncio.sleep(0.05)
+        ready_seconds = round(time.perf_counter() - started, 3)
+        # Retention may have dropped the oldest generated rows at startup
+        rows_held = len(main.store)
+        print(f"  {rows_held:,} rows held after retention ({args.retention_days:g} days; 0 keeps all)")
+
+        print("  Endpoints:")
+        endpoints = await run_load_tests(main, args.requests, args.concurrency, args.seed)
+        print("  Micro-benchmarks:")
+        micro = await run_micro_benchmarks(main, args.iterations)
+
+    return {
+        "rows": rows,
+        "rows_held": rows_held,
+        "history_path": history_path,
+        "generate_seconds": generate_seconds,
+        "ready_seconds": ready_seconds,
+        "load_timings": main.load_status["timings"],
+        "rss_mb": {"before_load": rss_before, "after": rss_mb()},
+        "endpoints": endpoints,
+        "micro": micro,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the congestion API")
+    parser.add_argument("--rows", default="1k", help="Dataset size(s), e.g. 1k,100k,10m or a number")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--iterations", type=int, default=200, help="Iterations per micro-benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "lagos-traffic-bench"),
+                        help="Where synthetic histories are generated and reused")
+    parser.add_argument("--ingest", action="store_true", help="Replay recorded TomTom fixtures during the run")
+    parser.add_argument("--no-response-cache", action="store_true", help="Disable the response cache")
+    parser.add_argument("--runtime", default=os.getenv("MODEL_RUNTIME", "keras"),
+                        help="Model runtime: keras, numpy, tflite or tflite_quantized")
+    parser.add_argument("--retention-days", type=float, default=0,
+                        help="RETENTION_DAYS for the run (default 0: every generated row stays, so sizes compare)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    sizes = [parse_rows(value) for value in args.rows.split(",")]
+    meta = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "iterations": args.iterations,
+        "response_cache": not args.no_response_cache,
+        "runtime": args.runtime,
+        "ingest": args.ingest,
+        "retention_days": args.retention_days,
+    }
+
+    if len(sizes) == 1:
+        runs = [asyncio.run(run_one(args, sizes[0]))]
+    else:
+        # One process per size so each starts from a clean heap
+        runs = []
+        for rows in sizes:
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+                child_output = f.name
+            command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--rows", str(rows), "--output", child_output]
+            subprocess.run(command, check=True)
+            with open(child_output) as f:
+                runs.extend(json.load(f)["runs"])
+            os.remove(child_output)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": meta, "runs": runs}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Server-side response cache.
+
+`ResponseCache` is an LRU cache with a per-entry TTL. Congestion analyses are
+cached under (bottleneck, data version, weather version, hour bucket), so an
+entry is reused until its TTL runs out, the hour rolls over, or new data or
+weather arrives for it. Ingestion also drops a bottleneck's entries
+explicitly via `invalidate`.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """LRU cache with per-entry expiry"""
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def remaining_ttl(self, key):
+        """Seconds until the entry expires (0 if absent)"""
+        entry = self._entries.get(key)
+        return max(entry[0] - time.monotonic(), 0) if entry else 0
+
+    def invalidate(self, prefix):
+        """Drop every entry whose key starts with `prefix` (e.g. a bottleneck name)"""
+        for key in [key for key in self._entries if key[0] == prefix]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+
+def etag_for(body):
+    """Strong ETag for a response body (bytes or str)"""
+    if isinstance(body, str):
+        body = body.encode()
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
@@ -0,0 +1,260 @@
+"""Columnar on-disk format for the traffic history.
+
+Layout of a history directory:
+
+    manifest.json               schema, categories, per-location row counts,
+                                per-day row ranges and the CSV sources converted
+    <location>/<column>.npy     one NumPy array per column, sorted by timestamp
+
+Every column has an explicit compact dtype (see SCHEMA). Text columns are
+stored as int16 codes into a category list kept in the manifest. Each
+location's rows are contiguous and sorted by time, so a day is a row range
+(recorded in the manifest) rather than a separate file. This keeps a whole
+location in one memory map.
+
+`load_history` opens the arrays with mmap_mode="r". The OS page cache then
+holds one copy of the history, shared by every worker process that maps it.
+Rows appended to the source CSVs after conversion are read from the recorded
+byte offset at load time, so the history stays current between conversions;
+so are the rows of any other CSV passed in (e.g. the one ingestion writes).
+
+Convert the existing CSVs with:
+
+    python columnar.py combined.csv --out history
+"""
+import argparse
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from features import derive_features
+from store import LocationSeries, TrafficStore, TIMESTAMP, LOCATION
+
+MANIFEST = "manifest.json"
+# Where ingestion appends new observations by default, inside the history directory
+INGESTED = "ingested.csv"
+FORMAT_VERSION = 1
+
+SCHEMA = {
+    "timestamp": "datetime64[ns]",
+    "collection_location": "category",
+    "segment_id": "float32",
+    "road_name": "category",
+    "current_speed": "float32",
+    "free_flow_speed": "int16",
+    "current_travel_time": "int32",
+    "free_flow_travel_time": "int32",
+    "confidence": "float32",
+    "road_closure": "bool",
+    "congestion_ratio": "float32",
+    "delay_seconds": "float32",
+    "is_lagos_hotspot": "bool",
+    "hour": "int8",
+    "day_of_week": "int8",
+    "is_weekend": "int8",
+    "is_rush_hour_morning": "int8",
+    "is_rush_hour_evening": "int8",
+    "is_rush_hour": "int8",
+    "is_friday_evening": "int8",
+    "is_monday_morning": "int8",
+    "is_rain_season": "int8",
+    "vehicle_count": "float32",
+    "predicted_travel_time": "float32",
+    "avg_speed": "float32",
+    "avg_timeLoss": "float32",
+}
+
+
+def apply_schema(frame):
+    """Cast a raw traffic frame to SCHEMA, adding any missing columns"""
+    frame = frame.copy()
+    for name, dtype in SCHEMA.items():
+        if name not in frame:
+            frame[name] = np.nan if dtype not in ("bool", "category") else None
+        column = frame[name]
+        if dtype == "datetime64[ns]":
+            frame[name] = pd.to_datetime(column)
+        elif dtype == "category":
+            frame[name] = column.astype("category")
+        elif dtype == "bool":
+            # The CSVs hold True/False strings with blanks for unknown
+            frame[name] = column.map(lambda v: str(v).strip().lower() == "true").astype(bool)
+        elif dtype.startswith("int"):
+            frame[name] = pd.to_numeric(column, errors="coerce").fillna(0).astype(dtype)
+        else:
+            frame[name] = pd.to_numeric(column, errors="coerce").astype(dtype)
+    return frame[list(SCHEMA)]
+
+
+def read_traffic_csv(path, offset=0, header=None):
+    """Read a traffic CSV (optionally only the bytes after `offset`) with SCHEMA dtypes.
+
+    Derived columns are recomputed with features.py rather than trusted from the file.
+    """
+    if offset == 0:
+        return apply_schema(derive_features(pd.read_csv(path)))
+    with open(path, "rb") as f:
+        f.seek(offset)
+        tail = f.read()
+    return _parse_rows(tail, header)
+
+
+def read_complete_rows(path):
+    """Every complete row of a CSV that may still be appended to, and the offset after them"""
+    with open(path, "rb") as f:
+        header_line = f.readline()
+    return read_appended_rows(path, len(header_line), header_line.decode().strip().split(","))
+
+
+def read_appended_rows(path, offset, header):
+    """Complete rows appended to a CSV after byte `offset`, and the offset after them.
+
+    A row still being written (no newline yet) is left for the next call.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        tail = f.read()
+    end = tail.rfind(b"\n") + 1
+    return _parse_rows(tail[:end], header), offset + end
+
+
+def _parse_rows(data, header):
+    if not data.strip():
+        raw = pd.DataFrame(columns=header)
+    else:
+        raw = pd.read_csv(io.BytesIO(data), header=None, names=header)
+    return apply_schema(derive_features(raw))
+
+
+def convert_csv(csv_paths, out_dir):
+    """Convert traffic CSVs into a columnar history directory"""
+    sources = {}
+    frames = []
+    for path in csv_paths:
+        frames.append(read_traffic_csv(path))
+        with open(path, "rb") as f:
+            header = f.readline().decode().strip().split(",")
+        sources[os.path.abspath(path)] = {"offset": os.path.getsize(path), "header": header}
+
+    frame = apply_schema(pd.concat(frames, ignore_index=True))
+    frame = frame.sort_values([LOCATION, TIMESTAMP], kind="stable")
+
+    categories = {
+        name: [str(value) for value in frame[name].cat.categories]
+        for name, dtype in SCHEMA.items() if dtype == "category"
+    }
+    groups = frame.groupby(LOCATION, sort=True, observed=True)
+    return write_history(groups, out_dir, categories, sources)
+
+
+def write_history(groups, out_dir, categories, sources=None):
+    """Write (location, frame) pairs as a columnar history directory.
+
+    Each frame must already follow SCHEMA and be sorted by timestamp, with its
+    categorical columns using `categories`. Frames are written one at a time,
+    so a history can be built without holding all of it in memory.
+    """
+    partitions = {}
+    os.makedirs(out_dir, exist_ok=True)
+
+    for location, group in groups:
+        location_dir = os.path.join(out_dir, location)
+        os.makedirs(location_dir, exist_ok=True)
+        for name, dtype in SCHEMA.items():
+            if name == LOCATION:
+                continue  # implied by the partition
+            if dtype == "category":
+                values = pd.Categorical(group[name], categories=categories[name]).codes.astype(np.int16)
+            else:
+                values = group[name].to_numpy(dtype=dtype)
+            np.save(os.path.join(location_dir, f"{name}.npy"), values)
+
+        days = group[TIMESTAMP].dt.strftime("%Y-%m-%d").to_numpy()
+        day_names, starts = np.unique(days, return_index=True)
+        stops = np.append(starts[1:], len(days))
+        partitions[location] = {
+            "rows": len(group),
+            "days": {day: [int(start), int(stop)] for day, start, stop in zip(day_names, starts, stops)},
+        }
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "schema": SCHEMA,
+        "categories": categories,
+        "partitions": partitions,
+        "sources": sources or {},
+    }
+    # Write the manifest last and atomically: readers never see a half-written history
+    tmp_path = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+def has_history(path):
+    return os.path.exists(os.path.join(path, MANIFEST))
+
+
+def load_history(path, include_new_rows=True, csv_paths=()):
+    """Open a columnar history as a TrafficStore backed by read-only memory maps.
+
+    `csv_paths` are read in full on top of it, unless they were converted.
+    The store's `offsets` record how far each CSV was read.
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    series = {}
+    for location, partition in manifest["partitions"].items():
+        location_dir = os.path.join(path, location)
+        columns = {}
+        for name, dtype in manifest["schema"].items():
+            if name == LOCATION:
+                # Constant within a partition: a zero-stride view, no storage at all
+                code = manifest["categories"][LOCATION].index(location)
+                columns[name] = np.broadcast_to(np.int16(code), (partition["rows"],))
+            else:
+                columns[name] = np.load(os.path.join(location_dir, f"{name}.npy"), mmap_mode="r")
+        categories = {
+            name: manifest["categories"][name]
+            for name, dtype in manifest["schema"].items() if dtype == "category"
+        }
+        series[location] = LocationSeries(location, columns, categories)
+    store = TrafficStore(series)
+
+    if include_new_rows:
+        # Rows appended to the CSVs (e.g. by ingestion) since the conversion
+        sources = [(source, info["offset"], info["header"]) for source, info in manifest["sources"].items()]
+        sources += [
+            (os.path.abspath(source), None, None) for source in csv_paths
+            if os.path.abspath(source) not in manifest["sources"]
+        ]
+        for source, offset, header in sources:
+            if not os.path.exists(source):
+                continue
+            if offset is None:
+                new_rows, store.offsets[source] = read_complete_rows(source)
+            else:
+                new_rows, store.offsets[source] = read_appended_rows(source, offset, header)
+            for row in new_rows.to_dict("records"):
+                store.append(row)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert traffic CSVs to the columnar history format")
+    parser.add_argument("csv", nargs="+", help="CSV files with combined.csv columns")
+    parser.add_argument("--out", default="history", help="Output directory")
+    args = parser.parse_args()
+
+    manifest = convert_csv(args.csv, args.out)
+    rows = sum(partition["rows"] for partition in manifest["partitions"].values())
+    print(f"✅ Wrote {rows} rows for {len(manifest['partitions'])} locations to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Feature engineering shared by ingestion, serving and training.
+
+Every derived column of the traffic history is defined here once, as
+vectorised NumPy/pandas code over whole columns:
+
+- calendar features from the timestamp (hour, day of week, weekend, rush
+  hours, Friday evening, Monday morning, rain season)
+- flow features from the TomTom readings (congestion_ratio, delay_seconds)
+
+The same functions derive a whole CSV at load time (`derive_features`), a
+single freshly ingested observation (`derive_row`), the LSTM input window for
+a request (`feature_matrix`) and the training set (`training_windows`), so
+the model never sees features computed two different ways.
+"""
+import numpy as np
+import pandas as pd
+
+TIMESTAMP = "timestamp"
+
+# Model inputs, in the order the scalers and the LSTM were fitted on
+FEATURES = [
+    "current_speed", "free_flow_speed", "delay_seconds",
+    "hour", "day_of_week", "is_rush_hour", "is_weekend", "is_lagos_hotspot"
+]
+# Observations per model input window
+WINDOW_SIZE = 6
+TARGET = "current_travel_time"
+
+MORNING_RUSH_HOURS = (6, 10)   # inclusive
+EVENING_RUSH_HOURS = (17, 21)
+RAIN_SEASON_MONTHS = (4, 10)
+
+CALENDAR_COLUMNS = [
+    "hour", "day_of_week", "is_weekend", "is_rush_hour_morning", "is_rush_hour_evening",
+    "is_rush_hour", "is_friday_evening", "is_monday_morning", "is_rain_season",
+]
+FLOW_COLUMNS = ["congestion_ratio", "delay_seconds"]
+
+
+def _numeric(values):
+    """float64 array from numeric, boolean or text values (unparseable -> NaN)"""
+    values = np.asarray(values)
+    if values.dtype.kind in "biuf":
+        return values.astype(np.float64)
+    return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64)
+
+
+def calendar_features(timestamps):
+    """{column: int8 array} of calendar features for an array of timestamps"""
+    index = pd.DatetimeIndex(timestamps)
+    hour = index.hour.to_numpy()
+    day_of_week = index.dayofweek.to_numpy()
+    month = index.month.to_numpy()
+
+    morning = (hour >= MORNING_RUSH_HOURS[0]) & (hour <= MORNING_RUSH_HOURS[1])
+    evening = (hour >= EVENING_RUSH_HOURS[0]) & (hour <= EVENING_RUSH_HOURS[1])
+    features = {
+        "hour": hour,
+        "day_of_week": day_of_week,
+        "is_weekend": day_of_week >= 5,
+        "is_rush_hour_morning": morning,
+        "is_rush_hour_evening": evening,
+        "is_rush_hour": morning | evening,
+        "is_friday_evening": (day_of_week == 4) & evening,
+        "is_monday_morning": (day_of_week == 0) & morning,
+        "is_rain_season": (month >= RAIN_SEASON_MONTHS[0]) & (month <= RAIN_SEASON_MONTHS[1]),
+    }
+    return {name: values.astype(np.int8) for name, values in features.items()}
+
+
+def flow_features(current_speed, free_flow_speed, current_travel_time, free_flow_travel_time):
+    """{column: float64 array} of congestion_ratio and delay_seconds.
+
+    A missing speed reading means the segment was at free flow: ratio 1.0 and
+    no delay figure (NaN), as in the collected history.
+    """
+    current_speed = _numeric(current_speed)
+    free_flow_speed = _numeric(free_flow_speed)
+    delay = np.maximum(_numeric(current_travel_time) - _numeric(free_flow_travel_time), 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(free_flow_speed > 0, current_speed / free_flow_speed, 1.0)
+    missing = np.isnan(current_speed)
+    return {
+        "congestion_ratio": np.where(missing, 1.0, ratio),
+        "delay_seconds": np.where(missing, np.nan, delay),
+    }
+
+
+def derive_features(frame):
+    """Copy of a raw observations frame with every derived column (re)computed"""
+    frame = frame.copy()
+    for name, values in calendar_features(frame[TIMESTAMP]).items():
+        frame[name] = values
+    flow = flow_features(
+        frame["current_speed"], frame["free_flow_speed"],
+        frame["current_travel_time"], frame["free_flow_travel_time"],
+    )
+    for name, values in flow.items():
+        frame[name] = values
+    return frame
+
+
+def derive_row(row):
+    """`row` (a dict) with the derived columns added, using the same code as derive_features"""
+    derived = dict(row)
+    calendar = calendar_features([row[TIMESTAMP]])
+    flow = flow_features(
+        [row["current_speed"]], [row["free_flow_speed"]],
+        [row["current_travel_time"]], [row["free_flow_travel_time"]],
+    )
+    for name, values in list(calendar.items()) + list(flow.items()):
+        value = values[0].item()
+        derived[name] = None if isinstance(value, float) and np.isnan(value) else value
+    return derived
+
+
+def feature_matrix(columns, features=FEATURES):
+    """(rows, len(features)) float32 model input from a DataFrame or {column: array}.
+
+    Rows without a speed reading were collected at free flow; any other
+    missing value becomes 0, as in training.
+    """
+    rows = len(columns[next(iter(columns))]) if len(columns) else 0
+    matrix = np.zeros((rows, len(features)), dtype=np.float64)
+    for i, name in enumerate(features):
+        if name in columns:
+            matrix[:, i] = _numeric(columns[name])
+
+    if "current_speed" in features and "free_flow_speed" in features and "free_flow_speed" in columns:
+        speed = features.index("current_speed")
+        free_flow = matrix[:, features.index("free_flow_speed")]
+        matrix[:, speed] = np.where(np.isnan(matrix[:, speed]), free_flow, matrix[:, speed])
+    return np.nan_to_num(matrix, nan=0.0).astype(np.float32)
+
+
+def sliding_windows(matrix, window=WINDOW_SIZE):
+    """Every run of `window` consecutive rows: (rows - window + 1, window, n_features) view"""
+    return np.lib.stride_tricks.sliding_window_view(matrix, window, axis=0).transpose(0, 2, 1)
+
+
+def training_windows(columns, features=FEATURES, window=WINDOW_SIZE, target=TARGET):
+    """(X, y, positions) for one location's time-sorted rows.
+
+    Each window of `window` rows is paired with the target of the row after
+    it; `positions` are those target rows' indices (e.g. to split by time).
+    """
+    matrix = feature_matrix(columns, features)
+    targets = _numeric(columns[target])
+    if len(matrix) <= window:
+        return np.empty((0, window, len(features)), dtype=np.float32), np.empty(0), np.empty(0, dtype=np.intp)
+    X = sliding_windows(matrix[:-1], window)
+    y = targets[window:]
+    positions = np.flatnonzero(~np.isnan(y))
+    return np.ascontiguousarray(X[positions]), y[positions], positions + window
@@ -0,0 +1,129 @@
+"""Precomputed congestion forecasts with push updates.
+
+The forecast space is small (a handful of bottlenecks x up to 24 hours), so
+instead of computing forecasts per request, `ForecastScheduler` keeps the
+latest forecast for every location and recomputes one only when its inputs
+change:
+- new observations or weather arrive (`mark_dirty`), or
+- the clock crosses a step boundary (e.g. every 15 minutes), so the horizon
+  moves forward.
+
+Each forecast is stamped with the inputs' version (`version(location)`, e.g.
+data and weather versions); `get` only returns a forecast that is still
+current. Subscribers receive every recomputed forecast on a queue, which
+backs the server-sent events endpoint.
+"""
+import asyncio
+import time
+from datetime import datetime
+
+
+class ForecastScheduler:
+    """Background recomputation of per-location forecasts"""
+
+    def __init__(self, compute, locations, version, step_minutes=15, debounce=0.5):
+        """`compute(location, now)` is a coroutine returning the forecast;
+        `version(location)` returns a value that changes whenever its inputs do."""
+        self.compute = compute
+        self.locations = list(locations)
+        self.version = version
+        self.step = step_minutes * 60
+        self.debounce = debounce
+        self.computed = 0
+        self._forecasts = {}  # location -> (forecast, version, slot)
+        self._subscribers = set()
+        self._wakeup = None
+        self._worker = None
+
+    def _slot(self, now=None):
+        timestamp = (now or datetime.now()).timestamp()
+        return int(timestamp // self.step)
+
+    def _is_current(self, location, entry):
+        _, version, slot = entry
+        return version == self.version(location) and slot == self._slot()
+
+    def get(self, location):
+        """The latest forecast for a location, or None if missing or out of date"""
+        entry = self._forecasts.get(location)
+        if entry is None or not self._is_current(location, entry):
+            self.mark_dirty()
+            return None
+        return entry[0]
+
+    def latest(self):
+        """{location: forecast} of the most recent forecasts, current or not"""
+        return {location: entry[0] for location, entry in self._forecasts.items()}
+
+    def mark_dirty(self):
+        """Wake the worker; it recomputes whichever forecasts are out of date"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def subscribe(self, max_pending=100):
+        """A queue that receives (location, forecast) for every recomputed forecast, then None when closed"""
+        queue = asyncio.Queue(maxsize=max_pending)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self, location, forecast):
+        for queue in self._subscribers:
+            if queue.full():
+                # A slow consumer only needs the newest forecasts
+                queue.get_nowait()
+            queue.put_nowait((location, forecast))
+
+    def close_subscribers(self):
+        """End every subscription: each queue receives None (e.g. on shutdown)"""
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+    async def refresh(self):
+        """Recompute every location whose forecast is missing or out of date"""
+        now = datetime.now()
+        slot = self._slot(now)
+        for location in self.locations:
+            entry = self._forecasts.get(location)
+            if entry is not None and self._is_current(location, entry):
+                continue
+            version = self.version(location)
+            try:
+                forecast = await self.compute(location, now)
+            except Exception as e:
+                print(f"⚠️ Forecast for {location} failed: {e}")
+                continue
+            self._forecasts[location] = (forecast, version, slot)
+            self.computed += 1
+            self._publish(location, forecast)
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            # Sleep until inputs change or the next step boundary
+            next_boundary = (self._slot() + 1) * self.step - time.time()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(next_boundary, 0) + 0.01)
+                # Coalesce bursts, e.g. one ingestion poll touching every bottleneck
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if self._worker is None:
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
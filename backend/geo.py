@@ -0,0 +1,176 @@
+"""Geospatial helpers for matching routes to monitored locations.
+
+`SpatialIndex` buckets points (bottlenecks, and later road segments) into a
+uniform latitude/longitude grid. A radius query only looks at the cells the
+circle overlaps, so lookups stay cheap as the number of monitored points grows.
+All distances are great-circle (haversine) kilometres.
+"""
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; works elementwise on arrays (with broadcasting)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def densify_path(path, max_step_km):
+    """Insert points along a [[lat, lon], ...] polyline so no step exceeds max_step_km"""
+    return densify_paths([path], max_step_km)[0]
+
+
+def _stack_paths(paths):
+    """All points of several polylines, contiguous per path; (points, sizes, last point of its path mask)"""
+    arrays = [np.asarray(path, dtype=float).reshape(-1, 2) for path in paths]
+    sizes = np.array([len(points) for points in arrays], dtype=int)
+    points = np.vstack(arrays) if sizes.sum() else np.empty((0, 2))
+    is_last = np.zeros(len(points), dtype=bool)
+    is_last[(np.cumsum(sizes) - 1)[sizes > 0]] = True
+    return points, sizes, is_last
+
+
+def densify_paths(paths, max_step_km):
+    """`densify_path` for many polylines at once: (points, sizes), each path's points contiguous"""
+    points, sizes, is_last = _stack_paths(paths)
+    if not len(points):
+        return points, sizes
+    # Each point emits itself plus the points inserted before the next one on its path
+    steps = haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+    pieces = np.ones(len(points), dtype=int)
+    pieces[:-1] = np.where(is_last[:-1], 1, np.maximum(np.ceil(steps / max_step_km).astype(int), 1))
+
+    # For each point, fractions 0, 1/k, ..., (k-1)/k of the way to the next
+    source = np.repeat(np.arange(len(pieces)), pieces)
+    offsets = np.arange(len(source)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    fractions = (offsets / pieces[source])[:, None]
+    following = np.minimum(source + 1, len(points) - 1)
+    dense = points[source] + fractions * (points[following] - points[source])
+
+    starts = (np.cumsum(sizes) - sizes)[sizes > 0]
+    dense_sizes = np.zeros(len(sizes), dtype=int)
+    dense_sizes[sizes > 0] = np.add.reduceat(pieces, starts)
+    return dense, dense_sizes
+
+
+def path_lengths_km(paths):
+    """Length of each [[lat, lon], ...] polyline"""
+    points, sizes, is_last = _stack_paths(paths)
+    if len(points) < 2:
+        return np.zeros(len(sizes))
+    steps = haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+    path = np.repeat(np.arange(len(sizes)), sizes)[:-1]
+    return np.bincount(path, weights=np.where(is_last[:-1], 0.0, steps), minlength=len(sizes))
+
+
+class SpatialIndex:
+    """Grid index over named points"""
+
+    def __init__(self, points, cell_size_deg=0.05):
+        """`points` maps name -> [lat, lon]"""
+        self.names = list(points)
+        self.coords = np.array([points[name] for name in self.names], dtype=float).reshape(-1, 2)
+        self.cell_size = cell_size_deg
+        self._cells = {}
+        for i, key in enumerate(map(tuple, self._cell_keys(self.coords))):
+            self._cells.setdefault(key, []).append(i)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _cell_keys(self, coords):
+        return np.floor(np.asarray(coords, dtype=float) / self.cell_size).astype(int)
+
+    def _candidates(self, coords, radius_km):
+        """Indices of points in any cell within radius_km of any of the coords"""
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        max_lat = np.abs(coords[:, 0]).max()
+        lat_cells = math.ceil(radius_km / KM_PER_DEGREE_LAT / self.cell_size)
+        lon_cells = math.ceil(
+            radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(max_lat)), 0.01)) / self.cell_size
+        )
+
+        keys = set(map(tuple, self._cell_keys(coords).tolist()))
+        candidates = set()
+        for lat_key, lon_key in keys:
+            for dlat in range(-lat_cells, lat_cells + 1):
+                for dlon in range(-lon_cells, lon_cells + 1):
+                    candidates.update(self._cells.get((lat_key + dlat, lon_key + dlon), ()))
+        return np.array(sorted(candidates), dtype=int)
+
+    def query_radius(self, lat, lon, radius_km):
+        """[(name, distance_km)] within radius_km of a point, nearest first"""
+        candidates = self._candidates([[lat, lon]], radius_km)
+        if not len(candidates):
+            return []
+        distances = haversine_km(lat, lon, self.coords[candidates, 0], self.coords[candidates, 1])
+        order = np.argsort(distances, kind="stable")
+        return [
+            (self.names[candidates[i]], float(distances[i]))
+            for i in order if distances[i] <= radius_km
+        ]
+
+    def nearest(self, lat, lon, max_km):
+        """(name, distance_km) of the nearest point within max_km, or (None, inf)"""
+        matches = self.query_radius(lat, lon, max_km)
+        return matches[0] if matches else (None, float("inf"))
+
+    def match_path(self, path, radius_km):
+        """Points the polyline passes within radius_km of, in the order they are reached.
+
+        Returns [(name, distance_km, along_km)]: the closest approach to the point
+        and how far along the route that approach happens.
+        """
+        _, matched, distances, along = self.match_paths([path], radius_km)
+        return [
+            (self.names[i], float(distance), float(along_km))
+            for i, distance, along_km in zip(matched, distances, along)
+        ]
+
+    def match_paths(self, paths, radius_km):
+        """`match_path` for many polylines at once, as flat arrays.
+
+        Returns (route, point, distance_km, along_km) with one entry per route
+        passing within radius_km of a point, ordered by route and then by how far
+        along it the point is reached; `route` indexes `paths`, `point` `names`.
+        """
+        nothing = (np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0), np.empty(0))
+        points, sizes = densify_paths(paths, max_step_km=max(radius_km / 2, 0.05))
+        if not len(points):
+            return nothing
+        candidates = self._candidates(points, radius_km)
+        if not len(candidates):
+            return nothing
+
+        # (all path points x candidates) distance matrix
+        distances = haversine_km(
+            points[:, 0][:, None], points[:, 1][:, None],
+            self.coords[candidates, 0][None, :], self.coords[candidates, 1][None, :],
+        )
+
+        # Each route's points are one contiguous run of rows
+        routes = np.flatnonzero(sizes)
+        starts = (np.cumsum(sizes) - sizes)[routes]
+        run = np.repeat(np.arange(len(routes)), sizes[routes])
+        steps = haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+        along = np.concatenate([[0.0], np.cumsum(steps)])
+        along -= along[starts][run]
+
+        # Closest approach per (route, candidate), at the first point reaching it
+        closest_distance = np.minimum.reduceat(distances, starts, axis=0)
+        rows = np.arange(len(points))[:, None]
+        closest_point = np.minimum.reduceat(
+            np.where(distances == closest_distance[run], rows, len(points)), starts, axis=0
+        )
+
+        route, candidate = np.nonzero(closest_distance <= radius_km)
+        point = closest_point[route, candidate]
+        order = np.lexsort((point, route))
+        route, candidate, point = route[order], candidate[order], point[order]
+        return routes[route], candidates[candidate], closest_distance[route, candidate], along[point]
+
@@ -0,0 +1,135 @@
+"""LSTM inference for the congestion API.
+
+The model takes a window of the last `WINDOW_SIZE` observations of `FEATURES`
+for one bottleneck (scaled with `feature_scaler`) and predicts the next
+`current_travel_time` (scaled with `target_scaler`).
+
+Feature engineering lives in features.py; callers pass windows built with
+`features.feature_matrix`.
+
+The model is any predictor with `predict_on_batch` (the Keras model or one
+of the lighter runtimes in runtimes.py).
+
+`InferenceEngine` keeps TensorFlow off the event loop: requests are queued,
+collected for a few milliseconds into a micro-batch, and run as one
+`predict_on_batch` call on a dedicated worker thread. Per-call TF overhead is
+then paid once per batch instead of once per request.
+
+The model and its scalers are held as one bundle that `swap` replaces in a
+single assignment: each batch runs entirely on one bundle, so a model can be
+replaced while requests are in flight.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def import_keras_loader():
+    """Import TensorFlow/Keras and return `load_model`.
+
+    Deferred to call time: importing TensorFlow takes seconds and hundreds of
+    MB, and processes that never load the model shouldn't pay for it.
+    """
+    from tensorflow.keras.models import load_model
+    return load_model
+
+
+class InferenceEngine:
+    """Micro-batching, thread-offloaded wrapper around the model"""
+
+    def __init__(self, model, feature_scaler, target_scaler, features,
+                 max_batch_size=64, max_wait_ms=5, on_batch=None, version=None):
+        self.bundle = (model, feature_scaler, target_scaler)
+        self.version = version
+        self.features = list(features)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.on_batch = on_batch  # called with (batch size, seconds) after each batch
+        self._queue = None
+        self._worker = None
+        # One thread: batches run sequentially and TF never competes with itself
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lstm")
+
+    def swap(self, model, feature_scaler, target_scaler, version=None):
+        """Serve another model from the next batch on; a running batch finishes on the old one"""
+        self.bundle = (model, feature_scaler, target_scaler)
+        self.version = version
+
+    def predict_batch(self, windows):
+        """Predict travel times for a stacked (batch, WINDOW_SIZE, n_features) array"""
+        model, feature_scaler, target_scaler = self.bundle
+        batch_size, steps, n_features = windows.shape
+
+        # The scalers were fitted on DataFrames; keep the column names to match
+        flat = pd.DataFrame(windows.reshape(-1, n_features), columns=self.features)
+        scaled = feature_scaler.transform(flat).reshape(batch_size, steps, n_features)
+
+        predictions = model.predict_on_batch(scaled.astype(np.float32))
+        predictions = np.asarray(predictions).reshape(-1, 1)
+        return target_scaler.inverse_transform(predictions).ravel()
+
+    async def predict(self, window):
+        """Queue one window and wait for its batched prediction"""
+        if self._queue is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((window, future))
+        return await future
+
+    def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.ensure_future(self._batch_loop())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)
+
+    async def _collect_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            # Skip requests whose callers have gone away
+            batch = [(window, future) for window, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            windows = np.stack([window for window, _ in batch])
+            started = time.perf_counter()
+            try:
+                predictions = await loop.run_in_executor(self._executor, self.predict_batch, windows)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            if self.on_batch is not None:
+                self.on_batch(len(batch), time.perf_counter() - started)
+
+            for (_, future), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(float(prediction))
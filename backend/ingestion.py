@@ -0,0 +1,316 @@
+"""Live TomTom flow ingestion.
+
+`FlowIngestor` polls TomTom's flowSegmentData endpoint for every bottleneck
+on a fixed interval, derives the same columns as combined.csv and hands each
+observation to a callback (which appends to the in-memory store) and to a
+`CsvSink` (which appends to disk). The CSV is never re-read by the process
+that writes it; other worker processes pick the rows up with `CsvFollower`.
+An observation no newer than the location's latest one is a repeat and is
+dropped.
+
+Sources:
+- `TomTomFlowSource`: the live API, with a pooled async client. Calls go
+  through an `upstream.Upstream`, so once TomTom is failing polls skip it
+  at once instead of waiting out a timeout per bottleneck.
+- `FixtureFlowSource`: replays recorded responses from a JSON-lines file, for
+  tests and for running without network access. `FlowIngestor(record_path=...)`
+  writes such a file from live traffic.
+"""
+import asyncio
+import csv
+import json
+import os
+import time
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+from columnar import read_appended_rows
+from features import derive_row
+from upstream import Upstream
+
+TOMTOM_FLOW_URL = "https://api.tomtom.com/traffic/services/4/flowSegmentData/absolute/10/json"
+
+
+class RateLimiter:
+    """Token bucket: at most `rate` acquisitions per second, bursts up to `burst`"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TomTomFlowSource:
+    """Fetch live flow data for a point from TomTom"""
+
+    def __init__(self, api_key, timeout=10.0, max_connections=10, upstream=None):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.upstream = upstream or Upstream("tomtom")
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections),
+            )
+        return self._client
+
+    async def fetch(self, location, lat, lon):
+        """Return (observed_at, response JSON)"""
+        return await self.upstream.call(self._fetch_once, lat, lon)
+
+    async def _fetch_once(self, lat, lon):
+        response = await self._get_client().get(
+            TOMTOM_FLOW_URL,
+            params={"key": self.api_key, "point": f"{lat},{lon}", "unit": "KMPH"},
+        )
+        response.raise_for_status()
+        return datetime.now(), response.json()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FixtureFlowSource:
+    """Replay recorded flowSegmentData responses.
+
+    The fixture file has one JSON object per line:
+    {"location": ..., "timestamp": ..., "response": {...}}. Each location's
+    recordings are replayed in order. With `loop=True` they start over at the
+    end; otherwise the last one keeps being served. Observations are stamped
+    with the current time; with `live_timestamps=False` the recorded
+    timestamps are used as-is.
+    """
+
+    def __init__(self, path, loop=True, live_timestamps=True):
+        self.path = path
+        self.loop = loop
+        self.live_timestamps = live_timestamps
+        self._recordings = {}
+        self._positions = {}
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self._recordings.setdefault(record["location"], []).append(record)
+
+    async def fetch(self, location, lat, lon):
+        recordings = self._recordings.get(location)
+        if not recordings:
+            raise LookupError(f"No recorded flow data for {location}")
+
+        position = self._positions.get(location, 0)
+        record = recordings[position]
+        if position + 1 < len(recordings):
+            self._positions[location] = position + 1
+        elif self.loop:
+            self._positions[location] = 0
+
+        if self.live_timestamps or "timestamp" not in record:
+            observed_at = datetime.now()
+        else:
+            observed_at = datetime.fromisoformat(record["timestamp"])
+        return observed_at, record["response"]
+
+    async def close(self):
+        pass
+
+
+def derive_observation(location, observed_at, response):
+    """Turn a flowSegmentData response into a combined.csv-shaped row"""
+    flow = response["flowSegmentData"]
+    return derive_row({
+        "timestamp": observed_at,
+        "collection_location": location,
+        "segment_id": None,
+        "road_name": flow.get("roadName", "Unknown"),
+        "current_speed": float(flow["currentSpeed"]),
+        "free_flow_speed": flow["freeFlowSpeed"],
+        "current_travel_time": flow["currentTravelTime"],
+        "free_flow_travel_time": flow["freeFlowTravelTime"],
+        "confidence": flow.get("confidence", 1.0),
+        "road_closure": bool(flow.get("roadClosure", False)),
+        "is_lagos_hotspot": False,
+        "vehicle_count": None,
+        "predicted_travel_time": None,
+        "avg_speed": None,
+        "avg_timeLoss": None,
+    })
+
+
+class CsvSink:
+    """Append observations to a CSV, keeping its column order.
+
+    If `path` doesn't exist yet it is created with the header of `template`.
+    """
+
+    def __init__(self, path, template=None):
+        self.path = path
+        if not os.path.exists(path) and template is not None:
+            with open(template, newline="") as f:
+                header = f.readline()
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w", newline="") as f:
+                f.write(header)
+        with open(path, newline="") as f:
+            self.columns = next(csv.reader(f))
+        self._lock = asyncio.Lock()
+
+    def _write(self, rows):
+        with open(self.path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns, extrasaction="ignore")
+            for row in rows:
+                writer.writerow({k: ("" if v is None else v) for k, v in row.items()})
+
+    async def write(self, rows):
+        if rows:
+            async with self._lock:
+                await asyncio.to_thread(self._write, rows)
+
+
+class FlowIngestor:
+    """Poll every bottleneck on an interval and feed the observations onward"""
+
+    def __init__(self, source, bottlenecks, on_observation, sink=None,
+                 interval=180, rate_limiter=None, record_path=None, latest_timestamp=None):
+        self.source = source
+        self.bottlenecks = bottlenecks  # name -> (lat, lon)
+        self.on_observation = on_observation
+        # location -> timestamp of the newest observation already held (or None)
+        self.latest_timestamp = latest_timestamp
+        self.sink = sink
+        self.interval = interval
+        self.rate_limiter = rate_limiter or RateLimiter(rate=5, burst=5)
+        self.record_path = record_path
+        self.last_poll = None
+        self.errors = 0
+        self.repeats = 0
+        self._task = None
+
+    def _is_new(self, row):
+        if self.latest_timestamp is None:
+            return True
+        latest = self.latest_timestamp(row["collection_location"])
+        if latest is None or np.datetime64(row["timestamp"], "ns") > latest:
+            return True
+        self.repeats += 1
+        return False
+
+    async def _fetch(self, location, lat, lon):
+        await self.rate_limiter.acquire()
+        try:
+            observed_at, response = await self.source.fetch(location, lat, lon)
+        except Exception as e:
+            self.errors += 1
+            print(f"⚠️ Flow fetch failed for {location}: {e}")
+            return None
+        if self.record_path:
+            record = {"location": location, "timestamp": observed_at.isoformat(), "response": response}
+            await asyncio.to_thread(_append_line, self.record_path, json.dumps(record))
+        return derive_observation(location, observed_at, response)
+
+    async def poll_once(self):
+        """Fetch every bottleneck once; returns the new rows"""
+        results = await asyncio.gather(*[
+            self._fetch(location, lat, lon) for location, (lat, lon) in self.bottlenecks.items()
+        ])
+        rows = [row for row in results if row is not None and self._is_new(row)]
+        for row in rows:
+            self.on_observation(row)
+        if self.sink is not None:
+            await self.sink.write(rows)
+        self.last_poll = datetime.now()
+        return rows
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                await self.poll_once()
+            except Exception as e:
+                print(f"⚠️ Flow ingestion cycle failed: {e}")
+            await asyncio.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.source.close()
+
+
+class CsvFollower:
+    """Feed rows that another process appends to a CSV (e.g. a CsvSink) onward"""
+
+    def __init__(self, path, on_observation, offset=None, interval=5):
+        self.path = path
+        self.on_observation = on_observation
+        self.interval = interval
+        with open(path, "rb") as f:
+            header = f.readline()
+        self.header = next(csv.reader([header.decode()]))
+        # Start from the end unless told where the rows already seen stop (never inside the header)
+        self.offset = os.path.getsize(path) if offset is None else max(offset, len(header))
+        self._task = None
+
+    async def poll_once(self):
+        """Read newly appended rows; returns how many there were"""
+        if os.path.getsize(self.path) <= self.offset:
+            return 0
+        frame, self.offset = await asyncio.to_thread(read_appended_rows, self.path, self.offset, self.header)
+        for row in frame.to_dict("records"):
+            self.on_observation(row)
+        return len(frame)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                print(f"⚠️ Following {self.path} failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def _append_line(path, line):
+    with open(path, "a") as f:
+        f.write(line + "\n")
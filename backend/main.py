@@ -1,20 +1,106 @@
-import requests
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import pandas as pd
 import numpy as np
 import joblib
-from tensorflow.keras.models import load_model
+import orjson
 import os
+import sys
+import gc
+import hmac
+import json
+import time
+import asyncio
+import signal
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import uvicorn
-from typing import List
-import requests
+from typing import List, Optional
+from weather import WeatherService, OpenWeatherProvider, LocalWeatherProvider
+from inference import InferenceEngine, import_keras_loader
+from runtimes import RUNTIMES, load_predictor, runtime_path
+from features import FEATURES, WINDOW_SIZE, feature_matrix, flow_features
+from store import TrafficStore
+from profiles import CongestionProfile
+from rollups import HistoryRollups, RESOLUTIONS
+from retention import Retention
+from ingestion import FlowIngestor, TomTomFlowSource, FixtureFlowSource, CsvSink, CsvFollower
+from columnar import INGESTED, has_history, load_history, read_complete_rows
+from geo import SpatialIndex, haversine_km, path_lengths_km
+from ranking import RatioTimeline, score_routes, rank_routes
+from cache import ResponseCache, etag_for
+from metrics import metrics, span, start_trace, server_timing, SamplingProfiler
+from forecasts import ForecastScheduler
+from registry import ModelRegistry
+from upstream import Upstream
+from shared import SharedStore, SharedResponseCache, SharedWeather, LeaderLock, DATABASE, LEADER_LOCK
 
 
-app = FastAPI(title="Lagos Traffic Prediction API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app):
+    """Start background services, load resources without blocking startup, clean up on exit"""
+    # Warm the weather cache and keep it fresh in the background
+    weather_service.start()
+    if profiler is not None:
+        profiler.start()
+    
+    end_streams_on_shutdown_signal()
+    
+    # Loading runs in the background so /health/live answers immediately;
+    # /health/ready reports when the model and data are usable
+    loader = asyncio.ensure_future(start_serving())
+    yield
+    
+    loader.cancel()
+    if csv_follower is not None:
+        await csv_follower.stop()
+    await weather_service.stop()
+    if forecast_scheduler is not None:
+        await forecast_scheduler.stop()
+    for task in model_tasks:
+        task.cancel()
+    if flow_ingestor is not None:
+        await flow_ingestor.stop()
+    if inference_engine is not None:
+        await inference_engine.stop()
+    # Let another worker take over ingestion
+    if leader_lock is not None:
+        leader_lock.release()
+    if shared_store is not None:
+        shared_store.close()
+
+def end_streams_on_shutdown_signal():
+    """Close forecast streams as soon as SIGTERM/SIGINT arrives.
+
+    The server waits for open connections before shutting down, and an event
+    stream never finishes on its own. The server's own handlers still run.
+    """
+    # Signal handlers can only be set from the main thread (not e.g. under TestClient)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    loop = asyncio.get_running_loop()
+    
+    def close_streams():
+        if forecast_scheduler is not None:
+            forecast_scheduler.close_subscribers()
+    
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(signum)
+        
+        def handler(sig, frame, previous=previous):
+            loop.call_soon_threadsafe(close_streams)
+            if callable(previous):
+                previous(sig, frame)
+        signal.signal(signum, handler)
+
+app = FastAPI(title="Lagos Traffic Prediction API", version="1.0.0", lifespan=lifespan,
+              default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -27,9 +113,20 @@ app.add_middleware(
 
 # Global variables for model and data
 model = None
-df = None
+store = None
+congestion_profile = None
+history_rollups = None
+retention = None
+flow_ingestor = None
+csv_follower = None
 feature_scaler = None
 target_scaler = None
+inference_engine = None
+forecast_scheduler = None
+model_version = None
+loaded_paths = None  # files model_version was loaded from
+model_tasks = []
+ingest_offset = 0  # how far into the ingestion CSV the loaded data goes
 
 # Configuration
 BOTTLENECKS = {
@@ -44,14 +141,127 @@ BOTTLENECKS = {
     "Awolowo_Road"
 }
 
-FEATURES = [
-    "current_speed", "free_flow_speed", "delay_seconds",
-    "hour", "day_of_week", "is_rush_hour", "is_weekend", "is_lagos_hotspot"
-]
+# Bottleneck coordinates (approximate Lagos locations)
+BOTTLENECK_COORDS = {
+    "Third_Mainland_Bridge": [6.5000, 3.4025],
+    "Carter_Bridge": [6.4669, 3.3850],
+    "Eko_Bridge": [6.4641, 3.3803],
+    "CMS_Junction": [6.4500, 3.4000],
+    "Marina_Road": [6.4500, 3.4000],
+    "Obalende": [6.4447, 3.4175],
+    "Adeniji_Adele": [6.4743, 3.3904],
+    "Falomo_Roundabout": [6.4444, 3.4272],
+    "Awolowo_Road": [6.4419, 3.4190]
+}
+
+# Grid index over bottleneck locations for route matching
+bottleneck_index = SpatialIndex(BOTTLENECK_COORDS)
+
+# A route midpoint further than this from every bottleneck avoids them all (~0.1 degree)
+MAX_BOTTLENECK_DISTANCE_KM = 11.0
+# A route polyline passing within this distance of a bottleneck goes through it
+ROUTE_MATCH_RADIUS_KM = float(os.getenv("ROUTE_MATCH_RADIUS_KM", "0.5"))
+# Typical driving speed, for when a ranked route reaches each bottleneck
+ROUTE_SPEED_KMH = float(os.getenv("ROUTE_SPEED_KMH", "25"))
+MAX_RANKED_ROUTES = 100
+
+# Set by serve.py when running several worker processes: they share the response
+# and weather caches through SQLite there, and elect one of them to ingest and retrain
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR")
+shared_store = SharedStore(os.path.join(SHARED_STATE_DIR, DATABASE)) if SHARED_STATE_DIR else None
+leader_lock = LeaderLock(os.path.join(SHARED_STATE_DIR, LEADER_LOCK)) if SHARED_STATE_DIR else None
+LEADER_POLL_SECONDS = float(os.getenv("LEADER_POLL_SECONDS", "10"))
+
+# Identical analyses are reused for a minute, or until new data/weather arrives
+if shared_store is not None:
+    response_cache = SharedResponseCache(
+        shared_store,
+        encode=lambda body: orjson.dumps(body).decode(),
+        decode=orjson.loads,
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+        ttl=int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60")),
+    )
+else:
+    response_cache = ResponseCache(
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+        ttl=int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60")),
+    )
+
+# Instrumentation, exposed on /metrics
+http_request_seconds = metrics.histogram(
+    "lagos_http_request_seconds", "HTTP request latency", labels=("method", "route", "status")
+)
+upstream_calls = metrics.counter(
+    "lagos_upstream_calls_total", "Calls to upstream APIs by outcome (ok, error, rejected by an open circuit)",
+    labels=("upstream", "outcome"),
+)
+weather_fallbacks = metrics.counter(
+    "lagos_weather_fallback_total",
+    "Default weather used because the forecast failed, by who asked (request, or the forecast scheduler)",
+    labels=("source",),
+)
+model_batch_size = metrics.histogram(
+    "lagos_model_batch_size", "Windows per LSTM micro-batch", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+model_batch_seconds = metrics.histogram("lagos_model_batch_seconds", "LSTM micro-batch inference time")
+metrics.gauge("lagos_response_cache_hits_total", "Response cache hits", lambda: response_cache.hits, kind="counter")
+metrics.gauge("lagos_response_cache_misses_total", "Response cache misses", lambda: response_cache.misses, kind="counter")
+metrics.gauge("lagos_response_cache_entries", "Entries in the response cache", lambda: len(response_cache))
+metrics.gauge(
+    "lagos_weather_age_seconds", "Age of the cached weather snapshot",
+    lambda: round(weather_service.snapshot.age(), 1) if weather_service.snapshot is not None else None,
+)
+metrics.gauge(
+    "lagos_forecasts_computed_total", "Forecasts recomputed by the background scheduler",
+    lambda: forecast_scheduler.computed if forecast_scheduler is not None else None, kind="counter",
+)
+metrics.gauge(
+    "lagos_history_rows_dropped_total", "Raw observations dropped by retention after being rolled up",
+    lambda: retention.dropped if retention is not None else None, kind="counter",
+)
+metrics.gauge(
+    "lagos_ingestion_errors_total", "Failed flow polls",
+    lambda: flow_ingestor.errors if flow_ingestor is not None else None, kind="counter",
+)
+
+# PROFILE_SLOW_REQUESTS_MS=500 dumps collapsed stacks (flamegraph input) for slower requests
+profiler = None
+if os.getenv("PROFILE_SLOW_REQUESTS_MS"):
+    profiler = SamplingProfiler(
+        threshold_ms=float(os.getenv("PROFILE_SLOW_REQUESTS_MS")),
+        interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", "5")),
+        out_dir=os.getenv("PROFILE_DIR", "profiles"),
+    )
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Time every request; stage timings go back in a Server-Timing header"""
+    trace = start_trace()
+    started = time.perf_counter()
+    profile_started = profiler.request_started() if profiler is not None else None
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        # Label by route template, not raw path, to keep the series count bounded
+        route = request.scope.get("route")
+        route_name = route.path if route is not None else "unmatched"
+        http_request_seconds.observe(time.perf_counter() - started, request.method, route_name, status)
+        if profile_started is not None:
+            profiler.request_finished(profile_started, f"{request.method} {route_name}")
+    if trace:
+        response.headers["Server-Timing"] = server_timing(trace)
+    return response
+
+def record_model_batch(size, seconds):
+    model_batch_size.observe(size)
+    model_batch_seconds.observe(seconds)
 
 class RouteRequest(BaseModel):
     start: str
     end: str
+    path: List[List[float]] = None  # optional route polyline as [[lat, lon], ...]
 
 class HourlyForecast(BaseModel):
     hour: int
@@ -70,13 +280,17 @@ class WeatherForecastItem(BaseModel):
     condition: str
     temperature: float
     weather_impact: str
-    traffic_warning: str = None
+    traffic_warning: Optional[str] = None
 
 class WeatherForecast(BaseModel):
     current_weather: WeatherInfo
     hourly_forecast: List[WeatherForecastItem]
     weather_alerts: List[str] = []
 
+class DataAge(BaseModel):
+    traffic_seconds: Optional[int] = None  # since the bottleneck's latest observation
+    weather_seconds: Optional[int] = None  # since the weather was fetched; None when it is the default
+
 # UPDATED: Congestion-focused response model (no travel time predictions)
 class CongestionResponse(BaseModel):
     status: str  # "info", "warning", "alert"
@@ -88,169 +302,416 @@ class CongestionResponse(BaseModel):
     forecast_summary: str = None
     weather_forecast: WeatherForecast = None
     ai_recommendation: str = None  # Additional AI insights
+    predicted_congestion_ratio: float = None  # LSTM short-term outlook
+    route_bottlenecks: List[str] = []  # every bottleneck on the route, in order
+    model_version: Optional[str] = None  # model bundle that made the prediction
+    degraded: bool = False  # built from stale or fallback data; see degraded_reasons
+    degraded_reasons: List[str] = []  # e.g. "weather_unavailable", "traffic_stale"
+    data_age: Optional[DataAge] = None
 
-def predict_hourly_congestion(segment_data, current_hour):
-    """Predict congestion levels (not travel times) for the next few hours"""
+class ForecastInterval(BaseModel):
+    time: datetime
+    minutes_ahead: int
+    predicted_congestion_level: str  # adjusted for forecast weather, like the current level
+    predicted_congestion_ratio: Optional[float] = None  # None when based on typical patterns
+    confidence: str
+    weather_impact: Optional[str] = None  # only within the weather forecast's range
+
+class BottleneckForecast(BaseModel):
+    bottleneck_location: str
+    generated_at: datetime
+    hourly_forecast: List[HourlyForecast]
+    intervals: List[ForecastInterval]
+
+class HistoryBucket(BaseModel):
+    start: datetime
+    count: int
+    # Present when their statistic is requested; None when the bucket has no readings
+    mean_speed: Optional[float] = None
+    mean_delay_seconds: Optional[float] = None
+    mean_congestion_ratio: Optional[float] = None
+    p95_delay_seconds: Optional[float] = None
+    max_delay_seconds: Optional[float] = None
+    min_congestion_ratio: Optional[float] = None
+
+class WorstHour(BaseModel):
+    day_of_week: int  # Monday = 0
+    hour: int
+    congestion_ratio: float
+    delay_seconds: Optional[float] = None
+    samples: int
+
+class HistoryHeatmap(BaseModel):
+    # [day_of_week][hour], Monday = 0
+    congestion_ratio: List[List[Optional[float]]]
+    delay_seconds: List[List[Optional[float]]]
+    samples: List[List[int]]
+    worst_hours: List[WorstHour]
+
+class HistoryResponse(BaseModel):
+    location: str
+    resolution: str
+    buckets: List[HistoryBucket]
+    next_cursor: Optional[str] = None  # pass as `cursor` for the next page
+    heatmap: Optional[HistoryHeatmap] = None
+
+class CandidateRoute(BaseModel):
+    id: str
+    path: List[List[float]]  # route polyline as [[lat, lon], ...]
+
+class RouteRankingRequest(BaseModel):
+    routes: List[CandidateRoute]
+    departure: Optional[datetime] = None  # default: now
+
+class RouteCrossing(BaseModel):
+    bottleneck_location: str
+    along_km: float
+    arrival_minutes: float  # after departure, at ROUTE_SPEED_KMH
+    predicted_congestion_ratio: float
+    predicted_congestion_level: str
+
+class RankedRoute(BaseModel):
+    id: str
+    rank: int  # 1 is best
+    congestion_score: float  # sum of (1 - congestion_ratio) over the bottlenecks crossed; 0 is free flowing
+    length_km: float
+    travel_minutes: float  # at ROUTE_SPEED_KMH, without delays
+    mean_congestion_ratio: Optional[float] = None
+    worst_bottleneck: Optional[str] = None
+    bottlenecks: List[RouteCrossing] = []  # in the order they are reached
+
+class RouteRankingResponse(BaseModel):
+    departure: datetime
+    routes: List[RankedRoute]  # best first
+    recommendation: str
+
+class RollbackRequest(BaseModel):
+    version: Optional[str] = None  # default: the version the current one was trained from
+
+class BatchRouteRequest(BaseModel):
+    routes: List[RouteRequest]
+    stream: bool = False  # stream results back as NDJSON as they are ready
+
+class BatchCongestionResponse(BaseModel):
+    results: List[CongestionResponse]  # same order as the request routes
+    bottlenecks_analyzed: int
+
+# Typical Lagos traffic by hour, used where history is too thin
+LAGOS_PATTERNS = {
+    # Early morning (6-8 AM): Heavy traffic
+    6: {"level": "heavy"},
+    7: {"level": "heavy"},
+    8: {"level": "heavy"},
     
-    historical_patterns = {}
+    # Morning (9-11 AM): Moderate
+    9: {"level": "moderate"},
+    10: {"level": "light"},
+    11: {"level": "light"},
     
-    # Define typical Lagos traffic patterns as fallback
-    lagos_patterns = {
-        # Early morning (6-8 AM): Heavy traffic
-        6: {"level": "heavy"},
-        7: {"level": "heavy"},
-        8: {"level": "heavy"},
-        
-        # Morning (9-11 AM): Moderate
-        9: {"level": "moderate"},
-        10: {"level": "light"},
-        11: {"level": "light"},
-        
-        # Midday (12-2 PM): Light
-        12: {"level": "light"},
-        13: {"level": "moderate"},
-        14: {"level": "light"},
-        
-        # Afternoon (3-5 PM): Building up
-        15: {"level": "moderate"},
-        16: {"level": "heavy"},
-        17: {"level": "heavy"},
-        
-        # Evening (6-8 PM): Peak
-        18: {"level": "heavy"},
-        19: {"level": "heavy"},
-        20: {"level": "moderate"},
-        
-        # Night (9 PM - 5 AM): Clear
-        21: {"level": "light"},
-        22: {"level": "clear"},
-        23: {"level": "clear"},
-        0: {"level": "clear"},
-        1: {"level": "clear"},
-        2: {"level": "clear"},
-        3: {"level": "clear"},
-        4: {"level": "clear"},
-        5: {"level": "light"},
+    # Midday (12-2 PM): Light
+    12: {"level": "light"},
+    13: {"level": "moderate"},
+    14: {"level": "light"},
+    
+    # Afternoon (3-5 PM): Building up
+    15: {"level": "moderate"},
+    16: {"level": "heavy"},
+    17: {"level": "heavy"},
+    
+    # Evening (6-8 PM): Peak
+    18: {"level": "heavy"},
+    19: {"level": "heavy"},
+    20: {"level": "moderate"},
+    
+    # Night (9 PM - 5 AM): Clear
+    21: {"level": "light"},
+    22: {"level": "clear"},
+    23: {"level": "clear"},
+    0: {"level": "clear"},
+    1: {"level": "clear"},
+    2: {"level": "clear"},
+    3: {"level": "clear"},
+    4: {"level": "clear"},
+    5: {"level": "light"},
+}
+
+# "6:00 AM"-style label for each hour of the day
+HOUR_LABELS = [f"{(hour - 1) % 12 + 1}:00 {'AM' if hour < 12 else 'PM'}" for hour in range(24)]
+
+def congestion_level_for_ratio(ratio):
+    if ratio >= 0.8:
+        return "clear"
+    elif ratio >= 0.6:
+        return "light"
+    elif ratio >= 0.4:
+        return "moderate"
+    elif ratio >= 0.2:
+        return "heavy"
+    return "severe"
+
+def forecast_hour(location, target_time):
+    """Congestion outlook for the hour containing target_time, from history or typical patterns"""
+    target_hour = target_time.hour
+    
+    # Historical stats for this hour of the week, else this hour on any day
+    hour_stats = congestion_profile.lookup(location, target_hour, target_time.weekday())
+    if hour_stats["count"] < 3:
+        hour_stats = congestion_profile.lookup(location, target_hour)
+    
+    if hour_stats["count"] >= 3:  # We have enough historical data
+        mean_ratio = hour_stats["mean"]
+        confidence = "high" if hour_stats["count"] >= 8 else "medium"
+        level = congestion_level_for_ratio(mean_ratio)
+    else:  # Use pattern-based prediction
+        mean_ratio = None
+        level = LAGOS_PATTERNS.get(target_hour, {"level": "moderate"})["level"]
+        confidence = "medium"
+    
+    return {
+        "level": level,
+        "confidence": confidence,
+        "data_points": hour_stats["count"],
+        "mean_ratio": mean_ratio,
     }
+
+def predict_hourly_congestion(location, now, hours=3):
+    """Predict congestion levels (not travel times) for the next few hours"""
+    historical_patterns = {}
+    for hour_offset in range(1, hours + 1):
+        target_time = now + timedelta(hours=hour_offset)
+        historical_patterns[target_time.hour] = forecast_hour(location, target_time)
+    return historical_patterns
+
+# Forecasts are precomputed for every bottleneck up to this far ahead, at this granularity
+FORECAST_HORIZON_HOURS = min(int(os.getenv("FORECAST_HORIZON_HOURS", "24")), 24)
+FORECAST_STEP_MINUTES = int(os.getenv("FORECAST_STEP_MINUTES", "15"))
+# Comment lines sent on idle event streams so proxies keep them open
+SSE_KEEPALIVE_SECONDS = 15
+
+def adjust_level_for_weather(level, weather_impact):
+    if weather_impact == "severe" and level in ["clear", "light"]:
+        return "moderate"
+    elif weather_impact == "moderate" and level == "clear":
+        return "light"
+    return level
+
+def build_forecast(location, now, weather_impacts):
+    """Hourly and FORECAST_STEP_MINUTES forecasts for one bottleneck.
+
+    Interval ratios interpolate between the hourly profile means;
+    `weather_impacts` maps hour -> forecast weather impact.
+    """
+    hours = {}
+    def hour_at(time):
+        key = time.replace(minute=0, second=0, microsecond=0)
+        if key not in hours:
+            hours[key] = forecast_hour(location, key)
+        return hours[key]
     
-    for hour_offset in range(1, 4):  # Predict next 3 hours
-        target_hour = (current_hour + hour_offset) % 24
-        
-        # Try to get historical data for this specific hour
-        hour_data = segment_data[segment_data['hour'] == target_hour]
+    hourly_forecast = []
+    for hour_offset in range(1, FORECAST_HORIZON_HOURS + 1):
+        target_time = now + timedelta(hours=hour_offset)
+        pattern = hour_at(target_time)
+        hourly_forecast.append(HourlyForecast(
+            hour=target_time.hour,
+            predicted_congestion_level=pattern["level"],
+            confidence=pattern["confidence"]
+        ))
+    
+    step = timedelta(minutes=FORECAST_STEP_MINUTES)
+    slot_start = datetime.fromtimestamp(now.timestamp() // step.total_seconds() * step.total_seconds())
+    intervals = []
+    for step_index in range(1, FORECAST_HORIZON_HOURS * 60 // FORECAST_STEP_MINUTES + 1):
+        target_time = slot_start + step * step_index
+        this_hour = hour_at(target_time)
+        next_hour = hour_at(target_time + timedelta(hours=1))
+        fraction = target_time.minute / 60
         
-        if len(hour_data) >= 3:  # We have enough historical data
-            avg_congestion = hour_data['congestion_ratio'].mean()
-            confidence = "high" if len(hour_data) >= 8 else "medium"
-            
-            # Determine level from actual data
-            if avg_congestion >= 0.8:
-                level = "clear"
-            elif avg_congestion >= 0.6:
-                level = "light"
-            elif avg_congestion >= 0.4:
-                level = "moderate"
-            elif avg_congestion >= 0.2:
-                level = "heavy"
-            else:
-                level = "severe"
-                
-        else:  # Use pattern-based prediction
-            pattern = lagos_patterns.get(target_hour, {"level": "moderate"})
-            level = pattern["level"]
-            confidence = "medium"
+        if this_hour["mean_ratio"] is not None and next_hour["mean_ratio"] is not None:
+            ratio = (1 - fraction) * this_hour["mean_ratio"] + fraction * next_hour["mean_ratio"]
+            level = congestion_level_for_ratio(ratio)
+            ratio = round(ratio, 2)
+        else:
+            ratio = None
+            level = this_hour["level"]
         
-        historical_patterns[target_hour] = {
-            "level": level,
-            "confidence": confidence,
-            "data_points": len(hour_data)
-        }
+        weather_impact = weather_impacts.get(target_time.hour) if target_time - now <= timedelta(hours=4) else None
+        intervals.append(ForecastInterval(
+            time=target_time,
+            minutes_ahead=int((target_time - now).total_seconds() // 60),
+            predicted_congestion_level=adjust_level_for_weather(level, weather_impact),
+            predicted_congestion_ratio=ratio,
+            confidence=(this_hour if fraction < 0.5 else next_hour)["confidence"],
+            weather_impact=weather_impact
+        ))
     
-    return historical_patterns
+    return BottleneckForecast(
+        bottleneck_location=location,
+        generated_at=now,
+        hourly_forecast=hourly_forecast,
+        intervals=intervals
+    )
+
+async def compute_forecast(location, now):
+    weather_forecast = await get_weather_forecast(source="scheduler")
+    weather_impacts = {item.hour: item.weather_impact for item in weather_forecast.hourly_forecast}
+    return await asyncio.to_thread(build_forecast, location, now, weather_impacts)
+
+def forecast_inputs_version(location):
+    return (store.location_version(location), weather_version())
+
+def current_hourly_patterns(location, now):
+    """The next 3 hours from the precomputed forecast, else computed now"""
+    forecast = forecast_scheduler.get(location) if forecast_scheduler is not None else None
+    if forecast is None or forecast.generated_at.strftime("%Y-%m-%d %H") != now.strftime("%Y-%m-%d %H"):
+        return predict_hourly_congestion(location, now)
+    return {
+        item.hour: {"level": item.predicted_congestion_level, "confidence": item.confidence}
+        for item in forecast.hourly_forecast[:3]
+    }
+
+# Upstream APIs in use (see upstream.py): after this many failed calls in a row
+# calls fail fast for UPSTREAM_RESET_SECONDS, then one trial call is let through
+upstreams = {}
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "3"))
+UPSTREAM_RESET_SECONDS = float(os.getenv("UPSTREAM_RESET_SECONDS", "30"))
+
+def register_upstream(upstream):
+    """Count an upstream's calls on /metrics and report its circuit on /health"""
+    upstream.on_outcome = lambda outcome: upstream_calls.inc(upstream.name, outcome)
+    upstreams[upstream.name] = upstream
+    return upstream
+
+# Weather integration functions
+WEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "2fae322e4a2bd69e8a0f394339de3207")
+
+# Lagos weather changes on a 10-60 minute scale: serve from a 10 minute TTL cache,
+# refreshed in the background. WEATHER_PROVIDER=local uses an offline stand-in.
+if os.getenv("WEATHER_PROVIDER", "openweather") == "local":
+    weather_provider = LocalWeatherProvider()
+else:
+    weather_provider = OpenWeatherProvider(WEATHER_API_KEY, upstream=register_upstream(Upstream(
+        "openweather",
+        deadline=float(os.getenv("WEATHER_DEADLINE_SECONDS", "5")),
+        hedge_after=float(os.getenv("WEATHER_HEDGE_SECONDS", "1.5")),
+        failure_threshold=UPSTREAM_FAILURE_THRESHOLD,
+        reset_timeout=UPSTREAM_RESET_SECONDS,
+    )))
+# How long a request waits for weather when none is cached; the fetch carries on in the background
+WEATHER_REQUEST_BUDGET_SECONDS = float(os.getenv("WEATHER_REQUEST_BUDGET_SECONDS", "1"))
+
+weather_service = WeatherService(
+    weather_provider,
+    ttl=int(os.getenv("WEATHER_TTL_SECONDS", "600")),
+    stale_ttl=int(os.getenv("WEATHER_STALE_TTL_SECONDS", "3600")),
+    shared=SharedWeather(shared_store) if shared_store is not None else None,
+)
+
+weather_block = None  # ((weather version, hour), WeatherForecast, its JSON-ready dict, whether it is the default)
 
-# Weather integration functions (keep the same)
-WEATHER_API_KEY = "2fae322e4a2bd69e8a0f394339de3207"
+async def get_weather_forecast(source="request"):
+    """Fetch current weather and 4-hour forecast for Lagos.
 
-async def get_weather_forecast():
-    """Fetch current weather and 4-hour forecast for Lagos"""
+    `source` labels the fallback counter: "request" or "scheduler".
+    """
+    global weather_block
     try:
-        lat, lon = 6.5244, 3.3792
         current_hour = datetime.now().hour
         
-        # Get current weather
-        current_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric"
-        current_response = requests.get(current_url, timeout=10)
-        current_response.raise_for_status()
-        current_data = current_response.json()
-        
-        # Get hourly forecast
-        forecast_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric"
-        forecast_response = requests.get(forecast_url, timeout=10)
-        forecast_response.raise_for_status()
-        forecast_data = forecast_response.json()
-        
-        # Process current weather
-        current_condition = current_data['weather'][0]['main'].lower()
-        current_weather = WeatherInfo(
-            condition=current_data['weather'][0]['description'].title(),
-            temperature=round(current_data['main']['temp'], 1),
-            humidity=current_data['main'].get('humidity', 0),
-            visibility=round(current_data.get('visibility', 10000) / 1000, 1),
-            weather_impact=get_weather_impact(current_condition, current_data)
-        )
+        # Cached current weather + forecast payloads
+        with span("weather_fetch"):
+            snapshot = await weather_service.get(timeout=WEATHER_REQUEST_BUDGET_SECONDS)
+    except asyncio.TimeoutError:
+        print(f"Weather forecast error: no weather within {WEATHER_REQUEST_BUDGET_SECONDS:g}s")
+        weather_fallbacks.inc(source)
+        return DEFAULT_WEATHER_FORECAST
+    except Exception as e:
+        print(f"Weather forecast error: {e}")
+        weather_fallbacks.inc(source)
+        return DEFAULT_WEATHER_FORECAST
+    
+    # Built once per snapshot and hour, then shared by every response
+    key = (snapshot.version, current_hour)
+    if weather_block is None or weather_block[0] != key:
+        try:
+            weather_forecast, fallback = build_weather_forecast(snapshot.current, snapshot.forecast, current_hour), False
+        except Exception as e:
+            print(f"Weather forecast error: {e}")
+            weather_forecast, fallback = DEFAULT_WEATHER_FORECAST, True
+        weather_block = (key, weather_forecast, weather_forecast.model_dump(mode="json"), fallback)
+    if weather_block[3]:
+        weather_fallbacks.inc(source)
+    return weather_block[1]
+
+def render_weather(weather_forecast):
+    """JSON-ready dict of a WeatherForecast, reusing the rendering of the current one"""
+    if weather_block is not None and weather_block[1] is weather_forecast:
+        return weather_block[2]
+    return weather_forecast.model_dump(mode="json")
+
+def build_weather_forecast(current_data, forecast_data, current_hour):
+    """WeatherForecast from OpenWeather current/forecast payloads"""
+    # Process current weather
+    current_condition = current_data['weather'][0]['main'].lower()
+    current_weather = WeatherInfo(
+        condition=current_data['weather'][0]['description'].title(),
+        temperature=round(current_data['main']['temp'], 1),
+        humidity=current_data['main'].get('humidity', 0),
+        visibility=round(current_data.get('visibility', 10000) / 1000, 1),
+        weather_impact=get_weather_impact(current_condition, current_data)
+    )
+    
+    # Process hourly forecast (next 4 hours)
+    hourly_forecast = []
+    weather_alerts = []
+    
+    for i in range(1, 5):  # Next 4 hours
+        target_hour = (current_hour + i) % 24
         
-        # Process hourly forecast (next 4 hours)
-        hourly_forecast = []
-        weather_alerts = []
+        # Find the closest forecast entry (OpenWeather gives 3-hour intervals)
+        forecast_entry = None
+        for entry in forecast_data['list'][:8]:  # Next 24 hours
+            entry_hour = datetime.fromtimestamp(entry['dt']).hour
+            if abs(entry_hour - target_hour) <= 1:  # Within 1 hour
+                forecast_entry = entry
+                break
         
-        for i in range(1, 5):  # Next 4 hours
-            target_hour = (current_hour + i) % 24
+        if forecast_entry:
+            condition = forecast_entry['weather'][0]['main'].lower()
+            weather_impact = get_weather_impact(condition, forecast_entry)
             
-            # Find the closest forecast entry (OpenWeather gives 3-hour intervals)
-            forecast_entry = None
-            for entry in forecast_data['list'][:8]:  # Next 24 hours
-                entry_hour = datetime.fromtimestamp(entry['dt']).hour
-                if abs(entry_hour - target_hour) <= 1:  # Within 1 hour
-                    forecast_entry = entry
-                    break
+            # Generate traffic warning
+            traffic_warning = generate_traffic_warning(condition, weather_impact, i)
+            if traffic_warning:
+                weather_alerts.append(f"In {i} hour{'s' if i > 1 else ''}: {traffic_warning}")
             
-            if forecast_entry:
-                condition = forecast_entry['weather'][0]['main'].lower()
-                weather_impact = get_weather_impact(condition, forecast_entry)
-                
-                # Generate traffic warning
-                traffic_warning = generate_traffic_warning(condition, weather_impact, i)
-                if traffic_warning:
-                    weather_alerts.append(f"In {i} hour{'s' if i > 1 else ''}: {traffic_warning}")
-                
-                hourly_item = WeatherForecastItem(
-                    hour=target_hour,
-                    condition=forecast_entry['weather'][0]['description'].title(),
-                    temperature=round(forecast_entry['main']['temp'], 1),
-                    weather_impact=weather_impact,
-                    traffic_warning=traffic_warning
-                )
-                hourly_forecast.append(hourly_item)
-        
-        return WeatherForecast(
-            current_weather=current_weather,
-            hourly_forecast=hourly_forecast,
-            weather_alerts=weather_alerts
-        )
-        
-    except Exception as e:
-        print(f"Weather forecast error: {e}")
-        return WeatherForecast(
-            current_weather=WeatherInfo(
-                condition="Clear Sky",
-                temperature=28.0,
-                humidity=75,
-                visibility=10.0,
-                weather_impact="none"
-            ),
-            hourly_forecast=[],
-            weather_alerts=[]
-        )
+            hourly_item = WeatherForecastItem(
+                hour=target_hour,
+                condition=forecast_entry['weather'][0]['description'].title(),
+                temperature=round(forecast_entry['main']['temp'], 1),
+                weather_impact=weather_impact,
+                traffic_warning=traffic_warning
+            )
+            hourly_forecast.append(hourly_item)
+    
+    return WeatherForecast(
+        current_weather=current_weather,
+        hourly_forecast=hourly_forecast,
+        weather_alerts=weather_alerts
+    )
+
+# Served when no weather is available; responses using it are marked degraded
+DEFAULT_WEATHER_FORECAST = WeatherForecast(
+    current_weather=WeatherInfo(
+        condition="Clear Sky",
+        temperature=28.0,
+        humidity=75,
+        visibility=10.0,
+        weather_impact="none"
+    ),
+    hourly_forecast=[],
+    weather_alerts=[]
+)
 
 def get_weather_impact(condition, weather_data):
     """Determine weather impact on traffic"""
@@ -294,47 +755,333 @@ def generate_traffic_warning(condition, weather_impact, hours_ahead):
     
     return None
 
-@app.on_event("startup")
-async def load_models():
-    """Load model, scaler, and data on startup"""
-    global model, feature_scaler, target_scaler, df
+def record_observation(row):
+    """Fold a freshly ingested observation into the in-memory indexes"""
+    store.append(row)
+    congestion_profile.add(row["collection_location"], row["timestamp"], row["congestion_ratio"])
+    history_rollups.add(row["collection_location"], row["timestamp"])
+    if retention is not None:
+        retention.enforce(row["collection_location"])
+    response_cache.invalidate(row["collection_location"])
+    if forecast_scheduler is not None:
+        forecast_scheduler.mark_dirty()
+
+def ingest_output_path():
+    """CSV that ingested observations are appended to (not the tracked dataset)"""
+    return os.getenv("INGEST_OUTPUT") or os.path.join(HISTORY_PATH, INGESTED)
+
+def start_ingestion(data_path):
+    """Start polling live flow data if INGEST_SOURCE is configured.
+
+    INGEST_SOURCE=tomtom polls the TomTom API (needs TOMTOM_API_KEY);
+    INGEST_SOURCE=fixture replays INGEST_FIXTURES without network access.
+    """
+    global flow_ingestor
+    
+    source_name = os.getenv("INGEST_SOURCE", "")
+    if source_name == "tomtom":
+        api_key = os.getenv("TOMTOM_API_KEY")
+        if not api_key:
+            print("❌ INGEST_SOURCE=tomtom but TOMTOM_API_KEY is not set - ingestion disabled")
+            return
+        source = TomTomFlowSource(api_key, upstream=register_upstream(Upstream(
+            "tomtom",
+            deadline=float(os.getenv("TOMTOM_DEADLINE_SECONDS", "8")),
+            hedge_after=float(os.getenv("TOMTOM_HEDGE_SECONDS", "3")),
+            failure_threshold=UPSTREAM_FAILURE_THRESHOLD,
+            reset_timeout=UPSTREAM_RESET_SECONDS,
+        )))
+    elif source_name == "fixture":
+        source = FixtureFlowSource(os.getenv("INGEST_FIXTURES", "fixtures/tomtom_flow.jsonl"))
+    else:
+        return
     
+    flow_ingestor = FlowIngestor(
+        source,
+        BOTTLENECK_COORDS,
+        on_observation=record_observation,
+        sink=CsvSink(ingest_output_path(), template=data_path),
+        interval=int(os.getenv("INGEST_INTERVAL_SECONDS", "180")),
+        record_path=os.getenv("INGEST_RECORD_PATH"),
+        latest_timestamp=store.latest_timestamp,
+    )
+    flow_ingestor.start()
+    print(f"✅ Flow ingestion started ({source_name})")
+
+# Update these paths to your actual file paths
+MODEL_PATH = "lstm_model.keras"
+FEATURE_SCALER_PATH = "feature_scaler.pkl"
+TARGET_SCALER_PATH = "target_scaler.pkl"
+DATA_PATH = os.getenv("DATA_PATH", "combined.csv")
+HISTORY_PATH = os.getenv("HISTORY_PATH", "history")  # built with columnar.py
+# Raw observations older than this are dropped once rolled up (0 keeps them all);
+# 5-minute and hourly rollups are kept for their own, longer horizons
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "30"))
+ROLLUP_HORIZONS = {
+    "5min": np.timedelta64(int(os.getenv("ROLLUP_5MIN_DAYS", "90")), "D"),
+    "hourly": np.timedelta64(int(os.getenv("ROLLUP_HOURLY_DAYS", "730")), "D"),
+    "daily": None,
+}
+
+# Versioned model bundles written by training.py; the files above are served until it has one
+model_registry = ModelRegistry(os.getenv("MODEL_REGISTRY", "models"))
+MODEL_POLL_SECONDS = float(os.getenv("MODEL_POLL_SECONDS", "30"))
+# Fine-tune on new data every N hours in a separate process (off by default)
+RETRAIN_INTERVAL_HOURS = float(os.getenv("RETRAIN_INTERVAL_HOURS", "0"))
+# Required by the admin endpoints (model rollback); they are disabled without it
+MODEL_ADMIN_TOKEN = os.getenv("MODEL_ADMIN_TOKEN")
+# keras, numpy, tflite or tflite_quantized (see runtimes.py); only keras needs TensorFlow
+MODEL_RUNTIME = os.getenv("MODEL_RUNTIME", "keras")
+if MODEL_RUNTIME not in RUNTIMES:
+    print(f"⚠️ Unknown MODEL_RUNTIME {MODEL_RUNTIME!r}, using keras")
+    MODEL_RUNTIME = "keras"
+model_swap_lock = asyncio.Lock()
+
+def model_paths():
+    """(version, {"model", "feature_scaler", "target_scaler": path}) to serve"""
+    version = model_registry.current()
+    if version is not None:
+        return version, model_registry.paths(version)
+    return "baseline", {"model": MODEL_PATH, "feature_scaler": FEATURE_SCALER_PATH, "target_scaler": TARGET_SCALER_PATH}
+
+# Startup progress and per-component load times (seconds), reported by /health/ready
+load_status = {"state": "starting", "error": None, "timings": {}}
+process_started = time.monotonic()
+
+def timed(name, fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    load_status["timings"][name] = round(time.perf_counter() - started, 3)
+    return result
+
+def load_model_file(path):
+    if MODEL_RUNTIME == "keras":
+        timed("tensorflow_import", import_keras_loader)
+    return timed("model", load_predictor, path, MODEL_RUNTIME)
+
+def load_bundle(version):
+    """Load and warm up a registry bundle (blocking; run off the event loop)"""
+    paths = model_registry.paths(version)
+    bundle_model = load_predictor(paths["model"], MODEL_RUNTIME)
+    bundle_feature_scaler = joblib.load(paths["feature_scaler"])
+    bundle_target_scaler = joblib.load(paths["target_scaler"])
+    # The first prediction builds the graph; do it before any request waits on it
+    bundle_model.predict_on_batch(np.zeros((1, WINDOW_SIZE, len(FEATURES)), dtype=np.float32))
+    return bundle_model, bundle_feature_scaler, bundle_target_scaler
+
+def load_data():
+    # Memory-mapped columnar history if converted, else the CSV, plus the observations ingested since
+    ingested = ingest_output_path()
+    ingested = [ingested] if os.path.exists(ingested) and os.path.abspath(ingested) != os.path.abspath(DATA_PATH) else []
+    if has_history(HISTORY_PATH):
+        data_store = load_history(HISTORY_PATH, csv_paths=ingested)
+        print(f"✅ Columnar history opened - {len(data_store)} records")
+    else:
+        # Complete rows only: ingestion may be appending to the files
+        reads = {os.path.abspath(path): read_complete_rows(path) for path in [DATA_PATH] + ingested}
+        df = pd.concat([frame for frame, _ in reads.values()], ignore_index=True)
+        print(f"✅ Data loaded successfully - {len(df)} records")
+        
+        # Index by location so per-request lookups don't scan the frame
+        data_store = TrafficStore.from_frame(df)
+        data_store.offsets = {path: offset for path, (_, offset) in reads.items()}
+    print(f"✅ Data indexed - {len(data_store.locations)} locations")
+    
+    # Hour-of-week congestion aggregates over the full history
+    profile = timed("congestion_profile", CongestionProfile.from_store, data_store)
+    print("✅ Congestion profiles built")
+    
+    # 5-minute/hourly/daily rollups for /history
+    rollups = timed("history_rollups", HistoryRollups.from_store, data_store, ROLLUP_HORIZONS)
+    print("✅ History rollups built")
+    
+    # Bound the raw rows kept in memory; the profiles and rollups already hold the rest
+    data_retention = None
+    if RETENTION_DAYS > 0:
+        # Never fewer rows than the model's input window, however old they are
+        data_retention = Retention(
+            data_store, rollups, np.timedelta64(int(RETENTION_DAYS * 86400), "s"), min_rows=WINDOW_SIZE
+        )
+        dropped = timed("retention", data_retention.enforce_all)
+        print(f"✅ Keeping {RETENTION_DAYS:g} days of raw observations ({dropped} older rows dropped)")
+    return data_store, profile, rollups, data_retention
+
+def load_resources(include_model=True):
+    """Load model, scalers and data in parallel (blocking).
+
+    Anything already loaded (by a preload) is kept; with include_model=False
+    the model is left for a later call.
+    """
+    global model, feature_scaler, target_scaler, store, congestion_profile, history_rollups, retention, model_version, ingest_offset, loaded_paths
+    
+    if load_status["state"] in ("loading", "ready"):
+        return
+    load_status["state"] = "loading"
+    started = time.perf_counter()
     try:
-        # Update these paths to your actual file paths
-        MODEL_PATH = "lstm_model.keras"
-        FEATURE_SCALER_PATH = "feature_scaler.pkl"
-        TARGET_SCALER_PATH = "target_scaler.pkl"
-        DATA_PATH = "combined.csv"
+        # The model of a preload is the version its scalers came from
+        version, paths = (model_version, loaded_paths) if loaded_paths is not None else model_paths()
         
         # Check if files exist
-        for path, name in [(MODEL_PATH, "Model"), (FEATURE_SCALER_PATH, "Feature Scaler"), 
-                          (TARGET_SCALER_PATH, "Target Scaler"), (DATA_PATH, "Data")]:
+        missing = []
+        for path, name in [(runtime_path(paths["model"], MODEL_RUNTIME), "Model"), (paths["feature_scaler"], "Feature Scaler"), 
+                          (paths["target_scaler"], "Target Scaler"), (DATA_PATH, "Data")]:
             if not os.path.exists(path):
                 print(f"❌ {name} file not found at: {path}")
-                return
+                missing.append(path)
             else:
                 print(f"✅ {name} file found at: {path}")
+        if missing:
+            load_status["state"] = "failed"
+            load_status["error"] = f"Missing files: {', '.join(missing)}"
+            return
         
-        # Load model
-        model = load_model(MODEL_PATH)
-        print("✅ Model loaded successfully")
+        # TensorFlow import + model load dominates; scalers and data load alongside it
+        with ThreadPoolExecutor(max_workers=4, thread_name_prefix="loader") as pool:
+            if include_model and model is None:
+                model_future = pool.submit(load_model_file, paths["model"])
+            if feature_scaler is None:
+                feature_scaler_future = pool.submit(timed, "feature_scaler", joblib.load, paths["feature_scaler"])
+                target_scaler_future = pool.submit(timed, "target_scaler", joblib.load, paths["target_scaler"])
+                feature_scaler = feature_scaler_future.result()
+                print("✅ Feature scaler loaded successfully")
+                target_scaler = target_scaler_future.result()
+                print("✅ Target scaler loaded successfully")
+            if store is None:
+                store, congestion_profile, history_rollups, retention = timed("data", load_data)
+                # Followers apply the leader's rows from where the loader stopped reading them
+                ingest_offset = store.offsets.get(os.path.abspath(ingest_output_path()), 0)
+            model_version, loaded_paths = version, paths
+            if include_model and model is None:
+                model = model_future.result()
+                print(f"✅ Model loaded successfully (version {version}, {MODEL_RUNTIME} runtime)")
         
-        # Load scalers
-        feature_scaler = joblib.load(FEATURE_SCALER_PATH)
-        print("✅ Feature scaler loaded successfully")
-        
-        target_scaler = joblib.load(TARGET_SCALER_PATH)
-        print("✅ Target scaler loaded successfully")
-        
-        # Load latest data
-        df = pd.read_csv(DATA_PATH)
-        print(f"✅ Data loaded successfully - {len(df)} records")
+        load_status["timings"]["total"] = round(load_status["timings"].get("total", 0) + time.perf_counter() - started, 3)
+        load_status["state"] = "ready" if model is not None else "preloaded"
         
     except Exception as e:
+        load_status["state"] = "failed"
+        load_status["error"] = str(e)
         print(f"❌ Error loading models: {e}")
-        import traceback
         traceback.print_exc()
 
+def start_leader_tasks():
+    """Jobs only one process should run: ingestion and retraining"""
+    # Keep the store current from live flow data
+    start_ingestion(DATA_PATH)
+    if RETRAIN_INTERVAL_HOURS > 0:
+        model_tasks.append(asyncio.ensure_future(retrain_periodically()))
+
+async def follow_leader():
+    """Apply the leader's ingested rows until this worker becomes the leader"""
+    global csv_follower
+    
+    while not leader_lock.acquire():
+        # The leader creates the CSV when its ingestion starts
+        if csv_follower is None and os.getenv("INGEST_SOURCE") and os.path.exists(ingest_output_path()):
+            # The same rows the leader records, from where this worker's loaded data ends
+            csv_follower = CsvFollower(ingest_output_path(), record_observation, offset=ingest_offset)
+            csv_follower.start()
+        await asyncio.sleep(LEADER_POLL_SECONDS)
+    
+    # The previous leader has exited: catch up on its last rows, then take over
+    if csv_follower is not None:
+        await csv_follower.stop()
+        await csv_follower.poll_once()
+        csv_follower = None
+    print(f"✅ Worker {os.getpid()} is now the leader")
+    start_leader_tasks()
+
+async def start_serving():
+    """Load resources off the event loop, then start the services that use them"""
+    global inference_engine, forecast_scheduler
+    
+    # Already done at import time when preloading
+    if load_status["state"] != "ready":
+        await asyncio.to_thread(load_resources)
+    if load_status["state"] != "ready":
+        return
+    
+    # Batched, off-loop inference for the LSTM
+    inference_engine = InferenceEngine(
+        model, feature_scaler, target_scaler, FEATURES, on_batch=record_model_batch, version=model_version
+    )
+    inference_engine.start()
+    
+    # Forecasts for every bottleneck, recomputed as data and weather arrive
+    forecast_scheduler = ForecastScheduler(
+        compute_forecast, sorted(BOTTLENECKS), forecast_inputs_version, step_minutes=FORECAST_STEP_MINUTES
+    )
+    forecast_scheduler.start()
+    weather_service.on_update = lambda snapshot: forecast_scheduler.mark_dirty()
+    
+    # Pick up new model versions
+    model_tasks.append(asyncio.ensure_future(watch_model_registry()))
+    
+    # With several workers only the leader ingests and retrains
+    if leader_lock is None or leader_lock.acquire():
+        if leader_lock is not None:
+            print(f"✅ Worker {os.getpid()} is the leader")
+        start_leader_tasks()
+    else:
+        model_tasks.append(asyncio.ensure_future(follow_leader()))
+    print(f"✅ Ready in {time.monotonic() - process_started:.1f}s")
+
+async def swap_model(version):
+    """Load a registry version off the event loop and switch serving to it"""
+    global model, feature_scaler, target_scaler, model_version
+    
+    async with model_swap_lock:
+        if version == model_version:
+            return
+        new_model, new_feature_scaler, new_target_scaler = await asyncio.to_thread(load_bundle, version)
+        inference_engine.swap(new_model, new_feature_scaler, new_target_scaler, version)
+        model, feature_scaler, target_scaler, model_version = new_model, new_feature_scaler, new_target_scaler, version
+        # Cached analyses carry the old model's predictions
+        response_cache.clear()
+        print(f"✅ Now serving model version {version}")
+
+async def watch_model_registry():
+    """Hot-swap whenever the registry's CURRENT version changes"""
+    last_stamp = model_registry.current_stamp()
+    while True:
+        await asyncio.sleep(MODEL_POLL_SECONDS)
+        stamp = model_registry.current_stamp()
+        if stamp == last_stamp:
+            continue
+        last_stamp = stamp
+        version = model_registry.current()
+        if version is None or version == model_version:
+            continue
+        try:
+            await swap_model(version)
+        except Exception as e:
+            # Keep serving the old model
+            print(f"❌ Could not load model version {version}: {e}")
+
+async def retrain_periodically():
+    """Run training.py in its own process every RETRAIN_INTERVAL_HOURS"""
+    while True:
+        await asyncio.sleep(RETRAIN_INTERVAL_HOURS * 3600)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "training.py",
+            "--registry", model_registry.root, "--data", DATA_PATH, "--history", HISTORY_PATH,
+            "--ingested", ingest_output_path(),
+        )
+        returncode = await process.wait()
+        if returncode == 0:
+            print("✅ Retraining published a new model version")
+        elif returncode != 2:
+            print(f"❌ Retraining failed (exit status {returncode})")
+
+def require_admin(http_request):
+    """Admin endpoints are closed unless MODEL_ADMIN_TOKEN is set and sent as X-Admin-Token"""
+    if not MODEL_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (MODEL_ADMIN_TOKEN is not set)")
+    token = http_request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), MODEL_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
 @app.get("/")
 async def root():
     return {
@@ -346,28 +1093,156 @@ async def root():
         }
     }
 
+@app.get("/health/live")
+async def liveness():
+    """The process is up and serving requests (resources may still be loading)"""
+    return {"status": "alive", "uptime_seconds": round(time.monotonic() - process_started, 1)}
+
+@app.get("/health/ready")
+async def readiness():
+    """Model and data are loaded and requests can be analyzed"""
+    ready = models_loaded()
+    body = {
+        "status": "ready" if ready else load_status["state"],
+        "error": load_status["error"],
+        "load_timings": load_status["timings"],
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
-        "status": "healthy",
+        "status": "healthy" if models_loaded() else load_status["state"],
         "model_loaded": model is not None,
         "feature_scaler_loaded": feature_scaler is not None,
         "target_scaler_loaded": target_scaler is not None,
-        "data_loaded": df is not None,
-        "data_records": len(df) if df is not None else 0
+        "data_loaded": store is not None,
+        "data_records": len(store) if store is not None else 0,
+        "model_version": model_version,
+        "worker_pid": os.getpid(),
+        "leader": leader_lock.held if leader_lock is not None else True,
+        "retention": retention.status() if retention is not None else None,
+        "upstreams": {name: upstream.status() for name, upstream in upstreams.items()}
     }
 
+def models_loaded():
+    return not (model is None or feature_scaler is None or target_scaler is None or store is None
+                or congestion_profile is None or inference_engine is None or forecast_scheduler is None)
+
+def require_models():
+    if models_loaded():
+        return
+    if load_status["state"] in ("starting", "loading", "preloaded"):
+        raise HTTPException(status_code=503, detail="Models are still loading")
+    raise HTTPException(status_code=500, detail="Models not loaded properly")
+
+def valid_path(path):
+    return path is None or all(len(point) == 2 for point in path)
+
+def match_route_bottlenecks(start_coords, end_coords, path=None):
+    """Bottlenecks a route passes, in order.
+
+    With a route polyline, every bottleneck within ROUTE_MATCH_RADIUS_KM of it;
+    otherwise the bottleneck nearest the start/end midpoint, if any is close.
+    """
+    if path:
+        return [name for name, _, _ in bottleneck_index.match_path(path, ROUTE_MATCH_RADIUS_KM)]
+    
+    route_midpoint = [(start_coords[0] + end_coords[0])/2, (start_coords[1] + end_coords[1])/2]
+    closest_bottleneck, _ = bottleneck_index.nearest(route_midpoint[0], route_midpoint[1], MAX_BOTTLENECK_DISTANCE_KM)
+    return [closest_bottleneck] if closest_bottleneck else []
+
+# A bottleneck whose latest observation is older than this makes responses degraded
+TRAFFIC_STALE_SECONDS = float(os.getenv("TRAFFIC_STALE_SECONDS", "900"))
+
+def freshness(bottleneck, weather_forecast):
+    """degraded / degraded_reasons / data_age for a response built now from these inputs"""
+    reasons = []
+    weather_seconds = None
+    snapshot = weather_service.snapshot
+    if weather_forecast is DEFAULT_WEATHER_FORECAST:
+        reasons.append("weather_unavailable")
+    elif snapshot is not None:
+        weather_seconds = int(snapshot.age())
+        if snapshot.age() >= weather_service.ttl:
+            reasons.append("weather_stale")
+    
+    traffic_seconds = None
+    latest = store.latest_timestamp(bottleneck) if bottleneck is not None else None
+    if latest is not None:
+        traffic_seconds = int((np.datetime64(datetime.now(), "ns") - latest) / np.timedelta64(1, "s"))
+        if traffic_seconds > TRAFFIC_STALE_SECONDS:
+            reasons.append("traffic_stale")
+    tomtom = upstreams.get("tomtom")
+    if tomtom is not None and tomtom.breaker.state != tomtom.breaker.CLOSED:
+        reasons.append("traffic_feed_unavailable")
+    
+    return {
+        "degraded": bool(reasons),
+        "degraded_reasons": reasons,
+        "data_age": {"traffic_seconds": traffic_seconds, "weather_seconds": weather_seconds},
+    }
+
+# Rendered without weather; each response adds the current weather block
+NO_BOTTLENECK_RESPONSE = CongestionResponse(
+    status="info",
+    message="No known bottlenecks near this route",
+    congestion_level="clear",
+    ai_recommendation="Route appears to avoid major congestion points"
+).model_dump(mode="json")
+
+def no_bottleneck_response(weather_forecast):
+    return {**NO_BOTTLENECK_RESPONSE, "weather_forecast": render_weather(weather_forecast),
+            **freshness(None, weather_forecast)}
+
+def weather_version():
+    snapshot = weather_service.snapshot
+    return snapshot.version if snapshot is not None else 0
+
+async def cached_analyze_bottleneck(bottleneck, weather_forecast, weather_version):
+    """analyze_bottleneck through the response cache.
+
+    Returns (the response as a JSON-ready dict, seconds it stays fresh): the
+    cache holds analyses already rendered, so hits build no models.
+    """
+    now = datetime.now()
+    key = (bottleneck, store.location_stamp(bottleneck), weather_version, inference_engine.version,
+           now.strftime("%Y-%m-%d %H"))
+    
+    body = response_cache.get(key)
+    if body is None:
+        body = (await analyze_bottleneck(bottleneck, weather_forecast)).model_dump(mode="json")
+        # Forecasts are per hour: never keep an entry past the end of its hour
+        seconds_left_in_hour = 3600 - (now.minute * 60 + now.second)
+        response_cache.set(key, body, ttl=min(response_cache.ttl, seconds_left_in_hour))
+    return body, int(response_cache.remaining_ttl(key))
+
+def with_cache_headers(http_request, body, max_age):
+    """JSON response for `body` with ETag/Cache-Control; a 304 if the client's copy is current"""
+    content = orjson.dumps(body)
+    # data_age ticks every second: the ETag covers everything else, so it is weak
+    etag = "W/" + etag_for(orjson.dumps({**body, "data_age": None}))
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content, media_type="application/json", headers=headers)
+
+@app.get("/congestion", response_model=CongestionResponse)
+async def analyze_congestion_get(start: str, end: str, http_request: Request):
+    """Same as POST /congestion, as a GET that browsers and proxies can cache"""
+    return await analyze_congestion(RouteRequest(start=start, end=end), http_request)
+
 # UPDATED: Renamed from /predict to /congestion to avoid conflicts
 @app.post("/congestion", response_model=CongestionResponse)
-async def analyze_congestion(request: RouteRequest):
+async def analyze_congestion(request: RouteRequest, http_request: Request):
     """Analyze congestion conditions for a route (does not predict travel time)"""
     
-    if model is None or feature_scaler is None or target_scaler is None or df is None:
-        raise HTTPException(status_code=500, detail="Models not loaded properly")
+    require_models()
     
     # Fetch weather forecast
-    weather_forecast = await get_weather_forecast()
+    with span("weather"):
+        weather_forecast = await get_weather_forecast()
     
     # Parse coordinates
     try:
@@ -375,53 +1250,34 @@ async def analyze_congestion(request: RouteRequest):
         end_coords = [float(x) for x in request.end.split(',')]
     except:
         raise HTTPException(status_code=400, detail="Invalid coordinate format")
+    if not valid_path(request.path):
+        raise HTTPException(status_code=400, detail="Invalid route path")
     
-    # Find nearest bottleneck to the route
-    def distance(coord1, coord2):
-        """Calculate simple distance between two coordinates"""
-        return ((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)**0.5
-    
-    # Bottleneck coordinates (approximate Lagos locations)
-    bottleneck_coords = {
-        "Third_Mainland_Bridge": [6.5000, 3.4025],
-        "Carter_Bridge": [6.4669, 3.3850],
-        "Eko_Bridge": [6.4641, 3.3803],
-        "CMS_Junction": [6.4500, 3.4000],
-        "Marina_Road": [6.4500, 3.4000],
-        "Obalende": [6.4447, 3.4175],
-        "Adeniji_Adele": [6.4743, 3.3904],
-        "Falomo_Roundabout": [6.4444, 3.4272],
-        "Awolowo_Road": [6.4419, 3.4190]
-    }
-    
-    # Find closest bottleneck to the route midpoint
-    route_midpoint = [(start_coords[0] + end_coords[0])/2, (start_coords[1] + end_coords[1])/2]
+    with span("route_match"):
+        route_bottlenecks = match_route_bottlenecks(start_coords, end_coords, request.path)
     
-    closest_bottleneck = None
-    min_distance = float('inf')
+    # If no bottleneck is reasonably close
+    if not route_bottlenecks:
+        return ORJSONResponse(no_bottleneck_response(weather_forecast))
     
-    for bottleneck_name, bottleneck_coord in bottleneck_coords.items():
-        dist = distance(route_midpoint, bottleneck_coord)
-        if dist < min_distance:
-            min_distance = dist
-            closest_bottleneck = bottleneck_name
+    # Detailed analysis for the first bottleneck on the route
+    with span("analysis"):
+        analysis, max_age = await cached_analyze_bottleneck(route_bottlenecks[0], weather_forecast, weather_version())
+    body = {**analysis, "route_bottlenecks": route_bottlenecks, **freshness(route_bottlenecks[0], weather_forecast)}
+    with span("serialize"):
+        return with_cache_headers(http_request, body, max_age)
+
+async def analyze_bottleneck(closest_bottleneck, weather_forecast):
+    """Congestion analysis for one bottleneck, shared by single and batch requests"""
     
-    # If no bottleneck is reasonably close
-    if min_distance > 0.1:
-        return CongestionResponse(
-            status="info",
-            message="No known bottlenecks near this route",
-            congestion_level="clear",
-            weather_forecast=weather_forecast,
-            ai_recommendation="Route appears to avoid major congestion points"
+    # Get recent data for the closest bottleneck, oldest first
+    with span("store_lookup"):
+        recent = store.latest_columns(
+            closest_bottleneck, WINDOW_SIZE,
+            FEATURES + ["current_travel_time", "free_flow_travel_time"]
         )
     
-    # Get recent data for the closest bottleneck
-    segment_data = df[df["collection_location"] == closest_bottleneck].sort_values(
-        by="timestamp", ascending=False
-    ).head(6)
-    
-    if len(segment_data) < 6:
+    if len(recent["free_flow_speed"]) < WINDOW_SIZE:
         return CongestionResponse(
             status="info",
             message=f"Limited data for bottleneck {closest_bottleneck}",
@@ -431,32 +1287,32 @@ async def analyze_congestion(request: RouteRequest):
         )
     
     try:
-        # Calculate current congestion ratio from recent data
-        latest_data = segment_data.iloc[0]
-        current_speed = latest_data.get('current_speed', 0)
-        free_flow_speed = latest_data.get('free_flow_speed', 1)
-        congestion_ratio = current_speed / free_flow_speed if free_flow_speed > 0 else 1
+        # Calculate current congestion ratio from the latest reading
+        latest = {name: values[-1:] for name, values in recent.items()}
+        congestion_ratio = float(flow_features(
+            latest["current_speed"], latest["free_flow_speed"],
+            latest["current_travel_time"], latest["free_flow_travel_time"]
+        )["congestion_ratio"][0])
+        
+        # `recent` views the live store, which ingestion may change while the model runs:
+        # take everything needed from it before awaiting
+        free_flow_travel_time = float(latest["free_flow_travel_time"][0])
         
-        # Determine base congestion level
-        if congestion_ratio >= 0.8:
-            base_congestion_level = "clear"
-        elif congestion_ratio >= 0.6:
-            base_congestion_level = "light"
-        elif congestion_ratio >= 0.4:
-            base_congestion_level = "moderate"
-        elif congestion_ratio >= 0.2:
-            base_congestion_level = "heavy"
+        # LSTM outlook: predicted next travel time relative to free flow
+        with span("feature_window"):
+            window = feature_matrix(recent, FEATURES)
+        with span("model"):
+            prediction_model_version = inference_engine.version
+            predicted_travel_time = await inference_engine.predict(window)
+        if predicted_travel_time > 0 and free_flow_travel_time > 0:
+            predicted_congestion_ratio = round(min(free_flow_travel_time / predicted_travel_time, 1.0), 2)
         else:
-            base_congestion_level = "severe"
+            predicted_congestion_ratio = None
         
-        # Adjust congestion level based on weather
+        # Determine base congestion level, then adjust it for the weather
+        base_congestion_level = congestion_level_for_ratio(congestion_ratio)
         current_weather_impact = weather_forecast.current_weather.weather_impact
-        if current_weather_impact == "severe" and base_congestion_level in ["clear", "light"]:
-            congestion_level = "moderate"
-        elif current_weather_impact == "moderate" and base_congestion_level == "clear":
-            congestion_level = "light"
-        else:
-            congestion_level = base_congestion_level
+        congestion_level = adjust_level_for_weather(base_congestion_level, current_weather_impact)
         
         # Determine status and message
         if congestion_level in ["heavy", "severe"] or current_weather_impact in ["moderate", "severe"]:
@@ -471,8 +1327,10 @@ async def analyze_congestion(request: RouteRequest):
             message = f"Traffic conditions near {closest_bottleneck}"
         
         # Generate hourly congestion forecast (no travel times)
-        current_hour = datetime.now().hour
-        hourly_patterns = predict_hourly_congestion(segment_data, current_hour)
+        now = datetime.now()
+        current_hour = now.hour
+        with span("hourly_forecast"):
+            hourly_patterns = current_hourly_patterns(closest_bottleneck, now)
 
         hourly_forecast = []
         high_congestion_hours = []
@@ -493,15 +1351,7 @@ async def analyze_congestion(request: RouteRequest):
             
             # Track high congestion hours
             if level in ["heavy", "severe"]:
-                hour_12 = target_hour if target_hour <= 12 else target_hour - 12
-                period = "AM" if target_hour < 12 else "PM"
-                if target_hour == 0:
-                    hour_12 = 12
-                    period = "AM"
-                elif target_hour == 12:
-                    hour_12 = 12
-                    period = "PM"
-                high_congestion_hours.append(f"{hour_12}:00 {period}")
+                high_congestion_hours.append(HOUR_LABELS[target_hour])
 
         # Generate forecast summary
         weather_note = ""
@@ -529,7 +1379,9 @@ async def analyze_congestion(request: RouteRequest):
             hourly_forecast=hourly_forecast,
             forecast_summary=forecast_summary,
             weather_forecast=weather_forecast,
-            ai_recommendation=ai_recommendation
+            ai_recommendation=ai_recommendation,
+            predicted_congestion_ratio=predicted_congestion_ratio,
+            model_version=prediction_model_version
         )
         
     except Exception as e:
@@ -554,6 +1406,419 @@ def generate_ai_recommendation(congestion_level, high_congestion_hours, weather_
         
     return " | ".join(recommendations) if recommendations else "No specific recommendations at this time"
 
+def parse_coordinate_array(values):
+    """Parse "lat,lon" strings in bulk; returns (N, 2) coordinates and a validity mask"""
+    parts = pd.Series(values, dtype=object).str.split(",", expand=True)
+    if parts.shape[1] < 2:
+        return np.full((len(values), 2), np.nan), np.zeros(len(values), dtype=bool)
+    numbers = parts.apply(pd.to_numeric, errors="coerce")
+    # Every part present must be a number, as with float() per part
+    valid = (numbers.notna() | parts.isna()).all(axis=1).to_numpy() & numbers.iloc[:, :2].notna().all(axis=1).to_numpy()
+    return numbers.iloc[:, :2].to_numpy(dtype=float), valid
+
+def find_closest_bottlenecks(start_coords, end_coords):
+    """Vectorised midpoint matching for (N, 2) start/end arrays: nearest names and km"""
+    midpoints = (start_coords + end_coords) / 2
+    locations = bottleneck_index.coords
+    distances = haversine_km(
+        midpoints[:, 0][:, None], midpoints[:, 1][:, None],
+        locations[:, 0][None, :], locations[:, 1][None, :],
+    )
+    closest = distances.argmin(axis=1)  # ties go to the first bottleneck
+    return [bottleneck_index.names[i] for i in closest], distances[np.arange(len(closest)), closest]
+
+async def analyze_bottleneck_or_error(bottleneck, weather_forecast, weather_version):
+    try:
+        body, _ = await cached_analyze_bottleneck(bottleneck, weather_forecast, weather_version)
+        return body
+    except HTTPException as e:
+        return CongestionResponse(status="error", message=e.detail, bottleneck_location=bottleneck).model_dump(mode="json")
+
+@app.post("/congestion/batch", response_model=BatchCongestionResponse)
+async def analyze_congestion_batch(request: BatchRouteRequest):
+    """Analyze many routes at once: weather is fetched once and each bottleneck is analyzed once"""
+    
+    require_models()
+    
+    with span("weather"):
+        weather_forecast = await get_weather_forecast()
+    current_weather_version = weather_version()
+    
+    start_coords, start_valid = parse_coordinate_array([route.start for route in request.routes])
+    end_coords, end_valid = parse_coordinate_array([route.end for route in request.routes])
+    valid = start_valid & end_valid & np.array([valid_path(route.path) for route in request.routes], dtype=bool)
+    
+    # Group routes by their bottleneck
+    groups = {}
+    results = [None] * len(request.routes)
+    invalid_response = CongestionResponse(status="error", message="Invalid coordinate format").model_dump(mode="json")
+    no_bottleneck = no_bottleneck_response(weather_forecast)
+    
+    route_bottlenecks = [[] for _ in request.routes]
+    
+    # Routes with a polyline are matched along it; the rest by midpoint, all at once
+    path_indices = [i for i in np.flatnonzero(valid) if request.routes[i].path]
+    for index in path_indices:
+        route_bottlenecks[index] = match_route_bottlenecks(None, None, request.routes[index].path)
+    midpoint_indices = np.array([i for i in np.flatnonzero(valid) if not request.routes[i].path], dtype=int)
+    if len(midpoint_indices):
+        bottlenecks, distances = find_closest_bottlenecks(start_coords[midpoint_indices], end_coords[midpoint_indices])
+        for index, bottleneck, dist in zip(midpoint_indices, bottlenecks, distances):
+            if dist <= MAX_BOTTLENECK_DISTANCE_KM:
+                route_bottlenecks[index] = [bottleneck]
+    
+    for index in np.flatnonzero(valid):
+        if route_bottlenecks[index]:
+            groups.setdefault(route_bottlenecks[index][0], []).append(int(index))
+        else:
+            results[index] = no_bottleneck
+    for index in np.flatnonzero(~valid):
+        results[index] = invalid_response
+    
+    async def analyze_group(bottleneck, indices):
+        result = await analyze_bottleneck_or_error(bottleneck, weather_forecast, current_weather_version)
+        return indices, {**result, **freshness(bottleneck, weather_forecast)}
+    
+    tasks = [asyncio.ensure_future(analyze_group(bottleneck, indices)) for bottleneck, indices in groups.items()]
+    
+    if request.stream:
+        async def stream_results():
+            # Routes that need no analysis first, then each bottleneck's routes as it completes
+            for index, result in enumerate(results):
+                if result is not None:
+                    yield json.dumps({"index": index, "result": result}) + "\n"
+            for task in asyncio.as_completed(tasks):
+                indices, result = await task
+                for index in indices:
+                    line = {**result, "route_bottlenecks": route_bottlenecks[index]}
+                    yield json.dumps({"index": index, "result": line}) + "\n"
+        
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+    
+    for indices, result in await asyncio.gather(*tasks):
+        for index in indices:
+            results[index] = {**result, "route_bottlenecks": route_bottlenecks[index]}
+    
+    return ORJSONResponse({"results": results, "bottlenecks_analyzed": len(groups)})
+
+route_timeline = None  # (inputs, RatioTimeline) last built for route ranking
+
+async def current_route_timeline():
+    """Forecast ratios of every bottleneck (in bottleneck_index order), rebuilt when the forecasts change"""
+    global route_timeline
+    start = datetime.now().replace(second=0, microsecond=0)
+    forecasts = []
+    for name in bottleneck_index.names:
+        # Out-of-date forecasts are still better than none while the scheduler catches up
+        forecast = forecast_scheduler.get(name) or forecast_scheduler.latest().get(name)
+        if forecast is None:
+            forecast = await compute_forecast(name, datetime.now())
+        forecasts.append(forecast)
+    
+    inputs = (start, store.version, tuple(forecast.generated_at for forecast in forecasts))
+    if route_timeline is None or route_timeline[0] != inputs:
+        current_ratios = []
+        for name in bottleneck_index.names:
+            latest = store.latest_columns(name, 1, ["congestion_ratio"])["congestion_ratio"]
+            current_ratios.append(float(latest[0]) if len(latest) else None)
+        timeline = RatioTimeline.from_forecasts(
+            start, forecasts, current_ratios, FORECAST_STEP_MINUTES, FORECAST_HORIZON_HOURS * 60
+        )
+        route_timeline = (inputs, timeline)
+    return route_timeline[1]
+
+def route_recommendation(ranked):
+    """Advice for the ranked routes (RankedRoute dicts, best first)"""
+    best = ranked[0]
+    if not best["bottlenecks"]:
+        return f"✅ Take {best['id']} - it avoids every monitored bottleneck"
+    
+    recommendations = []
+    if len(ranked) > 1 and ranked[-1]["congestion_score"] > best["congestion_score"]:
+        recommendations.append(f"🔀 Take {best['id']} - least congestion of {len(ranked)} routes")
+    worst = min(best["bottlenecks"], key=lambda crossing: crossing["predicted_congestion_ratio"])
+    if worst["predicted_congestion_level"] in ["heavy", "severe"]:
+        recommendations.append(
+            f"🚨 Expect {worst['predicted_congestion_level']} congestion at {worst['bottleneck_location']} "
+            f"about {round(worst['arrival_minutes'])} minutes in"
+        )
+    elif not recommendations:
+        recommendations.append(f"✅ {best['id']} is forecast to flow well")
+    return " | ".join(recommendations)
+
+@app.post("/routes/rank", response_model=RouteRankingResponse)
+async def rank_alternative_routes(request: RouteRankingRequest):
+    """Rank candidate routes by the forecast congestion at each bottleneck they cross, when they reach it"""
+    require_models()
+    
+    routes = request.routes
+    if not routes:
+        raise HTTPException(status_code=400, detail="No routes to rank")
+    if len(routes) > MAX_RANKED_ROUTES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_RANKED_ROUTES} routes can be ranked at once")
+    for route in routes:
+        if not route.path or not valid_path(route.path):
+            raise HTTPException(status_code=400, detail=f"Invalid path for route {route.id}")
+    
+    with span("forecasts"):
+        timeline = await current_route_timeline()
+    departure = local_time(request.departure or datetime.now())
+    departure_minutes = max((departure - timeline.start).total_seconds() / 60, 0.0)
+    
+    with span("route_match"):
+        paths = [route.path for route in routes]
+        route, bottleneck, _, along_km = bottleneck_index.match_paths(paths, ROUTE_MATCH_RADIUS_KM)
+        length_km = path_lengths_km(paths)
+    with span("scoring"):
+        scores = score_routes(len(routes), route, bottleneck, along_km, timeline, ROUTE_SPEED_KMH, departure_minutes)
+        order = rank_routes(scores["score"], length_km)
+    
+    # Crossings are grouped by route, in the order they are reached
+    bounds = np.searchsorted(route, np.arange(len(routes) + 1))
+    arrival = (scores["arrival_minutes"] - departure_minutes).round(1).tolist()
+    ratio = scores["congestion_ratio"]
+    crossing_ratio = ratio.round(2).tolist()
+    along = along_km.round(2).tolist()
+    names = [bottleneck_index.names[i] for i in bottleneck]
+    ranked = []
+    for rank, index in enumerate(order.tolist(), start=1):
+        worst = scores["worst"][index]
+        mean_ratio = scores["mean_congestion_ratio"][index]
+        ranked.append({
+            "id": routes[index].id,
+            "rank": rank,
+            "congestion_score": round(float(scores["score"][index]), 3),
+            "length_km": round(float(length_km[index]), 2),
+            "travel_minutes": round(float(length_km[index]) / ROUTE_SPEED_KMH * 60, 1),
+            "mean_congestion_ratio": None if np.isnan(mean_ratio) else round(float(mean_ratio), 2),
+            "worst_bottleneck": names[worst] if worst >= 0 else None,
+            "bottlenecks": [
+                {
+                    "bottleneck_location": names[i],
+                    "along_km": along[i],
+                    "arrival_minutes": arrival[i],
+                    "predicted_congestion_ratio": crossing_ratio[i],
+                    "predicted_congestion_level": congestion_level_for_ratio(ratio[i]),
+                }
+                for i in range(bounds[index], bounds[index + 1])
+            ],
+        })
+    
+    return ORJSONResponse({
+        "departure": departure.isoformat(),
+        "routes": ranked,
+        "recommendation": route_recommendation(ranked),
+    })
+
+forecast_bodies = {}  # location -> (BottleneckForecast, its JSON)
+
+def forecast_json(location, forecast):
+    """`forecast` as JSON, serialized once however many clients it is sent to"""
+    cached = forecast_bodies.get(location)
+    if cached is None or cached[0] is not forecast:
+        cached = forecast_bodies[location] = (forecast, forecast.model_dump_json())
+    return cached[1]
+
+@app.get("/forecast/stream")
+async def stream_forecasts(location: List[str] = Query(None)):
+    """Server-sent events: each bottleneck's forecast now, then again whenever it is recomputed"""
+    require_models()
+    wanted = set(location) if location else None
+    queue = forecast_scheduler.subscribe()
+    
+    def event(name, forecast):
+        return f"event: forecast\nid: {name}\ndata: {forecast_json(name, forecast)}\n\n"
+    
+    async def events():
+        try:
+            for name, forecast in forecast_scheduler.latest().items():
+                if wanted is None or name in wanted:
+                    yield event(name, forecast)
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    # Shutting down; EventSource clients reconnect to another worker
+                    return
+                name, forecast = item
+                if wanted is None or name in wanted:
+                    yield event(name, forecast)
+        finally:
+            forecast_scheduler.unsubscribe(queue)
+    
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/forecast/{location}", response_model=BottleneckForecast)
+async def get_forecast(location: str):
+    """Up to 24-hour congestion forecast for a bottleneck, from the precomputed snapshot"""
+    require_models()
+    if location not in BOTTLENECKS:
+        raise HTTPException(status_code=404, detail=f"Unknown bottleneck: {location}")
+    forecast = forecast_scheduler.get(location)
+    if forecast is None:
+        # Not computed yet, or out of date and the scheduler has been woken
+        forecast = await compute_forecast(location, datetime.now())
+    return Response(forecast_json(location, forecast), media_type="application/json")
+
+# Statistic name -> HistoryBucket fields
+HISTORY_STATS = {
+    "mean": ["mean_speed", "mean_delay_seconds", "mean_congestion_ratio"],
+    "p95": ["p95_delay_seconds"],
+    "max": ["max_delay_seconds", "min_congestion_ratio"],
+}
+HISTORY_MAX_PAGE_SIZE = 5000
+WORST_HOURS = 5
+
+def rounded_list(values):
+    """Values rounded to 2 places as a list, NaN -> None"""
+    return [None if value != value else value for value in np.round(values, 2).tolist()]
+
+def history_buckets(buckets, fields, lo, hi):
+    """JSON-ready HistoryBucket dicts for rows lo:hi of a rollup query (NaN -> None)"""
+    columns = {"start": np.datetime_as_string(buckets["start"][lo:hi], unit="s").tolist(),
+               "count": buckets["count"][lo:hi].tolist()}
+    for field in fields:
+        columns[field] = rounded_list(buckets[field][lo:hi])
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+def local_time(moment):
+    """Naive local time for a datetime: the data is stamped with the server's local clock"""
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone().replace(tzinfo=None)
+    return moment
+
+def history_heatmap(location, start, end):
+    """JSON-ready HistoryHeatmap dict"""
+    heatmap = history_rollups.heatmap(location, start, end)
+    ratio, delay, samples = heatmap["congestion_ratio"], heatmap["delay_seconds"], heatmap["samples"]
+    
+    # Lowest mean congestion_ratio first (1.0 is free flow), then longest delay
+    order = np.lexsort((-np.nan_to_num(delay.ravel()), ratio.ravel()))
+    order = [divmod(int(cell), 24) for cell in order if samples.flat[cell] > 0]
+    worst_hours = [
+        {
+            "day_of_week": day,
+            "hour": hour,
+            "congestion_ratio": round(float(ratio[day, hour]), 2),
+            "delay_seconds": None if np.isnan(delay[day, hour]) else round(float(delay[day, hour]), 2),
+            "samples": int(samples[day, hour]),
+        }
+        for day, hour in order[:WORST_HOURS]
+    ]
+    return {"congestion_ratio": [rounded_list(row) for row in ratio],
+            "delay_seconds": [rounded_list(row) for row in delay],
+            "samples": samples.tolist(), "worst_hours": worst_hours}
+
+@app.get("/history/{location}", response_model=HistoryResponse)
+async def get_history(
+    location: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: str = "hourly",
+    stats: List[str] = Query(["mean", "p95"]),
+    heatmap: bool = False,
+    limit: int = Query(500, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = "json",
+):
+    """Resampled speed, delay and congestion_ratio history for a location.
+    
+    Served from pre-aggregated rollups, a page of `limit` buckets at a time
+    (follow `next_cursor`), or as NDJSON with format=ndjson, which streams
+    every bucket in the range without building the whole response.
+    
+    Bucket fields appear only for the requested `stats`. Responses are built
+    as plain dicts: validating thousands of bucket models costs more than the
+    query itself.
+    """
+    require_models()
+    if location not in store:
+        raise HTTPException(status_code=404, detail=f"Unknown location: {location}")
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of: {', '.join(RESOLUTIONS)}")
+    unknown = [stat for stat in stats if stat not in HISTORY_STATS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown stats: {', '.join(unknown)} (use {', '.join(HISTORY_STATS)})")
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    fields = [field for stat in HISTORY_STATS if stat in stats for field in HISTORY_STATS[stat]]
+    # Offsets are honoured rather than the wall time read as local
+    start, end = local_time(start), local_time(end)
+    
+    if format == "ndjson":
+        buckets = history_rollups.query(location, resolution, start, end)
+        
+        def stream_buckets():
+            for lo in range(0, len(buckets["start"]), limit):
+                lines = history_buckets(buckets, fields, lo, lo + limit)
+                yield "".join(json.dumps(line) + "\n" for line in lines)
+        
+        return StreamingResponse(stream_buckets(), media_type="application/x-ndjson")
+    
+    page_start = start
+    if cursor is not None:
+        try:
+            page_start = local_time(datetime.fromisoformat(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    buckets = history_rollups.query(location, resolution, page_start, end)
+    
+    response = {
+        "location": location,
+        "resolution": resolution,
+        "buckets": history_buckets(buckets, fields, 0, limit),
+        "next_cursor": pd.Timestamp(buckets["start"][limit]).isoformat() if len(buckets["start"]) > limit else None,
+    }
+    if heatmap:
+        # Over the whole requested range, not just this page
+        response["heatmap"] = history_heatmap(location, start, end)
+    return ORJSONResponse(response)
+
+@app.get("/model")
+async def get_model_info():
+    """The model version being served and the versions available to roll back to"""
+    versions = model_registry.versions()
+    return {
+        "version": model_version,
+        "runtime": MODEL_RUNTIME,
+        "registry_current": model_registry.current(),
+        "versions": versions,
+        "metadata": model_registry.metadata(model_version) if model_version in versions else None,
+    }
+
+@app.post("/model/rollback")
+async def rollback_model(request: RollbackRequest, http_request: Request):
+    """Serve an earlier model version (by default the current one's parent)"""
+    require_admin(http_request)
+    require_models()
+    
+    target = request.version
+    if target is None:
+        if model_version not in model_registry.versions():
+            raise HTTPException(status_code=409, detail=f"No registry entry for {model_version} to roll back from")
+        target = model_registry.previous(model_version)
+    if target is None or target not in model_registry.versions():
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {target}")
+    
+    try:
+        await swap_model(target)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not load model version {target}: {e}")
+    # Only once it loads: point CURRENT at it too, so restarts and the other workers agree
+    model_registry.set_current(target)
+    return {"version": model_version}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/locations")
 async def get_available_locations():
     """Get list of available bottleneck locations"""
@@ -562,6 +1827,22 @@ async def get_available_locations():
         "message": "These are the bottleneck locations monitored by our AI system"
     }
 
+# PRELOAD_MODELS=1 loads the data and scalers at import time, for servers that
+# import the app once and then fork workers, e.g.
+#   PRELOAD_MODELS=1 gunicorn -k uvicorn.workers.UvicornWorker --preload -w 4 main:app
+# They are then shared copy-on-write between the workers. TensorFlow does not
+# survive a fork (a Keras model loaded before it hangs in the workers), so with
+# the keras runtime each worker loads the model after the fork; the numpy and
+# tflite runtimes are preloaded too.
+FORK_SAFE_RUNTIMES = ("numpy", "tflite", "tflite_quantized")
+if os.getenv("PRELOAD_MODELS") == "1":
+    load_resources(include_model=MODEL_RUNTIME in FORK_SAFE_RUNTIMES)
+    if load_status["state"] == "preloaded":
+        print(f"ℹ️  Data and scalers preloaded; each worker loads the {MODEL_RUNTIME} model after the fork")
+    # Move preloaded objects out of the GC's reach so collections don't un-share their pages
+    gc.freeze()
+
+# Development server (single process, auto-reload); see serve.py for production
 if __name__ == "__main__":
     print("🚀 Starting Lagos Traffic Congestion Intelligence API...")
     print("ℹ️  This API provides congestion warnings, not travel time calculations")
@@ -0,0 +1,251 @@
+"""Request instrumentation: timing spans, counters and a Prometheus endpoint.
+
+- `span("stage")` times a block into the `lagos_stage_seconds` histogram and
+  into the current request's trace, which is returned as a Server-Timing
+  header so a slow response shows where its time went.
+- `Counter`/`Histogram` live in the module-level `metrics` registry;
+  `metrics.render()` produces the Prometheus text exposition format.
+- `SamplingProfiler` (opt-in) samples every thread's Python stack while
+  requests are in flight and writes collapsed stacks for requests slower than
+  a threshold. The .folded files load directly into flamegraph.pl, speedscope
+  or inferno.
+
+No prometheus_client dependency: the exposition format is a few lines of text.
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter, deque
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Stage timings of the request being handled, as [(stage, seconds)]
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter, optionally labelled"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        for label_values, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally labelled"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += 1
+            entry[-1] += value
+
+    def count(self, *label_values):
+        entry = self._values.get(label_values)
+        return entry[-2] if entry else 0
+
+    def samples(self):
+        for label_values, entry in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, entry):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", _format_labels(self.labels + ("le",), label_values + (repr(bound),)), cumulative
+            yield f"{self.name}_bucket", _format_labels(self.labels + ("le",), label_values + ("+Inf",)), entry[-2]
+            yield f"{self.name}_count", _format_labels(self.labels, label_values), entry[-2]
+            yield f"{self.name}_sum", _format_labels(self.labels, label_values), round(entry[-1], 6)
+
+
+class Gauge:
+    """A value read from a callback at scrape time"""
+
+    def __init__(self, name, help, fn, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self):
+        value = self.fn()
+        if value is not None:
+            yield self.name, "", value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        # Re-registering returns the existing metric (e.g. on module reload)
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn, kind="gauge"):
+        """A value read from `fn` when scraped; kind="counter" for counts kept elsewhere"""
+        return self._register(Gauge(name, help, fn, kind))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+stage_seconds = metrics.histogram(
+    "lagos_stage_seconds", "Time spent in each stage of request handling", labels=("stage",)
+)
+
+
+@contextmanager
+def span(stage):
+    """Time a block as `stage`, in the stage histogram and the current request's trace"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.append((stage, elapsed))
+
+
+def start_trace():
+    """Begin collecting spans for the current request; returns the trace list"""
+    trace = []
+    current_trace.set(trace)
+    return trace
+
+
+def server_timing(trace):
+    """Server-Timing header value for a trace (durations in ms)"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in trace)
+
+
+class SamplingProfiler:
+    """Samples Python stacks of all threads while requests are in flight.
+
+    `request_started()`/`request_finished()` bracket each request; samples taken
+    during a request slower than `threshold_ms` are written as collapsed stacks
+    (`frame;frame;frame count` per line) to `out_dir`. With concurrent requests
+    the samples of overlapping requests are mixed: the dump shows what the
+    process was doing while the slow request was in flight.
+    """
+
+    def __init__(self, threshold_ms=500, interval_ms=5, out_dir="profiles", max_samples=20000):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.out_dir = out_dir
+        self.dumps = 0
+        self._samples = deque(maxlen=max_samples)  # (timestamp, collapsed stack)
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.out_dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def request_started(self):
+        with self._lock:
+            self._active += 1
+        self._wakeup.set()
+        return time.perf_counter()
+
+    def request_finished(self, started, name):
+        finished = time.perf_counter()
+        with self._lock:
+            self._active -= 1
+            if not self._active:
+                self._wakeup.clear()
+        if finished - started >= self.threshold:
+            self.dump(started, finished, name)
+
+    def dump(self, started, finished, name):
+        stacks = StackCounter(stack for ts, stack in list(self._samples) if started <= ts <= finished)
+        if not stacks:
+            return None
+        safe_name = "".join(c if c.isalnum() else "_" for c in name).strip("_")
+        path = os.path.join(
+            self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_name}-{int((finished - started) * 1000)}ms.folded"
+        )
+        with open(path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.dumps += 1
+        return path
+
+    def _run(self):
+        own_id = threading.get_ident()
+        thread_names = {}
+        while True:
+            self._wakeup.wait()
+            now = time.perf_counter()
+            for thread in threading.enumerate():
+                thread_names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self._samples.append((now, ";".join(reversed(stack))))
+            time.sleep(self.interval)
@@ -0,0 +1,111 @@
+"""Hour-of-week congestion profiles.
+
+A (location x day_of_week x hour) table of `congestion_ratio` statistics built
+from the full traffic history: sample count, sum (for the mean) and a
+fixed-bin histogram (for percentiles). Adding an observation only touches its
+own cell, so the table can be kept current as new rows arrive, and an hourly
+forecast is a table lookup instead of a DataFrame filter.
+"""
+import numpy as np
+import pandas as pd
+
+# congestion_ratio lives in [0, 1]; 5% bins are finer than the level thresholds
+RATIO_BINS = np.linspace(0.0, 1.0, 21)
+N_BINS = len(RATIO_BINS) - 1
+
+
+class CongestionProfile:
+    """Per-location, per-hour-of-week congestion_ratio aggregates"""
+
+    def __init__(self, locations=()):
+        self.locations = []
+        self._codes = {}
+        self.counts = np.zeros((0, 7, 24), dtype=np.int64)
+        self.sums = np.zeros((0, 7, 24), dtype=np.float64)
+        self.histograms = np.zeros((0, 7, 24, N_BINS), dtype=np.int64)
+        for location in locations:
+            self._code(location)
+
+    def _code(self, location):
+        code = self._codes.get(location)
+        if code is None:
+            code = self._codes[location] = len(self.locations)
+            self.locations.append(location)
+            self.counts = np.concatenate([self.counts, np.zeros((1, 7, 24), dtype=np.int64)])
+            self.sums = np.concatenate([self.sums, np.zeros((1, 7, 24))])
+            self.histograms = np.concatenate(
+                [self.histograms, np.zeros((1, 7, 24, N_BINS), dtype=np.int64)]
+            )
+        return code
+
+    @classmethod
+    def from_store(cls, store):
+        profile = cls()
+        for location, series in store.series.items():
+            timestamps = pd.DatetimeIndex(series.timestamps)
+            ratios = np.asarray(series.column("congestion_ratio"), dtype=np.float64)
+            known = ~np.isnan(ratios)
+            profile._add(
+                np.full(int(known.sum()), profile._code(location)),
+                timestamps.dayofweek.to_numpy()[known],
+                timestamps.hour.to_numpy()[known],
+                ratios[known],
+            )
+        return profile
+
+    def add(self, location, timestamp, congestion_ratio):
+        """Fold a single new observation into the table"""
+        if congestion_ratio is None or np.isnan(congestion_ratio):
+            return
+        timestamp = pd.Timestamp(timestamp)
+        self._add(
+            np.array([self._code(location)]),
+            np.array([timestamp.dayofweek]),
+            np.array([timestamp.hour]),
+            np.array([congestion_ratio], dtype=np.float64),
+        )
+
+    def _add(self, codes, days, hours, ratios):
+        bins = np.clip(np.searchsorted(RATIO_BINS, ratios, side="right") - 1, 0, N_BINS - 1)
+        np.add.at(self.counts, (codes, days, hours), 1)
+        np.add.at(self.sums, (codes, days, hours), ratios)
+        np.add.at(self.histograms, (codes, days, hours, bins), 1)
+
+    def lookup(self, location, hour, day_of_week=None):
+        """Stats for one cell, or for the hour across all days if day_of_week is None.
+
+        Returns a dict with `count`, `mean`, `p50` and `p90`; the statistics are
+        None when there are no samples.
+        """
+        code = self._codes.get(location)
+        if code is None:
+            return {"count": 0, "mean": None, "p50": None, "p90": None}
+
+        if day_of_week is None:
+            count = int(self.counts[code, :, hour].sum())
+            total = self.sums[code, :, hour].sum()
+            histogram = self.histograms[code, :, hour].sum(axis=0)
+        else:
+            count = int(self.counts[code, day_of_week, hour])
+            total = self.sums[code, day_of_week, hour]
+            histogram = self.histograms[code, day_of_week, hour]
+
+        if count == 0:
+            return {"count": 0, "mean": None, "p50": None, "p90": None}
+        return {
+            "count": count,
+            "mean": float(total / count),
+            "p50": _histogram_percentile(histogram, 0.5),
+            "p90": _histogram_percentile(histogram, 0.9),
+        }
+
+
+def _histogram_percentile(histogram, q):
+    """Percentile from binned counts, interpolating within the bin"""
+    cumulative = np.cumsum(histogram)
+    target = q * cumulative[-1]
+    index = int(np.searchsorted(cumulative, target, side="left"))
+    before = cumulative[index - 1] if index > 0 else 0
+    fraction = (target - before) / histogram[index] if histogram[index] else 0.0
+    width = RATIO_BINS[index + 1] - RATIO_BINS[index]
+    return float(RATIO_BINS[index] + fraction * width)
@@ -0,0 +1,105 @@
+"""Scoring and ranking alternative routes by forecast congestion.
+
+A route crosses some bottlenecks (`SpatialIndex.match_paths`), each at some
+distance along it. Leaving at the departure time and driving at a typical
+speed, it reaches each one at a known time, and the bottleneck contributes its
+forecast congestion (1 - congestion_ratio) *at that time*: a route that
+reaches a bridge after the evening peak has cleared scores better than one
+that reaches it during the peak. A route's score is the sum over the
+bottlenecks it crosses, so two moderately congested crossings can outweigh one
+heavy one; 0 means every crossing is forecast to flow freely.
+
+Forecasts are held as a (bottleneck x time step) ratio matrix, so all the
+crossings of all candidate routes are scored together: one gather with linear
+interpolation between steps, then per-route sums with bincount.
+"""
+import numpy as np
+
+# Representative congestion_ratio for forecasts that only give a level (typical patterns)
+LEVEL_RATIOS = {"clear": 0.9, "light": 0.7, "moderate": 0.5, "heavy": 0.3, "severe": 0.1}
+# Assumed when a bottleneck has no forecast at all
+UNKNOWN_RATIO = LEVEL_RATIOS["moderate"]
+
+
+class RatioTimeline:
+    """Forecast congestion_ratio of several bottlenecks every `step_minutes` from `start`"""
+
+    def __init__(self, start, step_minutes, ratios):
+        self.start = start
+        self.step = float(step_minutes)
+        self.ratios = np.asarray(ratios, dtype=np.float64).reshape(len(ratios), -1)
+
+    @classmethod
+    def from_forecasts(cls, start, forecasts, current_ratios, step_minutes, horizon_minutes):
+        """Resample BottleneckForecast intervals onto a common grid.
+
+        `forecasts` and `current_ratios` are per bottleneck (None where
+        missing); the current ratio anchors the timeline at `start`.
+        """
+        grid = np.arange(0, horizon_minutes + step_minutes, step_minutes, dtype=np.float64)
+        rows = []
+        for forecast, current in zip(forecasts, current_ratios):
+            minutes, ratios = [], []
+            if current is not None and not np.isnan(current):
+                minutes.append(0.0)
+                ratios.append(current)
+            for interval in forecast.intervals if forecast is not None else []:
+                ratio = interval.predicted_congestion_ratio
+                if ratio is None:
+                    ratio = LEVEL_RATIOS.get(interval.predicted_congestion_level, UNKNOWN_RATIO)
+                minutes.append((interval.time - start).total_seconds() / 60)
+                ratios.append(ratio)
+            if not minutes:
+                rows.append(np.full(len(grid), UNKNOWN_RATIO))
+                continue
+            # Beyond the last forecast the ratio is held
+            order = np.argsort(minutes, kind="stable")
+            rows.append(np.interp(grid, np.asarray(minutes)[order], np.asarray(ratios)[order]))
+        return cls(start, step_minutes, np.array(rows).reshape(len(rows), len(grid)))
+
+    def at(self, rows, minutes):
+        """congestion_ratio of bottleneck `rows[i]` at `minutes[i]` after start"""
+        position = np.clip(np.asarray(minutes, dtype=np.float64) / self.step, 0, self.ratios.shape[1] - 1)
+        lo = np.floor(position).astype(np.intp)
+        hi = np.minimum(lo + 1, self.ratios.shape[1] - 1)
+        fraction = position - lo
+        return (1 - fraction) * self.ratios[rows, lo] + fraction * self.ratios[rows, hi]
+
+
+def score_routes(n_routes, route, bottleneck, along_km, timeline, speed_kmh, departure_minutes=0.0):
+    """Score every crossing of every route at once.
+
+    `route`, `bottleneck` and `along_km` are flat arrays with one entry per
+    crossing (as from `SpatialIndex.match_paths`); `bottleneck` indexes the
+    timeline rows. Returns per-crossing arrival minutes and ratios, and per
+    route the score, crossing count, mean ratio and worst crossing (index into
+    the crossings, -1 for routes crossing none).
+    """
+    route = np.asarray(route, dtype=np.intp)
+    arrival = departure_minutes + np.asarray(along_km, dtype=np.float64) / speed_kmh * 60
+    ratio = timeline.at(np.asarray(bottleneck, dtype=np.intp), arrival)
+    congestion = 1.0 - ratio
+
+    score = np.bincount(route, weights=congestion, minlength=n_routes)
+    crossings = np.bincount(route, minlength=n_routes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_ratio = np.where(crossings > 0, np.bincount(route, weights=ratio, minlength=n_routes) / crossings, np.nan)
+
+    # Worst crossing per route: sort by (route, ratio) and take each route's first
+    worst = np.full(n_routes, -1, dtype=np.intp)
+    order = np.lexsort((ratio, route))
+    first = np.concatenate([[True], route[order][1:] != route[order][:-1]]) if len(order) else np.empty(0, dtype=bool)
+    worst[route[order][first]] = order[first]
+    return {
+        "arrival_minutes": arrival,
+        "congestion_ratio": ratio,
+        "score": score,
+        "crossings": crossings,
+        "mean_congestion_ratio": mean_ratio,
+        "worst": worst,
+    }
+
+
+def rank_routes(score, length_km):
+    """Route indices best first: least congestion, then shortest"""
+    return np.lexsort((np.asarray(length_km, dtype=np.float64), np.round(np.asarray(score, dtype=np.float64), 6)))
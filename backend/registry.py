@@ -0,0 +1,120 @@
+"""Versioned model bundles.
+
+A bundle is the LSTM plus the two scalers it was trained with, kept together
+so they can never be mixed up:
+
+    models/
+        CURRENT                     version being served
+        baseline/                   the original lstm_model.keras + scalers
+        20261018-052600/
+            model.keras
+            feature_scaler.pkl
+            target_scaler.pkl
+            model.tflite            optional exports for other runtimes (runtimes.py)
+            metadata.json           parent version, holdout metrics, data range
+
+Bundles are written to a temporary directory and renamed into place, and
+CURRENT is replaced atomically, so a reader never sees a partial bundle. The
+serving process watches CURRENT and hot-swaps whichever version it names;
+rolling back is pointing CURRENT at an older version.
+"""
+import json
+import os
+import shutil
+import time
+
+BUNDLE_FILES = {
+    "model": "model.keras",
+    "feature_scaler": "feature_scaler.pkl",
+    "target_scaler": "target_scaler.pkl",
+    # Optional; named as runtimes.runtime_path names them
+    "tflite": "model.tflite",
+    "tflite_quantized": "model.quant.tflite",
+}
+BASELINE = "baseline"
+CURRENT = "CURRENT"
+METADATA = "metadata.json"
+
+
+class ModelRegistry:
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, version, name=None):
+        directory = os.path.join(self.root, version)
+        return os.path.join(directory, BUNDLE_FILES[name]) if name else directory
+
+    def paths(self, version):
+        """{"model": path, "feature_scaler": path, "target_scaler": path, ...}"""
+        return {name: self.path(version, name) for name in BUNDLE_FILES}
+
+    def versions(self):
+        """Names of the published versions, sorted"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            version for version in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, version, METADATA))
+        )
+
+    def metadata(self, version):
+        with open(os.path.join(self.root, version, METADATA)) as f:
+            return json.load(f)
+
+    def current(self):
+        """The version to serve, or None if the registry is empty"""
+        try:
+            with open(os.path.join(self.root, CURRENT)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current_stamp(self):
+        """Changes whenever CURRENT is replaced (cheap to poll)"""
+        try:
+            return os.stat(os.path.join(self.root, CURRENT)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def set_current(self, version):
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version: {version}")
+        tmp_path = os.path.join(self.root, CURRENT + ".tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version + "\n")
+        os.replace(tmp_path, os.path.join(self.root, CURRENT))
+
+    def publish(self, version, files, metadata):
+        """Copy {name: source path} into a new bundle directory, atomically"""
+        if version in self.versions():
+            raise ValueError(f"Model version already exists: {version}")
+        os.makedirs(self.root, exist_ok=True)
+        staging = os.path.join(self.root, f".{version}.tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name, source in files.items():
+            shutil.copy2(source, os.path.join(staging, BUNDLE_FILES[name]))
+        metadata = {"version": version, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **metadata}
+        with open(os.path.join(staging, METADATA), "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(staging, self.path(version))
+        return self.path(version)
+
+    def ensure_baseline(self, model_path, feature_scaler_path, target_scaler_path):
+        """Register the original model files as the "baseline" version (once)"""
+        if BASELINE not in self.versions():
+            self.publish(
+                BASELINE,
+                {"model": model_path, "feature_scaler": feature_scaler_path, "target_scaler": target_scaler_path},
+                {"parent": None, "source": os.path.abspath(model_path)},
+            )
+        if self.current() is None:
+            self.set_current(BASELINE)
+
+    def previous(self, version):
+        """The version `version` was trained from, for rollback"""
+        return self.metadata(version).get("parent")
+
+
+def new_version():
+    return time.strftime("%Y%m%d-%H%M%S")
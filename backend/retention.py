@@ -0,0 +1,81 @@
+"""Retention of raw traffic observations.
+
+Serving needs the latest few readings per location and hour-level
+aggregates, not every row ever ingested. `Retention` keeps each location's
+raw rows for a window (say 30 days) and forgets older ones once their
+history rollups are up to date, so a long-running server ingesting live
+data holds a bounded amount of it:
+
+- raw rows: the window plus up to one `align` period, in each series'
+  arrays, which are compacted in place and so stop growing
+- rollups: 5-minute and hourly tables trimmed to their own horizons
+  (HistoryRollups.compact), daily ones kept whole
+- hour-of-week congestion profiles: fixed size, built incrementally, so
+  `predict_hourly_congestion` still sees the whole history
+
+Rows are dropped a whole `align` period (a day by default) at a time, on a
+boundary every rollup resolution divides, so a rollup bucket is never left
+with only part of its raw rows. Checking is cheap (one comparison per new
+row); trimming happens about once per period per location.
+
+However old they are, the newest `min_rows` rows of a location are always
+kept, so the model still has a full input window. The first live row after
+an old history then drops the history's rows one by one as new ones
+arrive, instead of all of them at once. Buckets trimmed part-way keep the
+rollup row they had (see HistoryRollups._refresh).
+"""
+import numpy as np
+
+from store import TIMESTAMP
+
+DAY = np.timedelta64(1, "D")
+
+
+class Retention:
+    """Keeps each location's raw rows to a window, folding older ones into the rollups first"""
+
+    def __init__(self, store, rollups, window, align=DAY, min_rows=0):
+        self.store = store
+        self.rollups = rollups
+        self.window = np.timedelta64(window, "ns")
+        self.align = np.timedelta64(align, "ns")
+        self.min_rows = min_rows
+        self.dropped = 0
+
+    def boundary(self, location):
+        """Rows older than this are dropped: the window back from the newest row, floored to
+        `align`, or earlier if the window holds fewer than `min_rows` rows"""
+        series = self.store.series.get(location)
+        if series is None or not series.size:
+            return None
+        cutoff = (np.datetime64(series.last_timestamp(), "ns") - self.window).astype(np.int64)
+        step = self.align.astype(np.int64)
+        boundary = np.datetime64(int(cutoff - cutoff % step), "ns")
+        if self.min_rows:
+            # The oldest of the newest `min_rows` rows stays
+            boundary = min(boundary, series.column(TIMESTAMP, max(series.size - self.min_rows, 0))[0])
+        return boundary
+
+    def enforce(self, location):
+        """Drop a location's rows older than its boundary; returns how many"""
+        series = self.store.series.get(location)
+        if series is None or not series.size:
+            return 0
+        boundary = self.boundary(location)
+        if series.first_timestamp() >= boundary:
+            return 0
+        # The rollups must have seen every row before it goes
+        self.rollups.compact(location)
+        dropped = self.store.drop_before(location, boundary)
+        self.dropped += dropped
+        return dropped
+
+    def enforce_all(self):
+        """Trim every location (e.g. after loading the history); returns the rows dropped"""
+        return sum(self.enforce(location) for location in self.store.locations)
+
+    def status(self):
+        return {
+            "window_days": round(float(self.window / DAY), 2),
+            "rows_dropped": self.dropped,
+        }
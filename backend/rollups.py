@@ -0,0 +1,225 @@
+"""Pre-aggregated rollups of the traffic history, for analytics queries.
+
+For every location and resolution (5-minute, hourly, daily) a table with one
+row per time bucket: sample counts, mean speed / delay / congestion_ratio,
+p95 and max delay, and the worst (lowest) congestion_ratio. A location's rows
+are sorted by time in the store, so each bucket is a contiguous run of rows
+and the whole table is built with a few vectorised reductions.
+
+Queries slice these tables with a binary search on the bucket start: a month
+of hourly history is 720 rows however many observations it holds, and no
+DataFrame of raw rows is ever built. New observations mark their location
+stale from their timestamp on; the next query recomputes only the buckets
+from there, normally just the last one.
+
+When retention trims a location's raw rows (see retention.py), its tables
+are brought up to date first and outlive them: a bucket's row stays as it
+was when its raw rows were dropped. Tables are in turn trimmed to a horizon
+per resolution (`compact`), so 5-minute detail is kept for months and daily
+rows for good.
+
+Percentiles use the nearest-rank method over the bucket's raw values.
+"""
+import numpy as np
+import pandas as pd
+
+RESOLUTIONS = {
+    "5min": np.timedelta64(5, "m"),
+    "hourly": np.timedelta64(1, "h"),
+    "daily": np.timedelta64(1, "D"),
+}
+COLUMNS = [
+    "start", "count", "delay_count",
+    "mean_speed", "mean_delay_seconds", "mean_congestion_ratio",
+    "p95_delay_seconds", "max_delay_seconds", "min_congestion_ratio",
+]
+SOURCE_COLUMNS = ["timestamp", "current_speed", "delay_seconds", "congestion_ratio"]
+
+
+def _floor(nanoseconds, step):
+    """Bucket starts (int ns) for int ns timestamps"""
+    step_ns = step.astype("timedelta64[ns]").astype(np.int64)
+    return nanoseconds - nanoseconds % step_ns
+
+
+def _bucket_start(timestamp, step):
+    return np.datetime64(int(_floor(np.datetime64(timestamp, "ns").astype(np.int64), step)), "ns")
+
+
+def _empty_table():
+    table = {name: np.empty(0, dtype=np.float64) for name in COLUMNS}
+    table["start"] = np.empty(0, dtype="datetime64[ns]")
+    table["count"] = np.empty(0, dtype=np.int64)
+    table["delay_count"] = np.empty(0, dtype=np.int64)
+    return table
+
+
+def _mean(values, starts):
+    """Per-bucket mean of the non-NaN values (NaN for buckets without any)"""
+    known = ~np.isnan(values)
+    totals = np.add.reduceat(np.where(known, values, 0.0), starts)
+    counts = np.add.reduceat(known.astype(np.int64), starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan), counts
+
+
+def _percentile(values, bucket_ids, n_buckets, q):
+    """Per-bucket nearest-rank percentile of the non-NaN values"""
+    known = ~np.isnan(values)
+    values, bucket_ids = values[known], bucket_ids[known]
+    result = np.full(n_buckets, np.nan)
+    if not len(values):
+        return result
+    order = np.lexsort((values, bucket_ids))
+    values, bucket_ids = values[order], bucket_ids[order]
+    counts = np.bincount(bucket_ids, minlength=n_buckets)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    has_values = counts > 0
+    ranks = np.ceil(q * counts[has_values]).astype(np.int64) - 1
+    result[has_values] = values[offsets[has_values] + np.maximum(ranks, 0)]
+    return result
+
+
+def aggregate(columns, step):
+    """Rollup table ({column: array}) for time-sorted rows given as {column: array}"""
+    timestamps = np.asarray(columns["timestamp"]).astype("datetime64[ns]")
+    if not len(timestamps):
+        return _empty_table()
+    buckets = _floor(timestamps.astype(np.int64), step)
+
+    starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    counts = np.diff(np.append(starts, len(buckets)))
+    bucket_ids = np.repeat(np.arange(len(starts)), counts)
+
+    speed = np.asarray(columns["current_speed"], dtype=np.float64)
+    delay = np.asarray(columns["delay_seconds"], dtype=np.float64)
+    ratio = np.asarray(columns["congestion_ratio"], dtype=np.float64)
+    mean_delay, delay_counts = _mean(delay, starts)
+    with np.errstate(invalid="ignore"):
+        return {
+            "start": buckets[starts].astype("datetime64[ns]"),
+            "count": counts.astype(np.int64),
+            "delay_count": delay_counts,
+            "mean_speed": _mean(speed, starts)[0],
+            "mean_delay_seconds": mean_delay,
+            "mean_congestion_ratio": _mean(ratio, starts)[0],
+            "p95_delay_seconds": _percentile(delay, bucket_ids, len(starts), 0.95),
+            # fmax/fmin skip NaN; an all-NaN bucket stays NaN
+            "max_delay_seconds": np.fmax.reduceat(delay, starts),
+            "min_congestion_ratio": np.fmin.reduceat(ratio, starts),
+        }
+
+
+class HistoryRollups:
+    """Rollup tables for every location of a TrafficStore, kept current as rows arrive"""
+
+    def __init__(self, store, horizons=None):
+        self.store = store
+        # resolution -> how far back from a table's newest bucket `compact` keeps rows (None: forever)
+        self.horizons = dict(horizons or {})
+        self._tables = {}  # (location, resolution) -> table
+        self._stale = {}   # location -> earliest timestamp added since its tables were built
+
+    @classmethod
+    def from_store(cls, store, horizons=None):
+        rollups = cls(store, horizons)
+        for location in store.locations:
+            for resolution in RESOLUTIONS:
+                rollups.table(location, resolution)
+        return rollups
+
+    def add(self, location, timestamp):
+        """Note a new observation; affected buckets are recomputed on the next query"""
+        timestamp = np.datetime64(pd.Timestamp(timestamp), "ns")
+        stale = self._stale.get(location)
+        self._stale[location] = timestamp if stale is None else min(stale, timestamp)
+
+    def _build(self, location, resolution, since=None):
+        series = self.store.series.get(location)
+        if series is None:
+            return _empty_table()
+        first = 0
+        if since is not None:
+            first = series.search(np.datetime64(since, "ns"), side="left")
+        columns = {name: series.column(name, first) for name in SOURCE_COLUMNS}
+        return aggregate(columns, RESOLUTIONS[resolution])
+
+    def _refresh(self, location):
+        stale = self._stale.pop(location)
+        for resolution, step in RESOLUTIONS.items():
+            table = self._tables.get((location, resolution))
+            if table is None:
+                continue
+            # Recompute from the start of the bucket holding the oldest new row
+            since = _bucket_start(stale, step)
+            series = self.store.series.get(location)
+            if series is not None and series.dropped_before is not None and since < series.dropped_before:
+                # Buckets whose raw rows were dropped keep their rows (late rows that old aren't counted)
+                since = _bucket_start(series.dropped_before - np.timedelta64(1, "ns"), step) + step
+            keep = int(np.searchsorted(table["start"], since, side="left"))
+            fresh = self._build(location, resolution, since)
+            self._tables[(location, resolution)] = {
+                name: np.concatenate([table[name][:keep], fresh[name]]) for name in COLUMNS
+            }
+
+    def compact(self, location):
+        """Bring a location's tables up to date and drop rows older than each resolution's horizon.
+
+        Called before the location's raw rows are trimmed.
+        """
+        if location in self._stale:
+            self._refresh(location)
+        for resolution, horizon in self.horizons.items():
+            table = self._tables.get((location, resolution))
+            if horizon is None or table is None or not len(table["start"]):
+                continue
+            first = int(np.searchsorted(table["start"], table["start"][-1] - horizon, side="left"))
+            if first:
+                # Copies, so the dropped rows' memory is freed
+                self._tables[(location, resolution)] = {name: values[first:].copy() for name, values in table.items()}
+
+    def table(self, location, resolution):
+        """The full rollup table for a location at a resolution"""
+        if location in self._stale:
+            self._refresh(location)
+        table = self._tables.get((location, resolution))
+        if table is None:
+            table = self._tables[(location, resolution)] = self._build(location, resolution)
+        return table
+
+    def query(self, location, resolution, start=None, end=None):
+        """Buckets overlapping [start, end), as {column: array view}"""
+        table = self.table(location, resolution)
+        if start is not None:
+            # The bucket containing `start` is included whole
+            start = _bucket_start(start, RESOLUTIONS[resolution])
+        lo = 0 if start is None else int(np.searchsorted(table["start"], start, side="left"))
+        hi = len(table["start"]) if end is None else int(
+            np.searchsorted(table["start"], np.datetime64(end, "ns"), side="left")
+        )
+        return {name: values[lo:hi] for name, values in table.items()}
+
+    def heatmap(self, location, start=None, end=None):
+        """(day_of_week x hour) mean congestion_ratio, mean delay and sample counts over a range"""
+        buckets = self.query(location, "hourly", start, end)
+        index = pd.DatetimeIndex(buckets["start"])
+        cells = (index.dayofweek.to_numpy(), index.hour.to_numpy())
+
+        # Bucket means weighted by their sample counts
+        ratio_known = ~np.isnan(buckets["mean_congestion_ratio"])
+        samples = np.zeros((7, 24), dtype=np.int64)
+        ratio_samples = np.zeros((7, 24), dtype=np.int64)
+        delay_samples = np.zeros((7, 24), dtype=np.int64)
+        ratio_sums = np.zeros((7, 24))
+        delay_sums = np.zeros((7, 24))
+        np.add.at(samples, cells, buckets["count"])
+        np.add.at(ratio_samples, cells, np.where(ratio_known, buckets["count"], 0))
+        np.add.at(delay_samples, cells, buckets["delay_count"])
+        np.add.at(ratio_sums, cells, np.nan_to_num(buckets["mean_congestion_ratio"]) * buckets["count"])
+        np.add.at(delay_sums, cells, np.nan_to_num(buckets["mean_delay_seconds"]) * buckets["delay_count"])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return {
+                "congestion_ratio": np.where(ratio_samples > 0, ratio_sums / ratio_samples, np.nan),
+                "delay_seconds": np.where(delay_samples > 0, delay_sums / delay_samples, np.nan),
+                "samples": samples,
+            }
@@ -0,0 +1,334 @@
+"""Runtimes for serving the LSTM without (or with) TensorFlow.
+
+The model is small (two LSTM layers and a Dense head, ~400KB), but loading it
+with Keras pulls in all of TensorFlow. Every runtime here exposes the same
+predictor interface, `predict_on_batch(scaled)` on a (batch, WINDOW_SIZE,
+n_features) float32 array returning (batch, 1), so InferenceEngine serves any
+of them unchanged:
+
+- "keras"             the saved model, via TensorFlow (the default)
+- "numpy"             a NumPy forward pass over the weights in the .keras
+                      file, read with h5py; needs nothing else installed
+- "tflite"            the model exported to TFLite (model.tflite)
+- "tflite_quantized"  the same with dynamic-range int8 weights
+                      (model.quant.tflite); smaller and faster, less exact
+
+Serving picks one with MODEL_RUNTIME. The TFLite files are exported next to
+the model they were converted from, and must be exported (with TensorFlow)
+before they can be served:
+
+    python runtimes.py export --quantize          # registry's current bundle
+    python runtimes.py check                      # parity against Keras
+
+`check` runs every available runtime on windows from the traffic history and
+reports the largest difference from Keras in seconds of travel time.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+
+import numpy as np
+
+RUNTIMES = ["keras", "numpy", "tflite", "tflite_quantized"]
+# Artifact of each runtime, named after the .keras model it was exported from
+RUNTIME_SUFFIXES = {
+    "keras": ".keras",
+    "numpy": ".keras",
+    "tflite": ".tflite",
+    "tflite_quantized": ".quant.tflite",
+}
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+}
+
+
+def runtime_path(model_path, runtime):
+    """The file a runtime serves for the .keras model at `model_path`"""
+    if runtime not in RUNTIME_SUFFIXES:
+        raise ValueError(f"Unknown model runtime: {runtime} (expected one of {', '.join(RUNTIMES)})")
+    return os.path.splitext(model_path)[0] + RUNTIME_SUFFIXES[runtime]
+
+
+class KerasPredictor:
+    def __init__(self, path):
+        from inference import import_keras_loader
+        self.runtime = "keras"
+        self.model = import_keras_loader()(path)
+
+    def predict_on_batch(self, scaled):
+        return np.asarray(self.model.predict_on_batch(scaled))
+
+
+def _snake_case(name):
+    return "".join("_" + c.lower() if c.isupper() and i and not name[i - 1].isupper() else c.lower()
+                   for i, c in enumerate(name))
+
+
+def read_keras_layers(path):
+    """[(class name, config, [weights])] of a Sequential .keras file, without TensorFlow"""
+    import h5py
+
+    with zipfile.ZipFile(path) as archive:
+        config = json.loads(archive.read("config.json"))
+        weights_file = io.BytesIO(archive.read("model.weights.h5"))
+    if config.get("class_name") != "Sequential":
+        raise ValueError(f"Only Sequential models are supported, not {config.get('class_name')}")
+
+    layers = []
+    seen = {}
+    with h5py.File(weights_file, "r") as weights:
+        for layer in config["config"]["layers"]:
+            if layer["class_name"] == "InputLayer":
+                continue
+            # Weights are stored per layer under its class name, numbered in order
+            base = _snake_case(layer["class_name"])
+            key = base if base not in seen else f"{base}_{seen[base]}"
+            seen[base] = seen.get(base, 0) + 1
+            group = weights.get(f"layers/{key}")
+            variables = []
+            if group is not None:
+                group = group["cell/vars"] if "cell" in group else group["vars"]
+                variables = [group[str(i)][()] for i in range(len(group))]
+            layers.append((layer["class_name"], layer["config"], variables))
+    return layers
+
+
+class NumpyPredictor:
+    """The LSTM forward pass in NumPy (inference only: dropout is a no-op)"""
+
+    def __init__(self, path):
+        self.runtime = "numpy"
+        self.layers = []
+        for class_name, config, variables in read_keras_layers(path):
+            if class_name == "Dropout":
+                continue
+            if class_name not in ("LSTM", "Dense"):
+                raise ValueError(f"The numpy runtime does not support {class_name} layers")
+            if class_name == "LSTM" and (config.get("go_backwards") or config.get("stateful")):
+                raise ValueError("The numpy runtime only supports forward, stateless LSTMs")
+            if not config.get("use_bias", True):
+                units = variables[0].shape[1]
+                variables.append(np.zeros(units, dtype=np.float32))
+            self.layers.append((class_name, config, [v.astype(np.float32) for v in variables]))
+
+    @staticmethod
+    def _lstm(x, config, kernel, recurrent_kernel, bias):
+        activation = ACTIVATIONS[config["activation"]]
+        recurrent_activation = ACTIVATIONS[config["recurrent_activation"]]
+        batch_size, steps, _ = x.shape
+        units = recurrent_kernel.shape[0]
+
+        # Input projections for every step at once; only the recurrence is sequential
+        projected = x @ kernel + bias
+        h = np.zeros((batch_size, units), dtype=np.float32)
+        c = np.zeros((batch_size, units), dtype=np.float32)
+        outputs = []
+        for t in range(steps):
+            z = projected[:, t] + h @ recurrent_kernel
+            # Keras gate order: input, forget, cell, output
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            g = activation(z[:, 2 * units:3 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * activation(c)
+            outputs.append(h)
+        return np.stack(outputs, axis=1) if config["return_sequences"] else h
+
+    def predict_on_batch(self, scaled):
+        x = np.asarray(scaled, dtype=np.float32)
+        for class_name, config, variables in self.layers:
+            if class_name == "LSTM":
+                x = self._lstm(x, config, *variables)
+            else:
+                kernel, bias = variables
+                x = ACTIVATIONS[config["activation"]](x @ kernel + bias)
+        return x
+
+
+def import_tflite_interpreter():
+    """The standalone TFLite interpreter if installed, else TensorFlow's"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLitePredictor:
+    def __init__(self, path, runtime="tflite"):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; export it with: python runtimes.py export")
+        self.runtime = runtime
+        self.interpreter = import_tflite_interpreter()(model_path=path)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.batch_size = None
+        # An interpreter holds its tensors; one batch at a time
+        self._lock = threading.Lock()
+
+    def predict_on_batch(self, scaled):
+        scaled = np.ascontiguousarray(scaled, dtype=np.float32)
+        with self._lock:
+            # Reallocating is only needed when the batch size changes
+            if scaled.shape[0] != self.batch_size:
+                self.interpreter.resize_tensor_input(self.input_index, scaled.shape)
+                self.interpreter.allocate_tensors()
+                self.batch_size = scaled.shape[0]
+            self.interpreter.set_tensor(self.input_index, scaled)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self.output_index).copy()
+
+
+def load_predictor(model_path, runtime="keras"):
+    """A predictor for the .keras model at `model_path` on the given runtime"""
+    path = runtime_path(model_path, runtime)
+    if runtime == "keras":
+        return KerasPredictor(path)
+    if runtime == "numpy":
+        return NumpyPredictor(path)
+    return TFLitePredictor(path, runtime)
+
+
+def export_tflite(model_path, quantize=False):
+    """Convert a .keras model to TFLite next to it; returns the written paths"""
+    import tensorflow as tf
+    from inference import import_keras_loader
+
+    model = import_keras_loader()(model_path)
+    # Unrolled over the fixed window the LSTMs lower to builtin TFLite ops,
+    # keeping the batch dimension dynamic
+    config = model.get_config()
+    for layer in config["layers"]:
+        if layer["class_name"] == "LSTM":
+            layer["config"]["unroll"] = True
+    unrolled = tf.keras.Sequential.from_config(config)
+    unrolled.set_weights(model.get_weights())
+
+    written = []
+    for runtime in ["tflite", "tflite_quantized"] if quantize else ["tflite"]:
+        converter = tf.lite.TFLiteConverter.from_keras_model(unrolled)
+        if runtime == "tflite_quantized":
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        path = runtime_path(model_path, runtime)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(converter.convert())
+        os.replace(tmp_path, path)
+        written.append(path)
+    return written
+
+
+def resolve_bundle(args):
+    """(model, feature scaler, target scaler) paths named by the command line"""
+    if args.model:
+        return args.model, args.feature_scaler, args.target_scaler
+    from registry import ModelRegistry
+    registry = ModelRegistry(args.registry)
+    version = args.version or registry.current()
+    if version is None:
+        return "lstm_model.keras", args.feature_scaler, args.target_scaler
+    paths = registry.paths(version)
+    return paths["model"], paths["feature_scaler"], paths["target_scaler"]
+
+
+def check_parity(model_path, feature_scaler_path, target_scaler_path, data_path, history_path,
+                 samples=2048, batch_size=64):
+    """{runtime: report} comparing each runtime's predictions with Keras"""
+    import joblib
+    from training import build_dataset, load_store, scale_windows
+
+    feature_scaler = joblib.load(feature_scaler_path)
+    target_scaler = joblib.load(target_scaler_path)
+    X, _, _ = build_dataset(load_store(data_path, history_path))
+    if len(X) > samples:
+        X = X[np.random.default_rng(0).choice(len(X), samples, replace=False)]
+    scaled = scale_windows(feature_scaler, X)
+    batches = [scaled[i:i + batch_size] for i in range(0, len(scaled), batch_size)]
+
+    def run(predictor):
+        predictor.predict_on_batch(batches[0])  # warm-up
+        started = time.perf_counter()
+        predictions = np.concatenate([predictor.predict_on_batch(batch) for batch in batches]).reshape(-1, 1)
+        return predictions, (time.perf_counter() - started) / len(batches) * 1000
+
+    reference, reference_ms = run(load_predictor(model_path, "keras"))
+    reference_seconds = target_scaler.inverse_transform(reference).ravel()
+    reports = {"keras": {"windows": len(scaled), "ms_per_batch": round(reference_ms, 3)}}
+    for runtime in RUNTIMES[1:]:
+        try:
+            predictor = load_predictor(model_path, runtime)
+        except FileNotFoundError as e:
+            reports[runtime] = {"error": str(e)}
+            continue
+        predictions, ms = run(predictor)
+        error = np.abs(target_scaler.inverse_transform(predictions).ravel() - reference_seconds)
+        reports[runtime] = {
+            "max_abs_error_scaled": float(np.max(np.abs(predictions - reference))),
+            "max_abs_error_seconds": float(np.max(error)),
+            "mean_abs_error_seconds": float(np.mean(error)),
+            "ms_per_batch": round(ms, 3),
+            "size_kb": round(os.path.getsize(runtime_path(model_path, runtime)) / 1024, 1),
+        }
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the LSTM to other runtimes and check their parity")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--registry", default=os.getenv("MODEL_REGISTRY", "models"))
+    parser.add_argument("--version", help="Registry version (default: CURRENT)")
+    parser.add_argument("--model", help="A .keras file to use instead of the registry")
+    parser.add_argument("--feature-scaler", default="feature_scaler.pkl")
+    parser.add_argument("--target-scaler", default="target_scaler.pkl")
+    parser.add_argument("--quantize", action="store_true", help="Also export a dynamic-range quantized model")
+    parser.add_argument("--data", default="combined.csv")
+    parser.add_argument("--history", default=os.getenv("HISTORY_PATH", "history"))
+    parser.add_argument("--samples", type=int, default=2048, help="Windows to compare")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Largest accepted difference from Keras in seconds (unquantized runtimes)")
+    parser.add_argument("--quantized-tolerance", type=float, default=30,
+                        help="Largest accepted difference from Keras in seconds (quantized runtime)")
+    args = parser.parse_args()
+
+    model_path, feature_scaler_path, target_scaler_path = resolve_bundle(args)
+    if args.command == "export":
+        for path in export_tflite(model_path, args.quantize):
+            print(f"✅ Exported {path} ({os.path.getsize(path) / 1024:.0f} KB)")
+        return
+
+    reports = check_parity(model_path, feature_scaler_path, target_scaler_path, args.data, args.history, args.samples)
+    failed = False
+    for runtime, report in reports.items():
+        if "error" in report:
+            print(f"⚠️ {runtime}: skipped ({report['error']})")
+            continue
+        if runtime == "keras":
+            print(f"📊 keras: {report['windows']} windows, {report['ms_per_batch']:.2f} ms per batch")
+            continue
+        tolerance = args.quantized_tolerance if runtime == "tflite_quantized" else args.tolerance
+        ok = report["max_abs_error_seconds"] <= tolerance
+        failed |= not ok
+        print(
+            f"{'✅' if ok else '❌'} {runtime}: max |Δ| {report['max_abs_error_seconds']:.4f}s "
+            f"(mean {report['mean_abs_error_seconds']:.4f}s, tolerance {tolerance}s), "
+            f"{report['ms_per_batch']:.2f} ms per batch, {report['size_kb']} KB"
+        )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Production server: several worker processes sharing one copy of the data.
+
+    python serve.py --workers 4 --host 0.0.0.0 --port 8000
+
+(`python main.py` is the single-process development server with auto-reload.)
+
+- The traffic history is converted to the columnar format here, once, before
+  the workers start. Every worker then memory-maps the same read-only files,
+  so the OS page cache holds one copy of the data however many workers run.
+- The workers share the response and weather caches through SQLite in
+  --state-dir (see shared.py), so a response computed by one worker is served
+  by all of them and OpenWeather is called once per refresh.
+- One worker, the leader, polls TomTom and runs scheduled retraining. The
+  others apply the rows it appends to the ingestion CSV. If the leader exits,
+  another worker takes over.
+- On SIGTERM/SIGINT workers stop accepting connections, let in-flight
+  requests finish (up to --graceful-timeout seconds; open forecast streams
+  are closed then), and stop their background services.
+
+Metrics on /metrics are per worker.
+"""
+import argparse
+import os
+
+import uvicorn
+
+from columnar import convert_csv, has_history
+from shared import DATABASE, SharedStore
+
+
+def prepare_history(data_path, history_path):
+    """Convert the CSV history once, so workers memory-map it instead of each parsing it"""
+    if has_history(history_path):
+        return
+    print(f"📊 Converting {data_path} to a columnar history in {history_path}...")
+    manifest = convert_csv([data_path], history_path)
+    rows = sum(partition["rows"] for partition in manifest["partitions"].values())
+    print(f"✅ Wrote {rows} rows for {len(manifest['partitions'])} locations")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the congestion API with several worker processes")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--state-dir", default=os.getenv("SHARED_STATE_DIR", "state"),
+                        help="Directory for the shared cache database and leader lock")
+    parser.add_argument("--data", default=os.getenv("DATA_PATH", "combined.csv"),
+                        help="The traffic dataset (CSV); converted if there is no history yet")
+    parser.add_argument("--history", default=os.getenv("HISTORY_PATH", "history"))
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="Seconds to let in-flight requests finish on shutdown")
+    args = parser.parse_args()
+    # Relative to where the command was run, not to the directory changed to below
+    data_path, history_path, state_dir = (os.path.abspath(path) for path in (args.data, args.history, args.state_dir))
+
+    # Workers import main from here and read their configuration from the environment
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    prepare_history(data_path, history_path)
+    os.makedirs(state_dir, exist_ok=True)
+    shared_store = SharedStore(os.path.join(state_dir, DATABASE))
+    shared_store.reset()
+    shared_store.close()
+    os.environ["DATA_PATH"] = data_path
+    os.environ["HISTORY_PATH"] = history_path
+    os.environ["SHARED_STATE_DIR"] = state_dir
+
+    print(f"🚀 Starting {args.workers} workers on {args.host}:{args.port}")
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level="info",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""State shared between the worker processes of one server (see serve.py).
+
+Each worker has its own event loop, model and memory-mapped history; what
+they share lives in one SQLite database (WAL mode, so readers never block):
+
+- `SharedResponseCache`: the response cache, with the same interface as
+  cache.ResponseCache. Values are stored encoded (e.g. as JSON).
+- `SharedWeather`: the latest weather payloads. Whichever worker refreshes
+  first fetches from OpenWeather; the others pick up its snapshot, so there
+  is one upstream call per refresh however many workers run.
+
+`LeaderLock` elects the one worker that runs singleton jobs (flow ingestion,
+retraining): it holds an exclusive lock on a file until it exits, and the
+lock is released by the OS even if the process dies.
+"""
+import json
+import os
+import sqlite3
+import time
+
+DATABASE = "state.sqlite3"
+LEADER_LOCK = "leader.lock"
+
+
+class SharedStore:
+    """One process's connection to the shared SQLite database"""
+
+    def __init__(self, path, busy_timeout_ms=2000):
+        self.path = path
+        # Used from the event loop thread only; autocommit, WAL for concurrent readers
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, prefix TEXT NOT NULL, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_prefix ON responses (prefix)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS weather ("
+            " version INTEGER PRIMARY KEY AUTOINCREMENT, fetched_at REAL NOT NULL,"
+            " current TEXT NOT NULL, forecast TEXT NOT NULL)"
+        )
+
+    def reset(self):
+        """Drop everything cached (on server start: entries may come from older code)"""
+        self.db.execute("DELETE FROM responses")
+        self.db.execute("DELETE FROM weather")
+
+    def close(self):
+        self.db.close()
+
+
+class SharedResponseCache:
+    """ResponseCache over the shared database; expiry is in wall-clock time.
+
+    Eviction is by expiry rather than LRU (recording every hit would turn each
+    read into a write).
+    """
+
+    def __init__(self, store, encode, decode, max_entries=1024, ttl=60):
+        self.store = store
+        self.encode = encode  # value -> str
+        self.decode = decode  # str -> value
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key, default=str)
+
+    def __len__(self):
+        return self.store.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        row = self.store.db.execute(
+            "SELECT value FROM responses WHERE key = ? AND expires_at > ?", (self._key(key), time.time())
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.decode(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self.store.db.execute(
+            "INSERT OR REPLACE INTO responses (key, prefix, expires_at, value) VALUES (?, ?, ?, ?)",
+            (self._key(key), str(key[0]), expires_at, self.encode(value)),
+        )
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._evict()
+
+    def _evict(self):
+        db = self.store.db
+        db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            db.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            )
+
+    def remaining_ttl(self, key):
+        """Seconds until the entry expires (0 if absent)"""
+        row = self.store.db.execute(
+            "SELECT expires_at FROM responses WHERE key = ?", (self._key(key),)
+        ).fetchone()
+        return max(row[0] - time.time(), 0) if row else 0
+
+    def invalidate(self, prefix):
+        """Drop every entry whose key starts with `prefix` (e.g. a bottleneck name)"""
+        self.store.db.execute("DELETE FROM responses WHERE prefix = ?", (str(prefix),))
+
+    def clear(self):
+        self.store.db.execute("DELETE FROM responses")
+
+
+class SharedWeather:
+    """The latest weather payloads, readable by every worker"""
+
+    def __init__(self, store, keep=10):
+        self.store = store
+        self.keep = keep
+
+    def load(self):
+        """(version, current, forecast, wall-clock fetch time) of the newest snapshot, or None"""
+        row = self.store.db.execute(
+            "SELECT version, current, forecast, fetched_at FROM weather ORDER BY version DESC LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        version, current, forecast, fetched_at = row
+        return version, json.loads(current), json.loads(forecast), fetched_at
+
+    def save(self, current, forecast):
+        """Store a freshly fetched snapshot; returns its version"""
+        db = self.store.db
+        version = db.execute(
+            "INSERT INTO weather (fetched_at, current, forecast) VALUES (?, ?, ?)",
+            (time.time(), json.dumps(current), json.dumps(forecast)),
+        ).lastrowid
+        db.execute("DELETE FROM weather WHERE version <= ?", (version - self.keep,))
+        return version
+
+
+class LeaderLock:
+    """Non-blocking exclusive lock on a file, held until release or exit"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """Take the lock if it is free; True if this process holds it"""
+        import fcntl
+
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            import fcntl
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
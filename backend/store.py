@@ -0,0 +1,333 @@
+"""Indexed in-memory store for the traffic history.
+
+Rows are grouped by `collection_location` at load time. Each location keeps its
+rows sorted by timestamp in contiguous NumPy arrays (one per column), with
+spare capacity so new observations append in amortised O(1). On top of that:
+
+- latest N readings for a location: a slice off the end, O(N)
+- readings in a time range: binary search on the timestamp array, O(log n)
+
+Categorical columns (pandas `category` dtype) are held as integer codes plus a
+category list. The rows a series is created with may be read-only memory maps
+(see columnar.py) and are never written: appended rows go to separate private
+arrays, which lookups read too. Processes mapping the same history then share
+one copy of it however many rows each appends.
+
+`drop_before` forgets a location's oldest rows (see retention.py). Loaded
+rows are dropped by slicing; appended rows kept are moved to the front of
+their arrays, so a series trimmed as fast as it grows stays at the same
+capacity.
+"""
+import numpy as np
+import pandas as pd
+
+TIMESTAMP = "timestamp"
+LOCATION = "collection_location"
+
+
+class LocationSeries:
+    """Time-sorted observations for one location.
+
+    The rows loaded with the series (`_base`) are never written, so they can
+    stay read-only memory maps; rows appended later go to private arrays with
+    spare capacity (`_tail`). Positions count across both, oldest first.
+    """
+
+    __slots__ = ("location", "columns", "_base", "_tail", "_tail_size", "categories", "version",
+                 "dropped", "dropped_before")
+
+    def __init__(self, location, columns, categories=None):
+        self.location = location
+        self.columns = list(columns)
+        self._base = {name: np.asarray(values) for name, values in columns.items()}
+        self._tail = {name: np.empty(0, dtype=values.dtype) for name, values in self._base.items()}
+        self._tail_size = 0
+        # name -> list of category values, for columns stored as codes
+        self.categories = {name: list(values) for name, values in (categories or {}).items()}
+        # Bumped on every change so caches can tell when this location has new data
+        self.version = 0
+        # Rows forgotten by drop_before, and the timestamp they were all older than
+        self.dropped = 0
+        self.dropped_before = None
+
+    @classmethod
+    def from_frame(cls, location, frame):
+        frame = frame.sort_values(TIMESTAMP, kind="stable")
+        columns = {}
+        categories = {}
+        for name in frame.columns:
+            if isinstance(frame[name].dtype, pd.CategoricalDtype):
+                columns[name] = frame[name].cat.codes.to_numpy().astype(np.int16)
+                categories[name] = list(frame[name].cat.categories)
+            else:
+                columns[name] = frame[name].to_numpy()
+        return cls(location, columns, categories)
+
+    @property
+    def _base_size(self):
+        return len(self._base[TIMESTAMP])
+
+    @property
+    def size(self):
+        return self._base_size + self._tail_size
+
+    @property
+    def capacity(self):
+        """Rows the series holds without growing"""
+        return self._base_size + len(self._tail[TIMESTAMP])
+
+    def column(self, name, start=0):
+        """One column's rows from position `start` on, oldest first.
+
+        A view unless the rows span both loaded and appended ones.
+        """
+        base = self._base[name]
+        tail = self._tail[name][:self._tail_size]
+        if start >= len(base):
+            return tail[start - len(base):]
+        if not self._tail_size:
+            return base[start:]
+        return np.concatenate([base[start:], tail])
+
+    @property
+    def timestamps(self):
+        return self.column(TIMESTAMP)
+
+    def first_timestamp(self):
+        return self._take(TIMESTAMP, np.array([0]))[0] if self.size else None
+
+    def last_timestamp(self):
+        return self._take(TIMESTAMP, np.array([self.size - 1]))[0] if self.size else None
+
+    def search(self, timestamp, side="left"):
+        """np.searchsorted of a datetime64 over the timestamps, without joining the two parts"""
+        base = self._base[TIMESTAMP]
+        position = int(np.searchsorted(base, timestamp, side=side))
+        if position < len(base):
+            return position
+        return len(base) + int(np.searchsorted(self._tail[TIMESTAMP][:self._tail_size], timestamp, side=side))
+
+    def _take(self, name, positions):
+        positions = np.asarray(positions, dtype=np.intp)
+        base = self._base[name]
+        if not self._tail_size:
+            return base[positions]
+        in_base = positions < len(base)
+        values = np.empty(len(positions), dtype=base.dtype)
+        values[in_base] = base[positions[in_base]]
+        values[~in_base] = self._tail[name][positions[~in_base] - len(base)]
+        return values
+
+    def _grow(self, min_capacity):
+        capacity = max(min_capacity, len(self._tail[TIMESTAMP]) * 2, 16)
+        for name, values in self._tail.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self._tail_size] = values[:self._tail_size]
+            self._tail[name] = grown
+
+    def _unload_base(self):
+        """Move the loaded rows into the private arrays (for a late row that belongs among them)"""
+        base_size, size = self._base_size, self.size
+        capacity = max(size * 2, 16)
+        for name, values in self._base.items():
+            merged = np.empty(capacity, dtype=values.dtype)
+            merged[:base_size] = values
+            merged[base_size:size] = self._tail[name][:self._tail_size]
+            self._tail[name] = merged
+            self._base[name] = np.empty(0, dtype=values.dtype)
+        self._tail_size += base_size
+
+    def append(self, row):
+        """Add one observation, keeping rows sorted by timestamp"""
+        timestamp = np.datetime64(pd.Timestamp(row[TIMESTAMP]), "ns")
+        # Observations normally arrive in order; late ones are inserted in place
+        position = self.size
+        if self.size and timestamp < self.last_timestamp():
+            position = self.search(timestamp, side="right")
+            if position < self._base_size:
+                # Rare: only rows older than the newest loaded one need the loaded rows copied
+                self._unload_base()
+        position -= self._base_size
+        if self._tail_size == len(self._tail[TIMESTAMP]):
+            self._grow(self._tail_size + 1)
+
+        for name, values in self._tail.items():
+            value = timestamp if name == TIMESTAMP else row.get(name)
+            if name in self.categories:
+                value = self._category_code(name, value)
+            elif value is None and values.dtype.kind == "f":
+                value = np.nan
+            if position < self._tail_size:
+                values[position + 1:self._tail_size + 1] = values[position:self._tail_size]
+            values[position] = value
+        self._tail_size += 1
+        self.version += 1
+
+    def drop_before(self, timestamp):
+        """Forget the rows older than `timestamp`; returns how many were dropped"""
+        timestamp = np.datetime64(pd.Timestamp(timestamp), "ns")
+        count = self.search(timestamp, side="left")
+        if self.dropped_before is None or timestamp > self.dropped_before:
+            self.dropped_before = timestamp
+        if not count:
+            return 0
+
+        from_base = min(count, self._base_size)
+        if from_base == self._base_size:
+            # Release the loaded rows (and their memory maps) altogether
+            self._base = {name: np.empty(0, dtype=values.dtype) for name, values in self._base.items()}
+        elif from_base:
+            self._base = {name: values[from_base:] for name, values in self._base.items()}
+        from_tail = count - from_base
+        if from_tail:
+            # Move the kept rows to the front; the freed capacity takes new rows
+            keep = self._tail_size - from_tail
+            for values in self._tail.values():
+                values[:keep] = values[from_tail:self._tail_size]
+            self._tail_size = keep
+        self.dropped += count
+        self.version += 1
+        return count
+
+    def _category_code(self, name, value):
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return -1
+        categories = self.categories[name]
+        if value not in categories:
+            categories.append(value)
+        return categories.index(value)
+
+    def frame(self, positions):
+        """DataFrame of the given row positions, in the given order"""
+        data = {}
+        for name in self.columns:
+            values = self._take(name, positions)
+            if name in self.categories:
+                values = pd.Categorical.from_codes(values, categories=self.categories[name])
+            data[name] = values
+        return pd.DataFrame(data, columns=self.columns)
+
+    def latest(self, n):
+        """The n most recent rows, newest first"""
+        start = max(self.size - n, 0)
+        return self.frame(np.arange(self.size - 1, start - 1, -1))
+
+    def latest_columns(self, n, names):
+        """{name: array} of the n most recent rows, oldest first, without building a DataFrame.
+
+        Arrays are views where the rows allow (see `column`); categorical
+        columns are returned as codes.
+        """
+        start = max(self.size - n, 0)
+        return {name: self.column(name, start) for name in names}
+
+    def between(self, start, end):
+        """Rows with start <= timestamp < end, oldest first"""
+        lo = self.search(np.datetime64(pd.Timestamp(start), "ns"), side="left")
+        hi = self.search(np.datetime64(pd.Timestamp(end), "ns"), side="left")
+        return self.frame(np.arange(lo, hi))
+
+
+class TrafficStore:
+    """Traffic observations indexed by location"""
+
+    def __init__(self, series=None):
+        self.series = series or {}
+        # Bumped on every change so caches can tell when data is new
+        self.version = 0
+        # CSV path -> byte offset its rows were read up to, set by the loader
+        self.offsets = {}
+
+    @classmethod
+    def from_frame(cls, frame):
+        frame = frame.copy()
+        frame[TIMESTAMP] = pd.to_datetime(frame[TIMESTAMP])
+        series = {
+            location: LocationSeries.from_frame(location, group)
+            for location, group in frame.groupby(LOCATION, sort=False, observed=True)
+        }
+        return cls(series)
+
+    def __len__(self):
+        return sum(series.size for series in self.series.values())
+
+    def __contains__(self, location):
+        return location in self.series
+
+    @property
+    def locations(self):
+        return list(self.series)
+
+    def location_version(self, location):
+        series = self.series.get(location)
+        return series.version if series is not None else 0
+
+    def latest_timestamp(self, location):
+        """Timestamp of the newest observation for a location (datetime64), or None"""
+        series = self.series.get(location)
+        if series is None or not series.size:
+            return None
+        return series.last_timestamp()
+
+    def location_stamp(self, location):
+        """(rows ever held, newest timestamp in ns) for a location.
+
+        Unlike `location_version`, equal in every process that holds the same
+        data, so it can key caches shared between processes. Dropped rows are
+        counted, so the stamp still changes when retention keeps the size flat.
+        """
+        latest = self.latest_timestamp(location)
+        if latest is None:
+            return (0, 0)
+        series = self.series[location]
+        return (series.size + series.dropped, int(latest.astype("datetime64[ns]").astype(np.int64)))
+
+    def latest(self, location, n):
+        """The n most recent rows for a location, newest first"""
+        series = self.series.get(location)
+        if series is None:
+            return pd.DataFrame()
+        return series.latest(n)
+
+    def latest_columns(self, location, n, names):
+        """The n most recent values of some columns for a location, oldest first"""
+        series = self.series.get(location)
+        if series is None:
+            return {name: np.empty(0) for name in names}
+        return series.latest_columns(n, names)
+
+    def between(self, location, start, end):
+        series = self.series.get(location)
+        if series is None:
+            return pd.DataFrame()
+        return series.between(start, end)
+
+    def drop_before(self, location, timestamp):
+        """Forget a location's rows older than `timestamp`; returns how many were dropped"""
+        series = self.series.get(location)
+        if series is None:
+            return 0
+        dropped = series.drop_before(timestamp)
+        if dropped:
+            self.version += 1
+        return dropped
+
+    def append(self, row):
+        """Add one observation (a dict keyed by column name)"""
+        location = row[LOCATION]
+        series = self.series.get(location)
+        if series is None:
+            # New location: same columns and dtypes as the existing ones
+            if self.series:
+                template = next(iter(self.series.values()))
+                empty = {name: template.column(name)[:0].copy() for name in template.columns}
+                categories = {name: [] for name in template.categories}
+            else:
+                empty = {
+                    name: np.empty(0, dtype="datetime64[ns]" if name == TIMESTAMP else object)
+                    for name in row
+                }
+                categories = {}
+            series = self.series[location] = LocationSeries(location, empty, categories)
+        series.append(row)
+        self.version += 1
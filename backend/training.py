@@ -0,0 +1,185 @@
+"""Fine-tune the LSTM on new traffic data and publish it as a new model version.
+
+Runs as its own process so training never competes with request handling:
+
+    python training.py --registry models
+
+1. Load the history (columnar if converted, else the CSV) and build windows
+   with features.py, exactly as serving does.
+2. Hold out the most recent `--holdout` fraction of windows, by time.
+3. Fine-tune the currently served bundle on the windows newer than the data
+   it was trained on. Scalers are kept, so inputs mean the same as before.
+4. Publish the candidate only if its holdout MAE is no worse than the
+   current model's (within `--tolerance`), along with its TFLite exports.
+   It then becomes CURRENT, and the serving process hot-swaps it.
+
+Exit status: 0 published, 2 nothing to do or rejected, 1 error.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from columnar import INGESTED, has_history, load_history, read_complete_rows, read_traffic_csv
+from features import FEATURES, TARGET, TIMESTAMP, WINDOW_SIZE, training_windows
+from inference import import_keras_loader
+from registry import ModelRegistry, new_version
+from runtimes import export_tflite, runtime_path
+from store import TrafficStore
+
+PUBLISHED, SKIPPED = 0, 2
+
+
+def load_store(data_path, history_path, ingested_path=None):
+    ingested = [ingested_path] if ingested_path and os.path.exists(ingested_path) else []
+    if history_path and has_history(history_path):
+        return load_history(history_path, csv_paths=ingested)
+    frames = [read_traffic_csv(data_path)]
+    # Complete rows only: the server may be appending to the file
+    frames += [read_complete_rows(path)[0] for path in ingested if os.path.abspath(path) != os.path.abspath(data_path)]
+    return TrafficStore.from_frame(pd.concat(frames, ignore_index=True))
+
+
+def build_dataset(store):
+    """Windows, targets and target timestamps across every location"""
+    X, y, times = [], [], []
+    for series in store.series.values():
+        columns = series.latest_columns(series.size, FEATURES + [TARGET, TIMESTAMP])
+        windows, targets, positions = training_windows(columns)
+        X.append(windows)
+        y.append(targets)
+        times.append(columns[TIMESTAMP][positions])
+    if not X:
+        return np.empty((0, WINDOW_SIZE, len(FEATURES)), dtype=np.float32), np.empty(0), np.empty(0, "datetime64[ns]")
+    return np.concatenate(X), np.concatenate(y), np.concatenate(times).astype("datetime64[ns]")
+
+
+def scale_windows(feature_scaler, windows):
+    batch_size, steps, n_features = windows.shape
+    flat = pd.DataFrame(windows.reshape(-1, n_features), columns=FEATURES)
+    return feature_scaler.transform(flat).reshape(batch_size, steps, n_features).astype(np.float32)
+
+
+def holdout_mae(model, feature_scaler, target_scaler, X, y):
+    """Mean absolute error in seconds of travel time"""
+    predictions = model.predict(scale_windows(feature_scaler, X), verbose=0).reshape(-1, 1)
+    return float(np.mean(np.abs(target_scaler.inverse_transform(predictions).ravel() - y)))
+
+
+def fine_tune(registry, store, epochs=3, holdout=0.2, min_windows=32, tolerance=0.0,
+              learning_rate=1e-4, batch_size=32):
+    """Train a candidate from the current bundle; returns (status, version or reason)"""
+    from tensorflow import keras
+
+    parent = registry.current()
+    if parent is None:
+        return SKIPPED, "registry has no current model"
+    parent_metadata = registry.metadata(parent)
+    paths = registry.paths(parent)
+
+    X, y, times = build_dataset(store)
+    if not len(X):
+        return SKIPPED, "no training windows"
+    order = np.argsort(times, kind="stable")
+    X, y, times = X[order], y[order], times[order]
+
+    # The newest windows are the holdout; train on what the parent hasn't seen
+    cutoff = times[int(len(times) * (1 - holdout))]
+    trained_until = parent_metadata.get("data_until")
+    train = times < cutoff
+    if trained_until:
+        train &= times > np.datetime64(trained_until)
+    test = times >= cutoff
+    if train.sum() < min_windows:
+        return SKIPPED, f"only {int(train.sum())} new training windows (need {min_windows})"
+
+    load_model = import_keras_loader()
+    model = load_model(paths["model"])
+    feature_scaler = joblib.load(paths["feature_scaler"])
+    target_scaler = joblib.load(paths["target_scaler"])
+
+    parent_mae = holdout_mae(model, feature_scaler, target_scaler, X[test], y[test])
+    print(f"📊 {parent} holdout MAE: {parent_mae:.1f}s on {int(test.sum())} windows")
+
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=learning_rate), loss="mse")
+    model.fit(
+        scale_windows(feature_scaler, X[train]),
+        target_scaler.transform(y[train].reshape(-1, 1)).astype(np.float32),
+        epochs=epochs, batch_size=batch_size, shuffle=True, verbose=0,
+    )
+    candidate_mae = holdout_mae(model, feature_scaler, target_scaler, X[test], y[test])
+    print(f"📊 Candidate holdout MAE: {candidate_mae:.1f}s after {epochs} epochs on {int(train.sum())} windows")
+
+    if candidate_mae > parent_mae * (1 + tolerance):
+        return SKIPPED, f"candidate MAE {candidate_mae:.1f}s is worse than {parent_mae:.1f}s"
+
+    version = new_version()
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, "model.keras")
+        model.save(model_path)
+        files = {"model": model_path, "feature_scaler": paths["feature_scaler"], "target_scaler": paths["target_scaler"]}
+        # Ship the TFLite exports too, so the bundle can be served on any runtime
+        try:
+            export_tflite(model_path, quantize=True)
+            files["tflite"] = runtime_path(model_path, "tflite")
+            files["tflite_quantized"] = runtime_path(model_path, "tflite_quantized")
+        except Exception as e:
+            print(f"⚠️ TFLite export failed, publishing without it: {e}")
+        registry.publish(
+            version,
+            files,
+            {
+                "parent": parent,
+                "data_until": str(times[train].max()),
+                "train_windows": int(train.sum()),
+                "holdout_windows": int(test.sum()),
+                "holdout_mae_seconds": round(candidate_mae, 2),
+                "parent_holdout_mae_seconds": round(parent_mae, 2),
+                "epochs": epochs,
+            },
+        )
+    registry.set_current(version)
+    return PUBLISHED, version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the congestion model and publish a new version")
+    parser.add_argument("--registry", default=os.getenv("MODEL_REGISTRY", "models"))
+    parser.add_argument("--data", default="combined.csv", help="Traffic CSV (used if there is no columnar history)")
+    parser.add_argument("--history", default=os.getenv("HISTORY_PATH", "history"))
+    parser.add_argument("--ingested", help="CSV of ingested observations (default: ingested.csv in --history)")
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of the newest windows held out")
+    parser.add_argument("--min-windows", type=int, default=32, help="Skip training with fewer new windows")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Accepted relative MAE regression")
+    parser.add_argument("--learning-rate", type=float, default=1e-4)
+    # The bundle the registry starts from if it is empty
+    parser.add_argument("--baseline-model", default="lstm_model.keras")
+    parser.add_argument("--baseline-feature-scaler", default="feature_scaler.pkl")
+    parser.add_argument("--baseline-target-scaler", default="target_scaler.pkl")
+    args = parser.parse_args()
+
+    try:
+        registry = ModelRegistry(args.registry)
+        registry.ensure_baseline(args.baseline_model, args.baseline_feature_scaler, args.baseline_target_scaler)
+        status, detail = fine_tune(
+            registry, load_store(args.data, args.history, args.ingested or os.path.join(args.history, INGESTED)), epochs=args.epochs, holdout=args.holdout,
+            min_windows=args.min_windows, tolerance=args.tolerance, learning_rate=args.learning_rate,
+        )
+    except Exception as e:
+        print(f"❌ Training failed: {e}")
+        sys.exit(1)
+
+    if status == PUBLISHED:
+        print(f"✅ Published model version {detail}")
+    else:
+        print(f"⚠️ No new model: {detail}")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Resilient calls to upstream APIs (OpenWeather, TomTom).
+
+`Upstream` wraps every call to one upstream service with:
+
+- A deadline: the whole call, retries included, has a time budget. Attempts
+  still running when it is spent are cancelled, so a slow upstream costs the
+  caller at most the budget instead of one timeout per attempt.
+- Hedged retries: if an attempt has not answered after `hedge_after`
+  seconds, a second one is started alongside it and the first to succeed
+  wins; a failed attempt is retried after a jittered exponential backoff.
+- A circuit breaker: after `failure_threshold` failed calls in a row the
+  circuit opens and calls fail at once with `CircuitOpenError`. After
+  `reset_timeout` seconds one trial call is let through; its success closes
+  the circuit, its failure opens it again.
+
+Callers handle the errors as before (serve cached data, skip a poll) - they
+just get them sooner.
+"""
+import asyncio
+import random
+import time
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """No attempt succeeded within the call's time budget"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        """Whether a call may go ahead now; the first after the reset timeout is the trial"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            return True
+        # Open, or half open with the trial call still running
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = self.clock()
+
+    def release_trial(self):
+        """Give back a half-open trial that ended without an answer (the call was cancelled)"""
+        if self.state == self.HALF_OPEN:
+            # Still open, and due for another trial right away
+            self.state = self.OPEN
+
+    def retry_in(self):
+        """Seconds until an open circuit lets a trial call through (0 otherwise)"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self.reset_timeout - (self.clock() - self.opened_at), 0.0)
+
+
+class Upstream:
+    """Deadline, hedged retries and a circuit breaker around calls to one upstream"""
+
+    def __init__(self, name, deadline=5.0, max_attempts=2, hedge_after=None, backoff=0.25,
+                 failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.hedge_after = hedge_after  # None: only retry after a failure
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.last_error = None
+        self.on_outcome = None  # called with each call's outcome: "ok", "error" or "rejected"
+
+    def _outcome(self, outcome):
+        if self.on_outcome is not None:
+            self.on_outcome(outcome)
+
+    def _retry_delay(self, attempt):
+        # Exponential backoff with jitter, so callers that failed together don't retry together
+        return self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+    async def call(self, fn, *args, deadline=None):
+        """Await `fn(*args)` within the deadline (seconds), retrying, hedging and tripping the breaker"""
+        if not self.breaker.allow():
+            self._outcome("rejected")
+            raise CircuitOpenError(
+                f"{self.name} is unavailable; retrying in {self.breaker.retry_in():.1f}s"
+                f" (last error: {self.last_error})"
+            )
+
+        loop = asyncio.get_running_loop()
+        budget = self.deadline if deadline is None else deadline
+        give_up_at = loop.time() + budget
+        attempts = 0
+        next_attempt_at = loop.time()
+        pending = set()
+        error = None
+        try:
+            while True:
+                now = loop.time()
+                if now >= give_up_at:
+                    break
+                if attempts < self.max_attempts and now >= next_attempt_at:
+                    pending.add(asyncio.ensure_future(fn(*args)))
+                    attempts += 1
+                    next_attempt_at = now + self.hedge_after if self.hedge_after is not None else float("inf")
+                if not pending and attempts >= self.max_attempts:
+                    break
+
+                wait = give_up_at - now
+                if attempts < self.max_attempts:
+                    wait = min(wait, max(next_attempt_at - now, 0))
+                if not pending:
+                    # Backing off before the next retry
+                    await asyncio.sleep(wait)
+                    continue
+                done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        error = RuntimeError(f"{self.name} attempt was cancelled")
+                    elif task.exception() is None:
+                        self.breaker.record_success()
+                        self.last_error = None
+                        self._outcome("ok")
+                        return task.result()
+                    else:
+                        error = task.exception()
+                    if attempts < self.max_attempts:
+                        next_attempt_at = min(next_attempt_at, loop.time() + self._retry_delay(attempts))
+        except BaseException:
+            # Cancelled from outside (client gone, outer timeout): no verdict on the upstream,
+            # but a trial call must not keep the circuit half open forever
+            self.breaker.release_trial()
+            raise
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if error is None or pending:
+            error = DeadlineExceeded(f"{self.name} did not answer within {budget:g}s")
+        self.last_error = error
+        self.breaker.record_failure()
+        self._outcome("error")
+        raise error
+
+    def status(self):
+        """Circuit state for health checks"""
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retry_in_seconds": round(self.breaker.retry_in(), 1),
+            "last_error": str(self.last_error) if self.last_error is not None else None,
+        }
@@ -0,0 +1,260 @@
+"""Weather data layer for the congestion API.
+
+Providers return the raw OpenWeather payloads (current conditions + forecast).
+`WeatherService` sits in front of a provider and adds a TTL cache with
+stale-while-revalidate, request coalescing and a background refresh loop, so
+request handlers never wait on OpenWeather once the cache is warm. OpenWeather
+calls go through an `upstream.Upstream` (deadline, hedged retries, circuit
+breaker), so an outage fails fast instead of holding every refresh for the
+full HTTP timeout.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from upstream import Upstream
+
+# Lagos city centre
+LAGOS_LAT, LAGOS_LON = 6.5244, 3.3792
+
+OPENWEATHER_BASE_URL = "https://api.openweathermap.org/data/2.5"
+
+
+class WeatherSnapshot:
+    """Raw weather payloads plus when they were fetched"""
+
+    def __init__(self, current, forecast, fetched_at, version):
+        self.current = current
+        self.forecast = forecast
+        self.fetched_at = fetched_at
+        self.version = version
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class OpenWeatherProvider:
+    """Fetch current weather and the 3-hourly forecast from OpenWeather"""
+
+    def __init__(self, api_key, lat=LAGOS_LAT, lon=LAGOS_LON, timeout=10.0, max_connections=10, upstream=None):
+        self.api_key = api_key
+        self.lat = lat
+        self.lon = lon
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.upstream = upstream or Upstream("openweather")
+        self._client = None
+
+    def _get_client(self):
+        # One pooled client per process; created lazily so it binds to the running loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=OPENWEATHER_BASE_URL,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def fetch(self):
+        return await self.upstream.call(self._fetch_once)
+
+    async def _fetch_once(self):
+        client = self._get_client()
+        params = {"lat": self.lat, "lon": self.lon, "appid": self.api_key, "units": "metric"}
+
+        # Current weather and forecast are independent - fetch them concurrently
+        current_response, forecast_response = await asyncio.gather(
+            client.get("/weather", params=params),
+            client.get("/forecast", params=params),
+        )
+        current_response.raise_for_status()
+        forecast_response.raise_for_status()
+        return current_response.json(), forecast_response.json()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class LocalWeatherProvider:
+    """Offline stand-in for OpenWeather, used for tests and local development.
+
+    Serves the given payloads, or a clear-sky Lagos default shaped like the
+    OpenWeather response. `calls` counts upstream fetches so callers can check
+    that caching and coalescing work.
+    """
+
+    def __init__(self, current=None, forecast=None, delay=0.0, error=None):
+        self.current = current
+        self.forecast = forecast
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def fetch(self):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+        current = self.current or {
+            "weather": [{"main": "Clear", "description": "clear sky"}],
+            "main": {"temp": 28.0, "humidity": 75},
+            "visibility": 10000,
+        }
+        forecast = self.forecast or _default_forecast()
+        return current, forecast
+
+    async def close(self):
+        pass
+
+
+def _default_forecast():
+    """24 hours of 3-hourly clear-sky entries starting at the current hour"""
+    start = datetime.now().replace(minute=0, second=0, microsecond=0)
+    entries = []
+    for i in range(8):
+        entry_time = start + timedelta(hours=3 * i)
+        entries.append({
+            "dt": int(entry_time.timestamp()),
+            "weather": [{"main": "Clear", "description": "clear sky"}],
+            "main": {"temp": 28.0, "humidity": 75},
+        })
+    return {"list": entries}
+
+
+class WeatherService:
+    """TTL cache with stale-while-revalidate and request coalescing.
+
+    - Fresh (age < ttl): served from cache.
+    - Stale (ttl <= age < stale_ttl): served from cache while one background
+      refresh runs.
+    - Missing or expired: callers wait on a single shared upstream fetch.
+
+    If a refresh fails, the last good snapshot keeps being served until it
+    reaches `stale_ttl`.
+
+    With `shared` (a shared.SharedWeather), snapshots fetched by other worker
+    processes are used before going upstream, and fetched ones are published
+    for them; versions then come from the shared store and agree across
+    workers.
+    """
+
+    def __init__(self, provider, ttl=600, stale_ttl=3600, refresh_interval=None, shared=None):
+        self.provider = provider
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_interval = refresh_interval or ttl * 0.8
+        self.snapshot = None
+        self.last_error = None
+        self.on_update = None  # called with each newly fetched snapshot
+        self.shared = shared
+        self._version = 0
+        self._inflight = None
+        self._refresher = None
+
+    async def get(self, timeout=None):
+        """The current snapshot; waits up to `timeout` seconds (None: no limit) if a fetch is needed.
+
+        A timed-out wait raises asyncio.TimeoutError; the fetch carries on for later callers.
+        """
+        snapshot = self.snapshot
+        if self.shared is not None and (snapshot is None or snapshot.age() >= self.ttl):
+            snapshot = self._adopt_shared(self.ttl) or snapshot
+        if snapshot is not None:
+            age = snapshot.age()
+            if age < self.ttl:
+                return snapshot
+            if age < self.stale_ttl:
+                self._refresh_in_background()
+                return snapshot
+        if timeout is None:
+            return await self.refresh()
+        return await asyncio.wait_for(self.refresh(), timeout)
+
+    async def refresh(self):
+        """Fetch from the provider; concurrent callers share one fetch"""
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._fetch())
+        # shield() so a cancelled request doesn't cancel the fetch other callers await
+        return await asyncio.shield(self._inflight)
+
+    def _set_snapshot(self, snapshot):
+        self.snapshot = snapshot
+        self.last_error = None
+        if self.on_update is not None:
+            self.on_update(snapshot)
+        return snapshot
+
+    def _adopt_shared(self, max_age):
+        """Switch to another worker's snapshot if it is newer and younger than `max_age`"""
+        try:
+            shared = self.shared.load()
+        except Exception as e:
+            print(f"⚠️ Shared weather unavailable: {e}")
+            return None
+        if shared is None:
+            return None
+        version, current, forecast, fetched_at = shared
+        age = time.time() - fetched_at
+        if age >= max_age:
+            return None
+        if self.snapshot is not None and self.snapshot.version == version:
+            return self.snapshot
+        return self._set_snapshot(WeatherSnapshot(current, forecast, time.monotonic() - age, version))
+
+    async def _fetch(self):
+        try:
+            current, forecast = await self.provider.fetch()
+            if self.shared is not None:
+                version = self.shared.save(current, forecast)
+            else:
+                self._version += 1
+                version = self._version
+            return self._set_snapshot(WeatherSnapshot(current, forecast, time.monotonic(), version))
+        except Exception as e:
+            self.last_error = e
+            if self.snapshot is not None and self.snapshot.age() < self.stale_ttl:
+                print(f"⚠️ Weather refresh failed, serving cached data: {e}")
+                return self.snapshot
+            raise
+        finally:
+            self._inflight = None
+
+    def _refresh_in_background(self):
+        if self._inflight is None:
+            task = asyncio.ensure_future(self.refresh())
+            # Errors are recorded in last_error; don't let the task warn about them
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                # Another worker may have refreshed already
+                if self.shared is None or self._adopt_shared(self.refresh_interval) is None:
+                    await self.refresh()
+            except Exception as e:
+                print(f"⚠️ Background weather refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Start refreshing in the background so requests always hit a warm cache"""
+        if self._refresher is None:
+            self._refresher = asyncio.ensure_future(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+        await self.provider.close()
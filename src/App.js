@@ -128,6 +128,25 @@ function MainContent() {
     }
   };
 
+  // Keep the alert's forecast current: the backend pushes a new forecast
+  // whenever fresh traffic or weather data arrives for the bottleneck
+  const predictedBottleneck = trafficPrediction?.bottleneck_location;
+  useEffect(() => {
+    if (!predictedBottleneck) return;
+    const source = new EventSource(
+      `http://localhost:8000/forecast/stream?location=${encodeURIComponent(predictedBottleneck)}`
+    );
+    source.addEventListener("forecast", (event) => {
+      const forecast = JSON.parse(event.data);
+      setTrafficPrediction((prediction) =>
+        prediction && prediction.bottleneck_location === forecast.bottleneck_location
+          ? { ...prediction, hourly_forecast: forecast.hourly_forecast.slice(0, 3) }
+          : prediction
+      );
+    });
+    return () => source.close();
+  }, [predictedBottleneck]);
+
   // In your App.js, modify the trafficPrediction state effect
   useEffect(() => {
     if (trafficPrediction && trafficPrediction.status === "info") {